@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from track import Track
+from instrumentation import charges_models, timed_model
 from util import DictObj
 
 
@@ -10,6 +11,7 @@ class AlbumQuery(object):
     """
 
 
+    @charges_models
     def get_albums_for_library(self, library_id, _client):
         """Gets all of the albums for a particular library.
 
@@ -29,6 +31,19 @@ class AlbumQuery(object):
 
         return album_list
 
+    def iter_albums_for_library(self, library_id, _client):
+        """Like :meth:`get_albums_for_library`, but parses the response
+        incrementally and yields each album as soon as it is read.
+
+        :param library_id: The Harvest Media library identifer
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        method_uri = '/getalbums/{{service_token}}/' + library_id
+        for album_element in _client.iter_xml(method_uri, 'albums/album'):
+            yield Album._from_xml(album_element, _client=_client)
+
     def get_cover_url_for_album(self, album_id, _client, width=None, height=None):
         """Generates a URL that can be used to fetch the
         cover image for an album on Harvest Media
@@ -50,6 +65,16 @@ class AlbumQuery(object):
             asset_url = asset_url.replace('{height}', str(height))
         return asset_url
 
+    def get_albums_for_library_async(self, library_id, _client):
+        """Asynchronous version of :meth:`get_albums_for_library`.  Returns a result
+        handle whose ``get()`` returns the list of albums.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_albums_for_library, library_id, _client)
+
 
 class Album(DictObj):
     """ Represents a Harvest Media album asset
@@ -75,6 +100,7 @@ class Album(DictObj):
         return Track.query.get_tracks_for_album(self.id, self._client, get_full_detail)
 
     @classmethod
+    @timed_model
     def _from_xml(cls, xml_data, _client):
         """Internally-used classmethod to create an instance of :class:`Album` from
         the XML returned by Harvest Media. Converts all attributes 
@@ -89,13 +115,16 @@ class Album(DictObj):
         :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
 
         """
+        if getattr(_client, 'lazy_models', False):
+            return cls._from_xml_lazy(xml_data, _client)
+
         instance = cls(_client)
-        for attribute, value in xml_data.items():
-            setattr(instance, attribute, value)
+        instance._load_fields(xml_data)
         return instance
 
     def as_dict(self):
         """Returns the dictionary representation of this Track"""
+        self._materialize()
         return dict([(k, v) for k, v in self.__dict__.items()])
 
     def get_cover_url(self, width=None, height=None):
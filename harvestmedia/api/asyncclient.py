@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from .client import Client
+
+
+class AsyncClient(Client):
+
+    """A :class:`harvestmedia.api.client.Client` whose calls can be
+    dispatched without blocking the caller.
+
+    Every ``*_async`` method, here and on the query classes, hands the
+    call to :meth:`submit` and returns immediately with a result handle
+    (a :class:`multiprocessing.pool.AsyncResult`).  Call ``get()`` on the
+    handle to wait for the value, or re-raise the error::
+
+        pending = [Track.query.get_tracks_async(ids, client) for ids in batches]
+        tracks = [result.get() for result in pending]
+
+    Takes the same arguments as :class:`harvestmedia.api.client.Client`;
+    `max_workers` bounds the number of requests in flight at once.
+
+    """
+
+    def get_xml_async(self, method_uri):
+        """Asynchronous version of :meth:`get_xml`"""
+
+        return self.submit(self.get_xml, method_uri)
+
+    def post_xml_async(self, method_uri, xml_post_body):
+        """Asynchronous version of :meth:`post_xml`"""
+
+        return self.submit(self.post_xml, method_uri, xml_post_body)
+
+    def request_service_token_async(self):
+        """Asynchronous version of :meth:`request_service_token`"""
+
+        return self.submit(self.request_service_token)
+
+    def get_service_info_async(self):
+        """Asynchronous version of :meth:`get_service_info`"""
+
+        return self.submit(self.get_service_info)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger('harvestmedia')
+
+
+# seconds to keep responses from the catalog endpoints, which rarely change
+DEFAULT_TTLS = {
+    '/getlibraries': 3600,
+    '/getalbums': 3600,
+    '/getalbumtracks': 3600,
+    '/getcategories': 3600,
+}
+
+
+def hash_key(key):
+    return hashlib.sha1(key.encode('utf-8') if isinstance(key, unicode) else key).hexdigest()
+
+
+class MemoryCache(object):
+    """An in-process response cache that evicts the least recently
+    used entry once it holds `max_entries` responses.
+
+    :param max_entries: the maximum number of responses to keep
+
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            expires, content = entry
+            if expires <= time.time():
+                return None
+
+            # re-insert to mark it as the most recently used
+            self._entries[key] = entry
+            return content
+
+    def set(self, key, content, ttl):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, content)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCache(object):
+    """A response cache kept as one file per response in `directory`,
+    so it survives restarts and can be shared by processes on one host.
+    A file's modification time tracks when it was last read, and the
+    least recently used files are removed once there are more than
+    `max_entries`.
+
+    :param directory: where to keep the cached responses
+    :param max_entries: the maximum number of responses to keep
+
+    """
+
+    def __init__(self, directory, max_entries=10000):
+        self.directory = directory
+        self.max_entries = max_entries
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hash_key(key) + '.xml')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                expires = float(cache_file.readline())
+                if expires <= time.time():
+                    return None
+                content = cache_file.read()
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        return content
+
+    def set(self, key, content, ttl):
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as cache_file:
+            cache_file.write('%f\n' % (time.time() + ttl))
+            cache_file.write(content)
+
+        # rename is atomic, so readers never see a partial file
+        os.rename(temp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith('.xml')]
+        if len(paths) <= self.max_entries:
+            return
+
+        entries = []
+        for path in paths:
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        entries.sort()
+
+        for mtime, path in entries[:len(entries) - self.max_entries]:
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.xml'):
+                self._remove(os.path.join(self.directory, name))
+
+
+class SharedCache(object):
+    """Adapts a shared key/value store, such as a memcached or redis
+    client, as a response cache so every process and host can share
+    one set of responses.  The store must provide ``get(key)``,
+    ``set(key, value, time)`` and ``delete(key)``, and is responsible
+    for its own eviction.
+
+    Keys are hashed, so they are always safe to use with memcached.
+    :meth:`clear` bumps a generation number stored alongside the
+    responses rather than flushing the whole store.
+
+    :param store: the key/value store client
+    :param prefix: prepended to every key written to the store
+
+    """
+
+    def __init__(self, store, prefix='harvestmedia:'):
+        self.store = store
+        self.prefix = prefix
+
+    def _generation(self):
+        return self.store.get(self.prefix + 'generation') or 0
+
+    def _key(self, key):
+        return '%s%s:%s' % (self.prefix, self._generation(), hash_key(key))
+
+    def get(self, key):
+        return self.store.get(self._key(key))
+
+    def set(self, key, content, ttl):
+        self.store.set(self._key(key), content, ttl)
+
+    def delete(self, key):
+        self.store.delete(self._key(key))
+
+    def clear(self):
+        self.store.set(self.prefix + 'generation', self._generation() + 1, 0)
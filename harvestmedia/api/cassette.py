@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from urlparse import urlsplit
+
+import pytz
+
+from .exceptions import CassetteMiss
+from .transport import Httplib2Transport, MemoryResponse, Transport
+from .util import get_endpoint
+
+
+MAGIC = 'HMCASSETTE1\n'
+
+# status, request key length, POST body length, response body length
+RECORD_HEADER = struct.Struct('>HIII')
+
+# the placeholder recorded in place of the service token or API key
+REDACTED = '{{service_token}}'
+
+# the other path segments that are never recorded, by endpoint: the
+# member's credentials.  Requests differing only in these replay alike.
+REDACTED_SEGMENTS = {
+    '/authenticatemember': {3: '{{username}}', 4: '{{password}}'},
+    '/sendmemberpassword': {3: '{{username}}'},
+}
+
+# never recorded: the response is the service token itself.  Replay
+# answers it with a fresh token instead.
+TOKEN_ENDPOINT = '/getservicetoken'
+
+
+def redact_path(path, prefix='/HMP-WS.svc'):
+    """Returns the method URI for a request path, with the webservice
+    `prefix` stripped and the service token (or, for getservicetoken, the
+    API key) replaced by a placeholder, e.g. ``/getalbums/{{service_token}}/abc123``.
+    The segments of `REDACTED_SEGMENTS`, such as member passwords, are
+    replaced too.
+
+    """
+
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+
+    parts = path.split('/')
+    if len(parts) > 2:
+        parts[2] = REDACTED
+    for position, placeholder in REDACTED_SEGMENTS.get(get_endpoint(path), {}).items():
+        if position < len(parts):
+            parts[position] = placeholder
+    return '/'.join(parts)
+
+
+def _request_key(method, path, prefix):
+    return '%s %s' % (method, redact_path(path, prefix))
+
+
+def _is_token_request(key):
+    return get_endpoint(key.split(' ', 1)[1]) == TOKEN_ENDPOINT
+
+
+def _body_digest(body):
+    return hashlib.sha1(body or '').digest()
+
+
+def _split_url(url):
+    scheme, host, path, query, fragment = urlsplit(url)
+    if query:
+        path += '?' + query
+    return path
+
+
+class RecordingTransport(Transport):
+    """Passes requests through to another transport and appends every
+    request and response to a cassette file, for :class:`ReplayTransport`
+    to play back later.
+
+    A cassette is a short header followed by one record per request: a
+    fixed-size header holding the status and the lengths of the three
+    byte strings that follow, the request key (method and redacted
+    method URI), the POST body and the response body.
+
+    Service tokens, API keys and the credentials in member URIs are never
+    written, but POST bodies and member ids are recorded as sent, so
+    treat cassettes of member calls as sensitive.
+
+    :param path: the cassette file, appended to if it exists
+    :param transport: the transport to record, by default an \
+    :class:`harvestmedia.api.transport.Httplib2Transport`
+    :param prefix: the path of the webservice URL, stripped from the \
+    recorded method URIs
+
+    """
+
+    def __init__(self, path, transport=None, prefix='/HMP-WS.svc'):
+        if transport is None:
+            transport = Httplib2Transport(disable_ssl_certificate_validation=True)
+
+        self.path = path
+        self.transport = transport
+        self.prefix = prefix
+        self.records = 0
+
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._file.flush()
+
+    def request(self, url, method='GET', body=None, headers=None):
+        response, content = self.transport.request(url, method, body, headers)
+
+        path = _split_url(url)
+        key = _request_key(method, path, self.prefix)
+        if not _is_token_request(key):
+            self._write(key, body or '', response.status, str(content))
+
+        return response, content
+
+    def _write(self, key, body, status, content):
+        header = RECORD_HEADER.pack(status, len(key), len(body), len(content))
+        with self._lock:
+            self._file.write(header)
+            self._file.write(key)
+            self._file.write(body)
+            self._file.write(content)
+            self._file.flush()
+            self.records += 1
+
+    def close(self):
+        self.transport.close()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class ReplayTransport(Transport):
+    """Answers requests from a cassette written by a
+    :class:`RecordingTransport`, without any network access.
+
+    The cassette is memory-mapped and indexed once when it is opened.
+    Responses are returned as read-only ``buffer`` objects over the
+    mapping, which the XML parser reads in place, so replaying does not
+    copy response bodies.
+
+    A request is matched on its method, redacted method URI and POST
+    body.  When the same request was recorded several times, the
+    responses are played back in the order they were recorded and the
+    last one is repeated after that.  Requests for a service token are
+    answered with a fresh token that expires in `token_lifetime` seconds.
+
+    :param path: the cassette file
+    :param prefix: the path of the webservice URL, as given when recording
+    :param token_lifetime: seconds the replayed service token is valid for
+    :param timezone: the timezone the service reports token expiry in
+
+    """
+
+    def __init__(self, path, prefix='/HMP-WS.svc', token_lifetime=24 * 60 * 60,
+                    timezone='Australia/Sydney'):
+        self.path = path
+        self.prefix = prefix
+        self.token_lifetime = token_lifetime
+        self.timezone = timezone
+        self.requests = 0
+
+        self._lock = threading.Lock()
+        self._positions = {}
+
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC):
+            raise ValueError('not a cassette: %s' % path)
+
+        self._mmap = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a cassette: %s' % path)
+
+        self.index = self._build_index(size)
+
+    def _build_index(self, size):
+        index = {}
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= size:
+            status, key_length, body_length, content_length = \
+                RECORD_HEADER.unpack_from(self._mmap, offset)
+            offset += RECORD_HEADER.size
+
+            key = self._mmap[offset:offset + key_length]
+            offset += key_length
+            body = buffer(self._mmap, offset, body_length)
+            offset += body_length
+
+            if offset + content_length > size:
+                # truncated by an interrupted recording
+                break
+
+            index.setdefault((key, _body_digest(body)), []).append(
+                                    (status, offset, content_length))
+            offset += content_length
+
+        return index
+
+    def _token_response(self):
+        token = hashlib.md5(os.urandom(16)).hexdigest()
+        hm_now = datetime.datetime.now(pytz.timezone(self.timezone))
+        expiry = hm_now + datetime.timedelta(seconds=self.token_lifetime)
+        content = '<responseservicetoken><token value="%s" expiry="%s"/></responseservicetoken>' % \
+                            (token, expiry.strftime('%Y-%m-%dT%H:%M:%S'))
+        return MemoryResponse(200), content
+
+    def request(self, url, method='GET', body=None, headers=None):
+        key = _request_key(method, _split_url(url), self.prefix)
+
+        with self._lock:
+            self.requests += 1
+
+        if _is_token_request(key):
+            return self._token_response()
+
+        lookup = (key, _body_digest(body))
+        responses = self.index.get(lookup)
+        if not responses:
+            raise CassetteMiss('no recorded response for ' + key)
+
+        with self._lock:
+            position = self._positions.get(lookup, 0)
+            self._positions[lookup] = position + 1
+
+        status, offset, length = responses[min(position, len(responses) - 1)]
+        return MemoryResponse(status), buffer(self._mmap, offset, length)
+
+    def rewind(self):
+        """Plays every recorded sequence from the start again"""
+
+        with self._lock:
+            self._positions.clear()
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
@@ -1,14 +1,108 @@
 # -*- coding: utf-8 -*-
 import pdb
+import threading
+import time
+from instrumentation import charges_models, timed_model
 from util import DictObj
 import xml.etree.cElementTree as ET
 import exceptions
-import client
 import config
 
 
+class CategoryRegistry(object):
+    """Interns the :class:`Category` and :class:`Attribute` instances
+    built for one client, so that the thousands of tracks tagged
+    "Instrumentation > Keyboards > Piano" all share one set of nodes
+    instead of each building their own.
+
+    A node is keyed on its own attributes and on its (already interned)
+    children, because a track's ``<categories>`` block only lists the
+    attributes that apply to that track.  Interned nodes are shared, so
+    treat them as read-only.  They are built eagerly, even for a client
+    with ``lazy_models``, and are kept until :meth:`clear` is called.
+
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._names = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def clear(self):
+        self._nodes = {}
+        self._names = {}
+
+    def split_name(self, name_value):
+        """Returns the ``(value, name)`` of an attribute name such as
+        ``1 - Calm``, or ``(None, name)`` if it has no value"""
+
+        split = self._names.get(name_value)
+        if split is None:
+            if ' - ' in name_value:
+                split = tuple(name_value.split(' - '))
+            else:
+                split = (None, name_value)
+            split = self._names.setdefault(name_value, split)
+        return split
+
+    def _intern(self, key, build, children):
+        node = self._nodes.get(key)
+        if node is not None:
+            with self._lock:
+                self.hits += 1
+            return node
+
+        with self._lock:
+            self.misses += 1
+        node = build()
+        node.attributes = list(children)
+        # another thread may have built the same node in the meantime
+        return self._nodes.setdefault(key, node)
+
+    def _intern_children(self, xml_data, _client):
+        _attributes = xml_data.find('attributes')
+        if not _attributes:
+            return ()
+        return tuple(self.attribute(attribute_xml, _client) for attribute_xml in _attributes)
+
+    def attribute(self, xml_data, _client):
+        """Returns the shared :class:`Attribute` for an ``<attribute>`` element"""
+
+        children = self._intern_children(xml_data, _client)
+        attribute_id = xml_data.get('id')
+        name_value = xml_data.get('name')
+
+        def build():
+            instance = Attribute(_client)
+            instance.id = attribute_id
+            instance.value, instance.name = self.split_name(name_value)
+            return instance
+
+        return self._intern((Attribute, attribute_id, name_value, children), build, children)
+
+    def category(self, xml_data, _client):
+        """Returns the shared :class:`Category` for a ``<category>`` element"""
+
+        children = self._intern_children(xml_data, _client)
+        items = tuple(sorted(xml_data.items()))
+
+        def build():
+            instance = Category(_client)
+            for attribute, value in items:
+                setattr(instance, attribute, value)
+            return instance
+
+        return self._intern((Category, items, children), build, children)
+
+
 class CategoryQuery(object):
 
+    @charges_models
     def get_categories(self, _client):
         categories = []
 
@@ -22,6 +116,157 @@ class CategoryQuery(object):
 
         return categories
 
+    def get_categories_async(self, _client):
+        """Asynchronous version of :meth:`get_categories`.  Returns a result
+        handle whose ``get()`` returns the list of categories.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_categories, _client)
+
+    def get_category_tree(self, _client, refresh=False):
+        """Returns a :class:`CategoryTree` of all the categories.  The
+        tree is cached on the client for its `category_tree_ttl` seconds.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+        :param refresh: if True, fetches the categories again even if the \
+        cached tree has not expired
+
+        """
+
+        with _client._category_tree_lock:
+            cached = _client._category_tree
+            if not refresh and cached is not None and cached[1] > time.time():
+                return cached[0]
+
+            tree = CategoryTree(self.get_categories(_client))
+            _client._category_tree = (tree, time.time() + _client.category_tree_ttl)
+            return tree
+
+
+class CategoryTree(object):
+    """An index over the category hierarchy returned by
+    :meth:`CategoryQuery.get_categories`.  Categories and attributes are
+    both nodes, identified by id.  Lookups by id, path, parent, ancestors
+    and descendants are dictionary lookups, so asking whether an attribute
+    sits anywhere under a category never walks the tree::
+
+        tree = Category.query.get_category_tree(client)
+        piano = tree.find_by_path('Instrumentation > Keyboards > Piano')
+        tree.is_under(piano.id, tree.find_by_path('Instrumentation').id)
+
+    Paths are the node names from the category down, compared without
+    regard to case.  The nodes may be shared with tracks, so treat them
+    as read-only.
+
+    :param categories: a list of :class:`Category` instances
+
+    """
+
+    PATH_SEPARATOR = ' > '
+
+    def __init__(self, categories):
+        self.categories = categories
+
+        self._nodes = {}
+        self._parents = {}
+        self._paths = {}
+        self._by_path = {}
+        self._by_name = {}
+        self._ancestors = {}
+        self._descendants = {}
+
+        for category in categories:
+            self._add(category, None, ())
+
+    def _add(self, node, parent_id, parent_path):
+        path = parent_path + (node.name,)
+
+        self._nodes[node.id] = node
+        self._parents[node.id] = parent_id
+        self._paths[node.id] = path
+        self._by_path[self._path_key(path)] = node.id
+        self._by_name.setdefault((node.name or '').lower(), []).append(node.id)
+
+        if parent_id is None:
+            ancestors = frozenset()
+        else:
+            ancestors = self._ancestors[parent_id] | frozenset([parent_id])
+        self._ancestors[node.id] = ancestors
+
+        descendants = set()
+        for child in node.attributes:
+            descendants.add(child.id)
+            descendants.update(self._add(child, node.id, path))
+        self._descendants[node.id] = frozenset(descendants)
+
+        return self._descendants[node.id]
+
+    def _path_key(self, path):
+        if isinstance(path, basestring):
+            path = path.split(self.PATH_SEPARATOR.strip())
+        return tuple((name or '').strip().lower() for name in path)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node_id):
+        return node_id in self._nodes
+
+    def __iter__(self):
+        return iter(self._nodes.values())
+
+    def get(self, node_id):
+        """Returns the category or attribute with the id, or None"""
+
+        return self._nodes.get(node_id)
+
+    def get_parent(self, node_id):
+        """Returns the parent of a node, or None for a category"""
+
+        return self._nodes.get(self._parents.get(node_id))
+
+    def get_path(self, node_id):
+        """Returns the names from the category down to the node, as a
+        string such as ``Instrumentation > Keyboards > Piano``"""
+
+        path = self._paths.get(node_id)
+        if path is None:
+            return None
+        return self.PATH_SEPARATOR.join(path)
+
+    def find_by_path(self, path):
+        """Returns the node at `path`, or None
+
+        :param path: a string such as ``Instrumentation > Keyboards > Piano``, \
+        or a sequence of names
+
+        """
+
+        return self._nodes.get(self._by_path.get(self._path_key(path)))
+
+    def find_by_name(self, name):
+        """Returns every node called `name`, in tree order"""
+
+        return [self._nodes[node_id] for node_id in self._by_name.get(name.lower(), [])]
+
+    def get_ancestor_ids(self, node_id):
+        """Returns the frozenset of the ids above a node"""
+
+        return self._ancestors.get(node_id, frozenset())
+
+    def get_descendant_ids(self, node_id):
+        """Returns the frozenset of the ids anywhere below a node"""
+
+        return self._descendants.get(node_id, frozenset())
+
+    def is_under(self, node_id, ancestor_id):
+        """Returns True if `node_id` sits anywhere below `ancestor_id`"""
+
+        return ancestor_id in self._ancestors.get(node_id, ())
+
 
 class Attribute(DictObj):
     """ Represents a Harvest Media category attibute.
@@ -31,11 +276,14 @@ class Attribute(DictObj):
 
     """
 
+    _lazy_collections = {'attributes': '_build_attributes'}
+
     def __init__(self, _client):
         self.attributes = []
         self._client = _client
 
     @classmethod
+    @timed_model
     def _from_xml(cls, xml_data, _client):
         """Internally-used classmethod to recursively convert the Harvest Media XML tree to
         our Attribute object with :class:`Attribute` children.
@@ -53,23 +301,37 @@ class Attribute(DictObj):
 
         """
 
+        registry = getattr(_client, 'category_registry', None)
+        if registry is not None:
+            return registry.attribute(xml_data, _client)
+
+        if getattr(_client, 'lazy_models', False):
+            return cls._from_xml_lazy(xml_data, _client)
+
         instance = cls(_client)
-        instance.id = xml_data.get('id')
+        instance._load_fields(xml_data)
+        instance.attributes = instance._build_attributes(xml_data)
+        return instance
+
+    def _get_fields(self, xml_data):
         name_value = xml_data.get('name')
 
         if ' - ' in name_value:
-            instance.value, instance.name = name_value.split(' - ')
+            value, name = name_value.split(' - ')
         else:
-            instance.name = name_value
-            instance.value = None
+            value, name = None, name_value
 
+        return [('id', xml_data.get('id')), ('value', value), ('name', name)]
+
+    def _build_attributes(self, xml_data):
+        attributes = []
         _attributes = xml_data.find('attributes')
 
         if _attributes:
             for attribute_xml in _attributes:
-                instance.attributes.append(Attribute._from_xml(attribute_xml, _client))
+                attributes.append(Attribute._from_xml(attribute_xml, self._client))
 
-        return instance
+        return attributes
 
 
 class Category(DictObj):
@@ -82,11 +344,14 @@ class Category(DictObj):
 
     query = CategoryQuery()
 
+    _lazy_collections = {'attributes': '_build_attributes'}
+
     def __init__(self, _client):
         self._client = _client
         self.attributes = []
 
     @classmethod
+    @timed_model
     def _from_xml(cls, xml_data, _client):
         """Internally-used classmethod to convert the Harvest Media XML tree to our Category object with
         :class:`Attribute` children.
@@ -105,14 +370,24 @@ class Category(DictObj):
         :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
         """
 
+        registry = getattr(_client, 'category_registry', None)
+        if registry is not None:
+            return registry.category(xml_data, _client)
+
+        if getattr(_client, 'lazy_models', False):
+            return cls._from_xml_lazy(xml_data, _client)
+
         instance = cls(_client)
-        for attribute, value in xml_data.items():
-            setattr(instance, attribute, value)
+        instance._load_fields(xml_data)
+        instance.attributes = instance._build_attributes(xml_data)
+        return instance
 
+    def _build_attributes(self, xml_data):
+        attributes = []
         _attributes = xml_data.find('attributes')
 
         if _attributes:
             for attribute_xml in _attributes.getchildren():
-                instance.attributes.append(Attribute._from_xml(attribute_xml, _client))
+                attributes.append(Attribute._from_xml(attribute_xml, self._client))
 
-        return instance
+        return attributes
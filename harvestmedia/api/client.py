@@ -1,10 +1,23 @@
 # -*- coding: utf-8 -*-
+import contextlib
 import datetime
 import logging
+import httplib
 import httplib2
+import socket
+import threading
+import time
 import xml.etree.cElementTree as ET
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
 
+from .cache import DEFAULT_TTLS
+from .category import CategoryRegistry
 from .config import Config, ServiceToken
+from .instrumentation import RequestEvent
+from .store import get_store_key
+from .transport import Httplib2Transport
+from .util import SingleFlight, get_endpoint
 import exceptions
 
 
@@ -14,24 +27,133 @@ logger = logging.getLogger('harvestmedia')
 class Client(object):
 
     """This class handles all HTTP interaction with the Harvest
-    Media API.
+    Media API.  A single instance may be shared between threads.
 
     :param api_key: the Harvest Media API key to use
     :param debug_level: a Python logging debug level to use for the HM logger
     :param webservice_url: the base Harvest Media API URL
+    :param pool_size: the maximum number of idle keep-alive HTTP \
+    connections to hold on to between requests
+    :param pool_idle_timeout: seconds an idle connection is kept before \
+    it is closed
+    :param transport: the :class:`harvestmedia.api.transport.Transport` \
+    to send requests with.  Defaults to an \
+    :class:`harvestmedia.api.transport.Httplib2Transport` built from \
+    `pool_size`, `pool_idle_timeout` and `timeout`.
+    :param max_workers: the size of the worker thread pool used by \
+    :meth:`submit` and, by default, :meth:`map`
+    :param cache: an optional response cache for :meth:`get_xml`, e.g. \
+    :class:`harvestmedia.api.cache.MemoryCache`
+    :param cache_ttls: a dictionary of endpoint to seconds, e.g. \
+    ``{'/getalbums': 600}``, merged over \
+    :data:`harvestmedia.api.cache.DEFAULT_TTLS`.  Endpoints without a \
+    TTL are never cached.
+    :param timeout: seconds to wait on the socket before raising \
+    :class:`harvestmedia.api.exceptions.APITimeoutError`
+    :param retry_policy: an optional \
+    :class:`harvestmedia.api.resilience.RetryPolicy` for GET requests \
+    to endpoints that only read, such as /getalbums
+    :param circuit_breaker: an optional \
+    :class:`harvestmedia.api.resilience.CircuitBreaker`
+    :param token_refresh_margin: seconds before the service token \
+    expires at which a replacement is fetched in the background
+    :param store: an optional :class:`harvestmedia.api.store.FileStore` \
+    used to share the service token and service info between processes
+    :param lazy: if True, nothing is fetched on init.  The service token \
+    is requested with the first API call, and the service info the first \
+    time one of the asset URLs or track formats on `config` is read.
+    :param coalesce_requests: if True, identical GETs to read-only \
+    endpoints made while one is already in flight wait for it and share \
+    its parsed result.  Writes sent as GETs are never coalesced.
+    :param lazy_models: if True, models keep the XML they were built \
+    from and only convert attributes, categories and nested tracks when \
+    they are first read.  Cheaper for listings that read a few fields.
+    :param intern_categories: if True, categories and attributes are \
+    interned in a :class:`harvestmedia.api.category.CategoryRegistry` \
+    so that tracks share them.  Every track tagged with the same node \
+    gets the same instance, so changing one changes them all; treat \
+    them as read-only.  Interned nodes are built eagerly, whatever \
+    `lazy_models` says, and kept until `category_registry.clear()` is \
+    called.  Off by default.
+    :param category_tree_ttl: seconds the tree returned by \
+    :meth:`harvestmedia.api.category.CategoryQuery.get_category_tree` \
+    is cached for
+    :param hooks: a list of \
+    :class:`harvestmedia.api.instrumentation.RequestHook` objects told \
+    about every request, e.g. a \
+    :class:`harvestmedia.api.instrumentation.MetricsAggregator`
 
     """
 
+    # read-only endpoints, besides the /get ones, that are safe to retry
+    IDEMPOTENT_ENDPOINTS = frozenset(['/authenticatemember'])
+
     def __init__(self, api_key, debug_level='INFO',
-                    webservice_url='https://service.harvestmedia.net/HMP-WS.svc'):
+                    webservice_url='https://service.harvestmedia.net/HMP-WS.svc',
+                    pool_size=4, pool_idle_timeout=60, max_workers=8,
+                    cache=None, cache_ttls=None,
+                    timeout=None, retry_policy=None, circuit_breaker=None,
+                    token_refresh_margin=300, store=None, lazy=False,
+                    coalesce_requests=True, transport=None, hooks=None,
+                    lazy_models=False, intern_categories=False, category_tree_ttl=3600):
 
         self.api_key = api_key
         self.debug_level = debug_level
         self.webservice_url = webservice_url
+        if transport is None:
+            transport = Httplib2Transport(max_size=pool_size, idle_timeout=pool_idle_timeout,
+                                          disable_ssl_certificate_validation=True, timeout=timeout)
+        self.transport = transport
+
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+
+        self.max_workers = max_workers
+        self._workers = None
+        self._workers_lock = threading.Lock()
+        self._token_lock = threading.RLock()
+        self._token_refresh_pending = threading.Lock()
+        self._token_refresh_result = None
+        self.token_refresh_margin = token_refresh_margin
+
+        self.coalesce_requests = coalesce_requests
+        self._in_flight = SingleFlight()
+
+        self.lazy_models = lazy_models
+        self.category_registry = CategoryRegistry() if intern_categories else None
+        self.category_tree_ttl = category_tree_ttl
+        self._category_tree = None
+        self._category_tree_lock = threading.Lock()
+
+        self.hooks = list(hooks or [])
+        self._instrument_local = threading.local()
+
+        self.cache = cache
+        self.cache_ttls = dict(DEFAULT_TTLS)
+        if cache_ttls:
+            self.cache_ttls.update(cache_ttls)
+
+        self.store = store
+        self._store_key = get_store_key(api_key, webservice_url)
 
         self.config = Config(debug_level=debug_level, webservice_url=webservice_url)
-        self.request_service_token()
-        self.get_service_info()
+
+        if lazy:
+            self.config.service_info_loader = self._load_service_info
+        elif self.store is None:
+            self.request_service_token()
+            self.get_service_info()
+        else:
+            with self._token_lock, self.store.lock():
+                if not self._load_from_store():
+                    self.request_service_token()
+                    self.get_service_info()
+
+    @property
+    def pool(self):
+        """The connection pool of the default transport, if it has one"""
+
+        return getattr(self.transport, 'pool', None)
 
     @property
     def debug_level(self):
@@ -46,20 +168,115 @@ class Client(object):
         if '{{service_token}}' not in uri:
             return uri
 
+        if self.config.service_token is None:
+            self._refresh_service_token(None)
+
         try:
             service_token = self.config.service_token.token
         except exceptions.TokenExpired:
-            self.request_service_token()
+            self._refresh_service_token(self.config.service_token)
             service_token = self.config.service_token.token
+        else:
+            if self.token_refresh_margin and \
+                    self.config.service_token.expires_within(self.token_refresh_margin):
+                self._refresh_service_token_early()
 
         uri = uri.replace('{{service_token}}', service_token)
 
         return uri
 
+    def _refresh_service_token_early(self):
+        """Fetches a new service token on the worker pool while callers
+        keep using the current one.  Only one early refresh runs at a time;
+        everyone else carries on without waiting."""
+
+        if not self._token_refresh_pending.acquire(False):
+            return
+
+        expiring_token = self.config.service_token
+
+        def refresh():
+            try:
+                self._refresh_service_token(expiring_token)
+            except Exception, e:
+                logger.warning('unable to refresh the service token early: %s' % e)
+            finally:
+                self._token_refresh_pending.release()
+
+        self._token_refresh_result = self.submit(refresh)
+
+    def _replace_invalid_token(self, method_uri, service_token):
+        """Called when the API rejects `service_token`.  Fetches a new
+        token, unless another caller already has, and returns True if the
+        request is worth retrying."""
+
+        if '{{service_token}}' not in method_uri:
+            return False
+
+        logger.debug('service token rejected by the API, requesting a new one')
+        self._refresh_service_token(service_token)
+        return True
+
+    def _refresh_service_token(self, stale_token):
+        """Replaces `stale_token` unless another thread already has.  With
+        a store, a newer token saved by another process is adopted instead
+        of asking Harvest Media for one."""
+
+        with self._token_lock:
+            if self.config.service_token is not stale_token:
+                return
+
+            if self.store is None:
+                self.request_service_token()
+                return
+
+            with self.store.lock():
+                if not self._load_token_from_store(stale_token):
+                    self.request_service_token()
+
+    def _load_token_from_store(self, stale_token=None):
+        stored = self.store.load(self._store_key)
+        if not stored.get('token') or not stored.get('expiry'):
+            return False
+
+        if stale_token is not None and stored['token'] == stale_token._token:
+            return False
+
+        service_token = ServiceToken(self.config, stored['token'], stored['expiry'])
+        if service_token.expires_within(self.token_refresh_margin or 0):
+            return False
+
+        logger.debug('using the service token from %s' % self.store.path)
+        self.config.service_token = service_token
+        return True
+
+    def _load_service_info(self):
+        if self.store is None:
+            self.get_service_info()
+            return
+
+        # fetching the service info may refresh the service token, which
+        # takes the token lock and then the store lock, so take them in
+        # the same order here
+        with self._token_lock, self.store.lock():
+            service_info = self.store.load(self._store_key).get('service_info')
+            if service_info:
+                self.config.set_service_info(service_info)
+            else:
+                self.get_service_info()
+
+    def _load_from_store(self):
+        stored = self.store.load(self._store_key)
+        if not stored.get('service_info') or not self._load_token_from_store():
+            return False
+
+        self.config.set_service_info(stored['service_info'])
+        return True
+
     def _build_url(self, path):
         return self.config.webservice_url + self._add_service_token(path)
 
-    def _handle_response(self, response, content):
+    def _check_status(self, response, content):
         if response.status != 200:
             response_status = response.status
             logger.debug('HTTP: non 200 status received from server: ' + str(response_status))
@@ -69,6 +286,7 @@ class Client(object):
             exc.code = response.status
             raise exc
 
+    def _parse_response(self, content):
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug("server response: " + str(content))
 
@@ -80,33 +298,215 @@ class Client(object):
 
         error = root.find('error')
         if error is not None:
-            code = error.find('code')
-            if code is not None:
-                if code.text == '1':
-                    raise exceptions.CorruptInputData()
-                elif code.text == '2':
-                    description = error.find('description')
-                    if description is not None:
-                        reason = description.text
-                    else:
-                        reason = 'Incorrect Input Data'
-                    raise exceptions.IncorrectInputData(reason)
-                elif code.text == '5':
-                    now = datetime.datetime.utcnow()
-                    if self.config.service_token:
-                        token_expiration = self.config.service_token.expiry
-                        message = "invalid token received.  now: %s our expiration: %s" % \
-                                        (now.isoformat(), token_expiration)
-                    else:
-                        message = "no token set"
-                    raise exceptions.InvalidToken(message)
-                elif code.text == '6':
-                    raise exceptions.InvalidLoginDetails()
-                elif code.text == '7':
-                    raise exceptions.MemberDoesNotExist()
+            self._check_error(error)
 
         return root
 
+    def _check_error(self, error):
+        code = error.find('code')
+        if code is not None:
+            if code.text == '1':
+                raise exceptions.CorruptInputData()
+            elif code.text == '2':
+                description = error.find('description')
+                if description is not None:
+                    reason = description.text
+                else:
+                    reason = 'Incorrect Input Data'
+                raise exceptions.IncorrectInputData(reason)
+            elif code.text == '5':
+                now = datetime.datetime.utcnow()
+                if self.config.service_token:
+                    token_expiration = self.config.service_token.expiry
+                    message = "invalid token received.  now: %s our expiration: %s" % \
+                                    (now.isoformat(), token_expiration)
+                else:
+                    message = "no token set"
+                raise exceptions.InvalidToken(message)
+            elif code.text == '6':
+                raise exceptions.InvalidLoginDetails()
+            elif code.text == '7':
+                raise exceptions.MemberDoesNotExist()
+
+    def _iterparse(self, content, path):
+        """Incrementally parses `content`, yielding each element found at
+        `path` below the root as soon as its closing tag is read.  Once the
+        consumer moves on, the element is cleared and detached from its
+        parent so the tree never grows beyond a single element."""
+
+        path = path.split('/')
+        depth = len(path)
+        stack = []
+
+        try:
+            for event, element in ET.iterparse(StringIO(content), events=('start', 'end')):
+                if event == 'start':
+                    stack.append(element)
+                    continue
+
+                stack.pop()
+                if len(stack) == 1 and element.tag == 'error':
+                    self._check_error(element)
+                elif len(stack) == depth and [e.tag for e in stack[1:]] + [element.tag] == path:
+                    yield element
+                    if not self.lazy_models:
+                        # lazy models keep the element, so only detach it
+                        element.clear()
+                    stack[-1].remove(element)
+        except ET.ParseError, e:
+            raise exceptions.InvalidAPIResponse, \
+                            "Unable to read the XML from the API server: " + e.message
+
+    def _is_idempotent(self, method_uri):
+        """Returns True if the endpoint only reads.  Many writes, such as
+        /addplaylist, are GETs too, and sending one again after a timeout
+        could apply it twice."""
+
+        endpoint = get_endpoint(method_uri)
+        return endpoint.startswith('/get') or endpoint in self.IDEMPOTENT_ENDPOINTS
+
+    def _request(self, method_url, method='GET', body=None, headers=None, idempotent=False):
+        """Sends a request through the transport, applying the
+        circuit breaker and, for `idempotent` requests, the retry policy.
+        Returns the httplib2 ``(response, content)`` tuple of the final
+        attempt."""
+
+        retry_policy = self.retry_policy if idempotent else None
+        attempt = 0
+
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request()
+
+            try:
+                response, content = self.transport.request(method_url, method, body, headers)
+            except socket.timeout:
+                error = exceptions.APITimeoutError('timed out waiting for the API server: ' + method_url)
+            except (socket.error, httplib.HTTPException, httplib2.HttpLib2Error), e:
+                error = exceptions.InvalidAPIResponse('unable to reach the API server: ' + str(e))
+            except Exception:
+                # still a failed trial, or a half-open breaker never closes
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+                raise
+            else:
+                error = None
+
+            failed = error is not None or response.status >= 500
+            if self.circuit_breaker is not None:
+                if failed:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+
+            retryable = error is not None or (retry_policy is not None and \
+                                              response.status in retry_policy.retry_statuses)
+            if retry_policy is None or not retryable or attempt >= retry_policy.max_retries:
+                if error is not None:
+                    raise error
+                return response, content
+
+            logger.debug('retrying %s after attempt %s failed' % (method, attempt + 1))
+            retry_policy.sleep(attempt)
+            attempt += 1
+
+    @contextlib.contextmanager
+    def _instrument(self, method_uri, method):
+        """Wraps a single request to the API, yielding the
+        :class:`harvestmedia.api.instrumentation.RequestEvent` to fill in
+        and passing it to the hooks, or yielding None if there are none"""
+
+        if not self.hooks:
+            yield None
+            return
+
+        event = RequestEvent(get_endpoint(method_uri), method)
+        for hook in self.hooks:
+            hook.before_request(event)
+
+        # models built while streaming came from this response
+        previous_event = getattr(self._instrument_local, 'event', None)
+        self._instrument_local.event = event
+        try:
+            yield event
+        except Exception, e:
+            event.error = e.__class__.__name__
+            raise
+        finally:
+            self._instrument_local.event = previous_event
+            for hook in self.hooks:
+                hook.after_request(event)
+
+    def _charge_models_to(self, event):
+        """Has models built on this thread charged to `event`, until the
+        query decorated with
+        :func:`harvestmedia.api.instrumentation.charges_models` that made
+        the request returns.  Outside of one nothing would clear it."""
+
+        if getattr(self._instrument_local, 'depth', 0):
+            self._instrument_local.event = event
+
+    def _record_response(self, event, started, response, content):
+        event.wall_time = time.time() - started
+        event.status = response.status
+        event.ttfb = getattr(response, 'ttfb', None)
+        event.bytes = len(content)
+
+    def _timed_parse(self, event, content):
+        if event is None:
+            return self._parse_response(content)
+
+        started = time.time()
+        try:
+            return self._parse_response(content)
+        finally:
+            event.parse_time = time.time() - started
+
+    def _get_content(self, method_uri, event=None):
+        """Performs an HTTP GET, or reads the response cache, and returns
+        the raw body along with the TTL it should be cached for once it is
+        known to be valid (None when it came from the cache or is not
+        cacheable)"""
+
+        cache_ttl = self._get_cache_ttl(method_uri)
+        if cache_ttl:
+            content = self.cache.get(self._cache_key(method_uri))
+            if content is not None:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('get_xml cache hit: %s' % method_uri)
+                if event is not None:
+                    event.cached = True
+                    event.bytes = len(content)
+                return content, None
+
+        method_url = self._build_url(method_uri)
+        started = time.time()
+        response, content = self._request(method_url, 'GET',
+                                          idempotent=self._is_idempotent(method_uri))
+        if event is not None:
+            self._record_response(event, started, response, content)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('get_xml url: %s' % method_url)
+
+        self._check_status(response, content)
+        return content, cache_ttl
+
+    def _post_content(self, method_uri, xml_post_body, event=None):
+        method_url = self._build_url(method_uri)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('post_xml url: %s' % method_url)
+            logger.debug("posting XML: " + xml_post_body)
+
+        headers = {'Content-Type': 'application/xml'}
+        started = time.time()
+        response, content = self._request(method_url, 'POST', xml_post_body, headers)
+        if event is not None:
+            self._record_response(event, started, response, content)
+        self._check_status(response, content)
+        return content
+
     def get_xml(self, method_uri):
         """Called by the model classes to perform an HTTP GET and receive
         XML from the HM API
@@ -116,14 +516,127 @@ class Client(object):
 
         """
 
-        method_url = self._build_url(method_uri)
-        http = httplib2.Http(disable_ssl_certificate_validation=True)
-        response, content = http.request(method_url, 'GET')
+        if self.coalesce_requests and self._is_idempotent(method_uri):
+            # keyed on the unresolved URI, like the response cache
+            root, event = self._in_flight.do(method_uri, self._get_xml_with_token, method_uri)
+        else:
+            root, event = self._get_xml_with_token(method_uri)
 
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug('get_xml url: %s' % method_url)
+        # models built on this thread from now on came from this response,
+        # including when another caller's request fetched it
+        self._charge_models_to(event)
+        return root
+
+    @property
+    def coalesced_requests(self):
+        """The number of :meth:`get_xml` calls that were served by
+        another caller's identical in-flight request"""
+
+        return self._in_flight.coalesced
+
+    def _get_xml_with_token(self, method_uri):
+        service_token = self.config.service_token
+        try:
+            return self._get_xml(method_uri)
+        except exceptions.InvalidToken:
+            if not self._replace_invalid_token(method_uri, service_token):
+                raise
+
+        return self._get_xml(method_uri)
+
+    def _get_xml(self, method_uri):
+        """Returns the parsed response along with the event that
+        describes it, or None if there are no hooks"""
+
+        with self._instrument(method_uri, 'GET') as event:
+            content, cache_ttl = self._get_content(method_uri, event)
+            root = self._timed_parse(event, content)
+        if cache_ttl:
+            self.cache.set(self._cache_key(method_uri), content, cache_ttl)
+
+        return root, event
 
-        return self._handle_response(response, content)
+    def iter_xml(self, method_uri, path, xml_post_body=None):
+        """Called by the model classes to stream the elements of a large
+        response one at a time, rather than building the whole tree.  The
+        request is sent when iteration starts.  Each element is cleared once
+        the next one is requested, so build what you need from it first.
+
+        :param method_uri: The Harvest Media endpoint to hit, *without* the host \
+        e.g. /gettracks/{{service_token}}
+        :param path: The elements to yield, relative to the root, e.g. tracks/track
+        :param xml_post_body: The XML string to POST to the API, if this \
+        is not a GET
+
+        """
+
+        service_token = self.config.service_token
+        yielded = False
+        try:
+            for element in self._iter_xml(method_uri, path, xml_post_body):
+                yielded = True
+                yield element
+        except exceptions.InvalidToken:
+            if yielded or not self._replace_invalid_token(method_uri, service_token):
+                raise
+
+            for element in self._iter_xml(method_uri, path, xml_post_body):
+                yield element
+
+    def _iter_xml(self, method_uri, path, xml_post_body=None):
+        method = 'GET' if xml_post_body is None else 'POST'
+        with self._instrument(method_uri, method) as event:
+            if xml_post_body is None:
+                content, cache_ttl = self._get_content(method_uri, event)
+            else:
+                content, cache_ttl = self._post_content(method_uri, xml_post_body, event), None
+
+            if event is None:
+                for element in self._iterparse(content, path):
+                    yield element
+            else:
+                # count only the time spent in the parser, not the consumer's
+                event.parse_time = 0.0
+                elements = self._iterparse(content, path)
+                while True:
+                    started = time.time()
+                    try:
+                        element = next(elements)
+                    except StopIteration:
+                        break
+                    finally:
+                        event.parse_time += time.time() - started
+                    yield element
+
+        if cache_ttl:
+            self.cache.set(self._cache_key(method_uri), content, cache_ttl)
+
+    def _cache_key(self, method_uri):
+        # scoped to the account and environment, and on the unresolved URI
+        # so entries outlive the token
+        return '%s|%s' % (self._store_key, method_uri)
+
+    def _get_cache_ttl(self, method_uri):
+        if self.cache is None:
+            return None
+        return self.cache_ttls.get(get_endpoint(method_uri))
+
+    def invalidate_cache(self, method_uri=None):
+        """Removes a cached response, or every cached response if
+        `method_uri` is not given
+
+        :param method_uri: The unresolved Harvest Media endpoint, \
+        e.g. /getalbums/{{service_token}}/abc123
+
+        """
+
+        if self.cache is None:
+            return
+
+        if method_uri is None:
+            self.cache.clear()
+        else:
+            self.cache.delete(self._cache_key(method_uri))
 
     def post_xml(self, method_uri, xml_post_body):
         """Called by the model classes to perform an HTTP POST and receive
@@ -135,49 +648,61 @@ class Client(object):
 
         """
 
-        method_url = self._build_url(method_uri)
-        http = httplib2.Http(disable_ssl_certificate_validation=True)
+        service_token = self.config.service_token
+        try:
+            root, event = self._post_xml(method_uri, xml_post_body)
+        except exceptions.InvalidToken:
+            if not self._replace_invalid_token(method_uri, service_token):
+                raise
+            root, event = self._post_xml(method_uri, xml_post_body)
 
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug('post_xml url: %s' % method_url)
-            logger.debug("posting XML: " + xml_post_body)
+        self._charge_models_to(event)
+        return root
 
-        headers = {'Content-Type': 'application/xml'}
-        response, content = http.request(method_url, 'POST', xml_post_body, headers)
-        return self._handle_response(response, content)
+    def _post_xml(self, method_uri, xml_post_body):
+        with self._instrument(method_uri, 'POST') as event:
+            content = self._post_content(method_uri, xml_post_body, event)
+            return self._timed_parse(event, content), event
 
     def request_service_token(self):
         """Uses the API key to get a valid service token from the HM api.
         Service tokens are used for every call to the API, embedded in the URL
 
-        This method is called automatically on client init
+        This method is called automatically on client init, or on the
+        first API call made by a lazy client
 
         """
 
         method_uri = '/getservicetoken/' + self.api_key
 
-        root = self.get_xml(method_uri)
-        xml_token = root.find('token')
+        with self._token_lock:
+            root = self.get_xml(method_uri)
+            xml_token = root.find('token')
 
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug('got token: %s (expires: %s)' % \
-                (xml_token.get('value'), xml_token.get('expiry')))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('got token: %s (expires: %s)' % \
+                    (xml_token.get('value'), xml_token.get('expiry')))
 
-        token = xml_token.get('value')
-        expiry = xml_token.get('expiry')
+            token = xml_token.get('value')
+            expiry = xml_token.get('expiry')
 
-        self.config.service_token = ServiceToken(self.config, token, expiry)
+            self.config.service_token = ServiceToken(self.config, token, expiry)
+
+            if self.store is not None:
+                self.store.save(self._store_key, token=token, expiry=expiry)
 
     def get_service_info(self):
         """Gets the service info for the current HM account.
         Service info includes URLs for album art, waveforms,
         music streaming, and music downloading
 
-        This method is called automatically on client init
+        This method is called automatically on client init, or the first
+        time the service info is needed by a lazy client
 
         """
 
         method_uri = '/getserviceinfo/{{service_token}}'
+        self.config.service_info_loader = None
 
         root = self.get_xml(method_uri)
         asset_url = root.find('asseturl')
@@ -190,6 +715,80 @@ class Client(object):
 
         trackformats_xml = root.find('trackformats')
 
+        # build the list up front so other threads never see it half-filled
+        trackformats = []
         if trackformats_xml:
             for trackformat_xml in trackformats_xml.getchildren():
-                self.config.trackformats.append(dict(trackformat_xml.items()))
+                trackformats.append(dict(trackformat_xml.items()))
+        self.config.trackformats = trackformats
+
+        if self.store is not None:
+            self.store.save(self._store_key, service_info=self.config.get_service_info())
+
+    @property
+    def workers(self):
+        """The shared worker thread pool, started on first use"""
+
+        if self._workers is None:
+            with self._workers_lock:
+                if self._workers is None:
+                    self._workers = ThreadPool(self.max_workers)
+        return self._workers
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs `fn` on the worker pool and returns immediately with a
+        :class:`multiprocessing.pool.AsyncResult`.  Call ``get()`` on it
+        to wait for the return value, or to re-raise the exception.
+
+        :param fn: the callable to run, usually a query method
+        :param args: positional arguments for `fn`
+        :param kwargs: keyword arguments for `fn`
+
+        """
+
+        return self.workers.apply_async(fn, args, kwargs)
+
+    def map(self, fn, items, max_workers=None):
+        """Calls `fn` once for every item in `items` across a bounded set
+        of threads and returns the results in the same order as `items`.
+        The first exception raised by `fn` is re-raised here.
+
+        Each call gets its own threads, so `fn` can itself call
+        :meth:`map` without starving the pool::
+
+            tracks = client.map(lambda album: album.get_tracks(), albums, max_workers=16)
+
+        :param fn: a callable taking a single item
+        :param items: the items to fan out over
+        :param max_workers: the maximum number of concurrent calls, \
+        defaults to the client's `max_workers`
+
+        """
+
+        items = list(items)
+        if not items:
+            return []
+
+        workers = min(max_workers or self.max_workers, len(items))
+        if workers <= 1:
+            return [fn(item) for item in items]
+
+        thread_pool = ThreadPool(workers)
+        try:
+            return thread_pool.map(fn, items, chunksize=1)
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+
+    def close(self):
+        """Waits for submitted calls to finish, stops the worker
+        threads and closes the transport's connections"""
+
+        with self._workers_lock:
+            workers, self._workers = self._workers, None
+
+        if workers is not None:
+            workers.close()
+            workers.join()
+
+        self.transport.close()
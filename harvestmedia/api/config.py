@@ -3,6 +3,7 @@ import datetime
 import iso8601
 import logging
 import pytz
+import threading
 from urlparse import urlparse
 
 from .exceptions import TokenExpired
@@ -35,6 +36,12 @@ class ServiceToken(object):
         self._expiry_dt = service_token_expires_date.astimezone(utc_tz)
         self._expiry = self._expiry_dt.isoformat()
 
+    def expires_within(self, seconds):
+        """Returns True if this token expires in the next `seconds` seconds"""
+
+        utc_now = datetime.datetime.now(pytz.utc)
+        return self._expiry_dt <= utc_now + datetime.timedelta(seconds=seconds)
+
     @property
     def token(self):
         utc_now = datetime.datetime.now(pytz.utc)
@@ -49,8 +56,41 @@ class ServiceToken(object):
         self._token = value
 
 
+class ServiceInfoField(object):
+    """A :class:`Config` attribute filled in by Client.get_service_info.
+    Reading it first runs the config's `service_info_loader`, if one is
+    set, so that a lazy client only fetches the service info once it is
+    actually needed."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, config, owner):
+        if config is None:
+            return self
+
+        config._load_service_info()
+        return config.__dict__.get(self.name)
+
+    def __set__(self, config, value):
+        config.__dict__[self.name] = value
+
+
 class Config(object):
 
+    album_art_url = ServiceInfoField('album_art_url')
+    waveform_url = ServiceInfoField('waveform_url')
+    download_url = ServiceInfoField('download_url')
+    playlistdownload_url = ServiceInfoField('playlistdownload_url')
+    playlist_art_url = ServiceInfoField('playlist_art_url')
+    stream_url = ServiceInfoField('stream_url')
+    trackformats = ServiceInfoField('trackformats')
+
+    # the values filled in by Client.get_service_info
+    SERVICE_INFO_FIELDS = ('album_art_url', 'waveform_url', 'download_url',
+                           'playlistdownload_url', 'playlist_art_url', 'stream_url',
+                           'trackformats')
+
     def _set(self, param, default=None, **kwargs):
         if kwargs.get(param, None):
             setattr(self, param, kwargs[param])
@@ -58,6 +98,9 @@ class Config(object):
             setattr(self, param, default)
 
     def __init__(self, *args, **kwargs):
+        self.service_info_loader = None
+        self._service_info_lock = threading.RLock()
+
         self._set('waveform_url', **kwargs)
         self._set('webservice_url', **kwargs)
         self._set('debug_level', **kwargs)
@@ -87,6 +130,31 @@ class Config(object):
             self.webservice_prefix = self.webservice_url_parsed.path
             self.webservice_host = self.webservice_url_parsed.netloc
 
+    def _load_service_info(self):
+        if self.service_info_loader is None:
+            return
+
+        with self._service_info_lock:
+            loader, self.service_info_loader = self.service_info_loader, None
+            if loader is not None:
+                try:
+                    loader()
+                except Exception:
+                    self.service_info_loader = loader
+                    raise
+
+    def get_service_info(self):
+        """Returns the asset URLs and track formats as a dictionary"""
+
+        return dict((field, getattr(self, field)) for field in self.SERVICE_INFO_FIELDS)
+
+    def set_service_info(self, service_info):
+        """Sets the asset URLs and track formats from a dictionary
+        returned by :meth:`get_service_info`"""
+
+        for field in self.SERVICE_INFO_FIELDS:
+            setattr(self, field, service_info.get(field))
+
     def get_format_identifier(self, requested_format, bitrate=None):
         format_identifier = None
         for track_format in self.trackformats:
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+import logging
+import sys
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+from .album import Album
+from .library import Library
+from .track import Track
+
+
+logger = logging.getLogger('harvestmedia')
+
+# marks the end of a stage's input
+_DONE = object()
+
+
+class _Stopped(Exception):
+
+    pass
+
+
+class _Failure(object):
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class CrawlProgress(object):
+    """Counts what a :class:`CatalogCrawler` has done so far.  Read it
+    from the crawler's `progress` attribute or the `progress_callback`.
+
+    * `libraries`: the number of libraries in the catalog
+    * `libraries_listed`: libraries whose albums have been listed
+    * `albums`: albums found so far
+    * `albums_skipped`: albums skipped because the checkpoint had them
+    * `albums_done`: albums whose tracks have all been yielded
+    * `tracks`: tracks yielded
+
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.libraries = 0
+        self.libraries_listed = 0
+        self.albums = 0
+        self.albums_skipped = 0
+        self.albums_done = 0
+        self.tracks = 0
+
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def tracks_per_second(self):
+        elapsed = self.elapsed
+        return self.tracks / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def albums_per_second(self):
+        elapsed = self.elapsed
+        return self.albums_done / elapsed if elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return '<CrawlProgress libraries %s/%s, albums %s/%s (%s skipped), tracks %s, %.1f tracks/s>' % \
+                    (self.libraries_listed, self.libraries, self.albums_done, self.albums,
+                     self.albums_skipped, self.tracks, self.tracks_per_second)
+
+
+class CatalogCrawler(object):
+    """Walks the whole catalog, libraries to albums to tracks, and yields
+    a ``(library, album, track)`` tuple for every track::
+
+        crawler = CatalogCrawler(client, checkpoint=FileStore('crawl.json'))
+        for library, album, track in crawler.crawl():
+            ...
+
+    The three levels run as a pipeline, each with its own threads, so
+    albums are listed while the tracks of earlier albums are still being
+    fetched.  Track details are fetched with
+    :meth:`harvestmedia.api.track.TrackQuery.get_tracks`, combining the
+    ids of several albums into each request.  The tracks of an album are
+    yielded together, but albums come out in the order they finish, not
+    catalog order.
+
+    With a `checkpoint`, every album whose tracks have all been yielded is
+    recorded, and a later crawl with the same checkpoint skips it.  An
+    album is only recorded once the consumer asks for the next record, so
+    a crawl that stops part way through an album repeats it on resume.
+
+    :param client: An initialized instance of :class:`harvestmedia.api.client.Client`
+    :param library_workers: the number of threads listing albums
+    :param album_workers: the number of threads listing album tracks
+    :param track_workers: the number of threads fetching track details
+    :param batch_size: the most track ids in one /gettracks request
+    :param get_full_detail: if False, yields the album track listings \
+    without fetching the details of each track
+    :param checkpoint: an optional :class:`harvestmedia.api.store.FileStore` \
+    to record finished albums in
+    :param checkpoint_key: the key the crawl is recorded under in `checkpoint`
+    :param checkpoint_interval: save the checkpoint every this many albums
+    :param progress_callback: an optional callable, given the \
+    :class:`CrawlProgress` each time an album is finished
+    :param queue_size: the most items waiting between two levels
+
+    """
+
+    def __init__(self, client, library_workers=2, album_workers=4, track_workers=4,
+                    batch_size=200, get_full_detail=True, checkpoint=None,
+                    checkpoint_key='catalog-crawl', checkpoint_interval=50,
+                    progress_callback=None, queue_size=64):
+        self.client = client
+        self.library_workers = library_workers
+        self.album_workers = album_workers
+        self.track_workers = track_workers
+        self.batch_size = batch_size
+        self.get_full_detail = get_full_detail
+        self.checkpoint = checkpoint
+        self.checkpoint_key = checkpoint_key
+        self.checkpoint_interval = checkpoint_interval
+        self.progress_callback = progress_callback
+        self.queue_size = queue_size
+
+        self.progress = CrawlProgress()
+        self._stop = threading.Event()
+        self._completed = set()
+
+    def _load_checkpoint(self):
+        if self.checkpoint is None:
+            return set()
+        return set(self.checkpoint.load(self.checkpoint_key).get('completed_albums', []))
+
+    def _save_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.checkpoint_key, completed_albums=sorted(self._completed))
+
+    def reset_checkpoint(self):
+        """Forgets every album recorded in the checkpoint, so that the next
+        crawl starts from the beginning"""
+
+        self._completed = set()
+        self._save_checkpoint()
+
+    def _get(self, queue):
+        while not self._stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                pass
+        raise _Stopped
+
+    def _put(self, queue, item):
+        while not self._stop.is_set():
+            try:
+                return queue.put(item, timeout=0.1)
+            except Full:
+                pass
+        raise _Stopped
+
+    def _start_stage(self, workers, work, inbox, outbox, next_workers, output):
+        """Starts `workers` threads calling `work(item, outbox)` for every
+        item from `inbox`.  The last thread to finish tells the
+        `next_workers` threads of the next stage that it is done."""
+
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def run():
+            try:
+                while True:
+                    item = self._get(inbox)
+                    if item is _DONE:
+                        break
+                    work(item, outbox)
+            except _Stopped:
+                return
+            except Exception:
+                # the consumer re-raises it and stops the other stages
+                try:
+                    self._put(output, _Failure(sys.exc_info()))
+                except _Stopped:
+                    pass
+                return
+
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                try:
+                    for i in range(next_workers):
+                        self._put(outbox, _DONE)
+                except _Stopped:
+                    pass
+
+        threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=run)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _list_albums(self, library, outbox):
+        albums = Album.query.get_albums_for_library(library.id, self.client)
+        self.progress.add(libraries_listed=1, albums=len(albums))
+
+        for album in albums:
+            if album.id in self._completed:
+                self.progress.add(albums_skipped=1)
+                continue
+            self._put(outbox, (library, album))
+
+    def _list_tracks(self, item, outbox):
+        library, album = item
+        tracks = Track.query.get_tracks_for_album(album.id, self.client, get_full_detail=False)
+        self._put(outbox, (library, album, tracks))
+
+    def _fetch_details(self, item, outbox, inbox):
+        if not self.get_full_detail:
+            self._put(outbox, item)
+            return
+
+        # fill the batch with the tracks of any other albums already waiting
+        albums = [item]
+        count = len(item[2])
+        done = False
+        while count < self.batch_size:
+            try:
+                waiting = inbox.get_nowait()
+            except Empty:
+                break
+            if waiting is _DONE:
+                done = True
+                break
+            albums.append(waiting)
+            count += len(waiting[2])
+
+        track_ids = [track.id for library, album, tracks in albums for track in tracks]
+        tracks_by_id = {}
+        if track_ids:
+            for track in Track.query.get_tracks(track_ids, self.client,
+                                                batch_size=self.batch_size, max_workers=1):
+                tracks_by_id[track.id] = track
+
+        for library, album, tracks in albums:
+            detailed = [tracks_by_id[track.id] for track in tracks if track.id in tracks_by_id]
+            self._put(outbox, (library, album, detailed))
+
+        if done:
+            # let this worker see the end of its input
+            self._put(inbox, _DONE)
+
+    def _album_done(self, album):
+        self._completed.add(album.id)
+        self.progress.add(albums_done=1)
+
+        if self.checkpoint is not None and self.progress.albums_done % self.checkpoint_interval == 0:
+            self._save_checkpoint()
+        if self.progress_callback is not None:
+            self.progress_callback(self.progress)
+
+    def crawl(self):
+        """Yields a ``(library, album, track)`` tuple for every track in
+        the catalog.  Errors raised while crawling are re-raised here, and
+        closing the generator stops the crawl."""
+
+        self.progress = CrawlProgress()
+        self._stop.clear()
+        self._completed = self._load_checkpoint()
+
+        libraries = Library.query.get_libraries(self.client)
+        self.progress.libraries = len(libraries)
+
+        library_queue = Queue()
+        album_queue = Queue(self.queue_size)
+        detail_queue = Queue(self.queue_size)
+        output_queue = Queue(self.queue_size)
+
+        for library in libraries:
+            library_queue.put(library)
+        for i in range(self.library_workers):
+            library_queue.put(_DONE)
+
+        fetch_details = lambda item, outbox: self._fetch_details(item, outbox, detail_queue)
+
+        threads = []
+        threads += self._start_stage(self.library_workers, self._list_albums,
+                                     library_queue, album_queue, self.album_workers, output_queue)
+        threads += self._start_stage(self.album_workers, self._list_tracks,
+                                     album_queue, detail_queue, self.track_workers, output_queue)
+        threads += self._start_stage(self.track_workers, fetch_details,
+                                     detail_queue, output_queue, 1, output_queue)
+
+        finished = False
+        try:
+            while True:
+                item = output_queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.exc_info[0], item.exc_info[1], item.exc_info[2]
+
+                library, album, tracks = item
+                for track in tracks:
+                    self.progress.add(tracks=1)
+                    yield library, album, track
+                self._album_done(album)
+
+            finished = True
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self._save_checkpoint()
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('crawl %s: %r' % ('finished' if finished else 'stopped', self.progress))
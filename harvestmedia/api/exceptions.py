@@ -12,6 +12,16 @@ class APITimeoutError(HarvestMediaError):
     pass
 
 
+class CircuitOpenError(HarvestMediaError):
+
+    pass
+
+
+class CassetteMiss(HarvestMediaError):
+
+    pass
+
+
 class InvalidAPIResponse(HarvestMediaError):
 
     def __init__(self, reason):
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+import binascii
+import threading
+
+
+# the bit positions set in each byte value
+_BYTE_BITS = [tuple(bit for bit in range(8) if value & (1 << bit)) for value in range(256)]
+
+
+def _to_bitmap(ordinals, size):
+    """Returns the int with the bits of `ordinals` set, in time
+    proportional to `size` rather than to the number of ordinals times
+    `size` as setting them one at a time would take"""
+
+    if not ordinals:
+        return 0
+    buf = bytearray(size // 8 + 1)
+    for ordinal in ordinals:
+        buf[ordinal >> 3] |= 1 << (ordinal & 7)
+    buf.reverse()
+    return long(binascii.hexlify(buf), 16)
+
+
+def iter_ordinals(bitmap):
+    """Yields the positions of the bits set in `bitmap`, lowest first"""
+
+    if bitmap <= 0:
+        return
+    hex_digits = '%x' % bitmap
+    if len(hex_digits) % 2:
+        hex_digits = '0' + hex_digits
+    buf = bytearray(binascii.unhexlify(hex_digits))
+    buf.reverse()
+
+    for position, value in enumerate(buf):
+        if value:
+            base = position << 3
+            for bit in _BYTE_BITS[value]:
+                yield base + bit
+
+
+def popcount(bitmap):
+    """Returns the number of bits set in `bitmap`"""
+
+    return bin(bitmap).count('1')
+
+
+class FacetIndex(object):
+    """Maps every category and attribute id to a bitmap of the tracks
+    tagged with it, for faceted browsing::
+
+        facets = FacetIndex(Category.query.get_category_tree(client))
+        facets.add_tracks(Track.query.get_tracks(track_ids, client))
+
+        selected = facets.select(all_of=['Instrumentation > Keyboards > Piano', uplifting_id],
+                                 none_of=[vocals_id])
+        facets.count(selected)
+        facets.track_ids(selected, limit=50)
+        facets.facet_counts(selected)
+
+    Each track gets an ordinal, and each bitmap is a Python int with the
+    bits of its tracks' ordinals set, so combining facets is a handful
+    of big integer operations rather than a walk over every track's
+    categories.  Results of :meth:`select` are bitmaps too, and may be
+    combined with ``&``, ``|`` and :meth:`negate`.
+
+    Tracks added or removed are buffered and folded into the bitmaps by
+    the next query.  A removed track's bit is cleared from the live
+    tracks, and :meth:`compact` reclaims its ordinal.
+
+    :param tree: an optional :class:`harvestmedia.api.category.CategoryTree`. \
+    With a tree, facets may be given as paths as well as ids, and a \
+    facet also matches the tracks tagged with any node below it.
+
+    """
+
+    def __init__(self, tree=None):
+        self.tree = tree
+
+        self._ids = []
+        self._ordinals = {}
+        self._node_ids = []
+        self._bitmaps = {}
+        self._pending = {}
+        self._live = 0
+        self._pending_live = []
+        self._pending_removed = []
+        self._removed = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def __contains__(self, track_id):
+        return track_id in self._ordinals
+
+    def _track_node_ids(self, track):
+        node_ids = []
+        stack = list(reversed(track.categories))
+        while stack:
+            node = stack.pop()
+            node_ids.append(node.id)
+            stack.extend(reversed(node.attributes))
+        return tuple(node_ids)
+
+    def add(self, track):
+        """Indexes a track's categories and attributes, replacing them if
+        the track was already indexed"""
+
+        node_ids = self._track_node_ids(track)
+
+        with self._lock:
+            self.remove(track.id)
+
+            ordinal = len(self._ids)
+            self._ids.append(track.id)
+            self._node_ids.append(node_ids)
+            self._ordinals[track.id] = ordinal
+            self._pending_live.append(ordinal)
+            for node_id in node_ids:
+                self._pending.setdefault(node_id, []).append(ordinal)
+
+    def add_tracks(self, tracks):
+        for track in tracks:
+            self.add(track)
+
+    def remove(self, track_id):
+        """Drops a track from every result.  Does nothing if it was not
+        indexed."""
+
+        with self._lock:
+            ordinal = self._ordinals.pop(track_id, None)
+            if ordinal is None:
+                return
+            # cleared from the live tracks by the next query, so that
+            # replacing many tracks does not rebuild the bitmaps each time
+            self._pending_removed.append(ordinal)
+            self._ids[ordinal] = None
+            self._node_ids[ordinal] = ()
+            self._removed += 1
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending_live and not self._pending_removed:
+                return
+            size = len(self._ids)
+            for node_id, ordinals in self._pending.iteritems():
+                self._bitmaps[node_id] = self._bitmaps.get(node_id, 0) | _to_bitmap(ordinals, size)
+            self._live |= _to_bitmap(self._pending_live, size)
+            self._live &= ~_to_bitmap(self._pending_removed, size)
+            self._pending = {}
+            self._pending_live = []
+            self._pending_removed = []
+
+    def compact(self):
+        """Renumbers the tracks without the ones that were removed, and
+        rebuilds the bitmaps"""
+
+        with self._lock:
+            if not self._removed:
+                return
+
+            tracks = [(track_id, node_ids) for track_id, node_ids in zip(self._ids, self._node_ids)
+                      if track_id is not None]
+
+            self._ids = []
+            self._ordinals = {}
+            self._node_ids = []
+            self._bitmaps = {}
+            self._pending = {}
+            self._live = 0
+            self._pending_live = []
+            self._pending_removed = []
+            self._removed = 0
+
+            for ordinal, (track_id, node_ids) in enumerate(tracks):
+                self._ids.append(track_id)
+                self._node_ids.append(node_ids)
+                self._ordinals[track_id] = ordinal
+                self._pending_live.append(ordinal)
+                for node_id in node_ids:
+                    self._pending.setdefault(node_id, []).append(ordinal)
+            self._flush()
+
+    @property
+    def live(self):
+        """The bitmap of every indexed track"""
+
+        self._flush()
+        return self._live
+
+    def _resolve(self, facet):
+        """Returns the ids a facet id or path stands for"""
+
+        if self.tree is None:
+            return [facet]
+
+        node_id = facet
+        if facet not in self.tree:
+            node = self.tree.find_by_path(facet)
+            if node is None:
+                return [facet]
+            node_id = node.id
+        return [node_id] + list(self.tree.get_descendant_ids(node_id))
+
+    def bitmap(self, facet):
+        """Returns the bitmap of the tracks tagged with a facet
+
+        :param facet: a category or attribute id, or with a tree, a path \
+        such as ``Instrumentation > Keyboards > Piano``
+
+        """
+
+        self._flush()
+        bitmap = 0
+        for node_id in self._resolve(facet):
+            bitmap |= self._bitmaps.get(node_id, 0)
+        return bitmap & self._live
+
+    def negate(self, bitmap):
+        """Returns the bitmap of the tracks not in `bitmap`"""
+
+        return self.live & ~bitmap
+
+    def select(self, all_of=(), any_of=(), none_of=(), within=None):
+        """Returns the bitmap of the tracks tagged with every facet in
+        `all_of`, at least one in `any_of` if given, and none in `none_of`
+
+        :param within: a bitmap to narrow down, defaults to every track
+
+        """
+
+        result = self.live if within is None else within & self.live
+        for facet in all_of:
+            if not result:
+                return 0
+            result &= self.bitmap(facet)
+
+        if any_of:
+            either = 0
+            for facet in any_of:
+                either |= self.bitmap(facet)
+            result &= either
+
+        for facet in none_of:
+            result &= ~self.bitmap(facet)
+        return result
+
+    def count(self, bitmap):
+        """Returns the number of tracks in a bitmap"""
+
+        return popcount(bitmap)
+
+    def track_ids(self, bitmap, limit=None):
+        """Returns the ids of the tracks in a bitmap, in the order they
+        were indexed"""
+
+        ids = self._ids
+        track_ids = []
+        for ordinal in iter_ordinals(bitmap):
+            if limit is not None and len(track_ids) >= limit:
+                break
+            track_id = ids[ordinal]
+            if track_id is not None:
+                track_ids.append(track_id)
+        return track_ids
+
+    def facet_counts(self, bitmap=None, node_ids=None):
+        """Returns a dictionary of facet id to the number of tracks in
+        `bitmap` tagged with it, leaving out facets with none
+
+        :param bitmap: the current results, defaults to every track
+        :param node_ids: the facets to count, defaults to every facet \
+        any track is tagged with
+
+        """
+
+        self._flush()
+        if bitmap is None:
+            bitmap = self._live
+        if node_ids is None:
+            node_ids = self._bitmaps.keys()
+
+        counts = {}
+        if popcount(bitmap) * 1000 < len(node_ids) * len(self._ids):
+            # a small result set is quicker to tally track by track than
+            # to AND with every facet's bitmap
+            wanted = set(node_ids)
+            for ordinal in iter_ordinals(bitmap):
+                for node_id in self._node_ids[ordinal]:
+                    if node_id in wanted:
+                        counts[node_id] = counts.get(node_id, 0) + 1
+            return counts
+
+        for node_id in node_ids:
+            count = popcount(bitmap & self._bitmaps.get(node_id, 0))
+            if count:
+                counts[node_id] = count
+        return counts
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import random
+import threading
+import time
+import xml.etree.cElementTree as ET
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urllib import unquote
+
+import pytz
+
+
+logger = logging.getLogger('harvestmedia')
+
+
+# category > attribute group > attributes, in the shape Harvest Media uses
+CATEGORIES = [
+    ('Instrumentation', [('Keyboards', ['Piano', 'Organ', 'Synth']),
+                         ('Guitars', ['Acoustic', 'Electric', 'Electric - Distorted']),
+                         ('Drums', ['Live', 'Programmed'])]),
+    ('Tuning', [('Energy', ['1 - Calm', '2 - Steady', '3 - Driving', '4 - In Motion']),
+                ('Mood', ['Dark', 'Reflective', 'Uplifting']),
+                ('Vocals', ['None', 'Male', 'Female'])]),
+]
+
+GENRES = ['Pop / Rock', 'Country', 'Electronica', 'Orchestral', 'Hip Hop', 'Jazz']
+WORDS = ['epic', 'pop', 'guerilla', 'hat', 'feather', 'strut', 'morning', 'city', 'lights',
+         'river', 'motion', 'summer', 'dark', 'bright', 'echo', 'drive', 'sky', 'stone']
+NAMES = ['S. Milton', 'J. Wygens', 'D. Holter', 'K. White', 'R. Lane', 'M. Ito']
+PUBLISHERS = ['HM Publishing', 'TLL UNDERscore Nashcap (ASCAP)', 'PP Peepee']
+
+TRACK_FORMATS = [
+    {'identifier': '8185d768cd8fcaa7', 'extension': 'mp3', 'bitrate': '320', 'samplerate': '48', 'samplesize': '16'},
+    {'identifier': '768cd8fcaa8185d7', 'extension': 'wav', 'bitrate': '1536', 'samplerate': '48', 'samplesize': '16'},
+]
+
+
+class FakeCatalog(object):
+    """A synthetic, reproducible Harvest Media account: libraries,
+    albums, tracks with categories, members and playlists.  The same
+    `seed` always produces the same ids and values.
+
+    :param libraries: the number of libraries
+    :param albums_per_library: the number of albums in each library
+    :param tracks_per_album: the number of tracks on each album
+    :param members: the number of member accounts, each with playlists \
+    and favourites
+    :param seed: the random seed
+
+    """
+
+    def __init__(self, libraries=2, albums_per_library=5, tracks_per_album=12, members=2, seed=0):
+        self.random = random.Random(seed)
+
+        self.libraries = []
+        self.albums = {}
+        self.album_tracks = {}
+        self.tracks = {}
+        self.members = {}
+        self.playlists = {}
+        self.favourites = {}
+        self.featured_playlists = []
+
+        self.categories = self._build_categories()
+        self.attribute_groups = [(category, group) for category in self.categories
+                                 for group in category['attributes']]
+
+        for library_number in range(libraries):
+            library = {'id': self._new_id(),
+                       'name': 'LIBRARY %s' % (library_number + 1),
+                       'detail': 'Synthetic library %s' % (library_number + 1)}
+            self.libraries.append(library)
+            self.albums[library['id']] = [self._build_album(library, album_number, tracks_per_album)
+                                          for album_number in range(albums_per_library)]
+
+        track_ids = sorted(self.tracks.keys())
+        for member_number in range(members):
+            member_id = self._new_id()
+            self.members[member_id] = {'id': member_id,
+                                       'username': 'member%s' % (member_number + 1),
+                                       'password': 'password',
+                                       'firstname': 'Member',
+                                       'lastname': str(member_number + 1),
+                                       'email': 'member%s@example.com' % (member_number + 1)}
+            self.playlists[member_id] = [self._build_playlist('playlist %s' % (n + 1), track_ids)
+                                         for n in range(2)]
+            self.favourites[member_id] = self._sample(track_ids, 5)
+
+        self.featured_playlists = [self._build_playlist('featured %s' % (n + 1), track_ids)
+                                   for n in range(3)]
+
+    def _new_id(self):
+        return '%016x' % self.random.getrandbits(64)
+
+    def _sample(self, population, count):
+        return self.random.sample(population, min(count, len(population)))
+
+    def _title(self, words=2):
+        return ' '.join(self.random.choice(WORDS) for i in range(words)).title()
+
+    def _build_categories(self):
+        categories = []
+        for category_name, groups in CATEGORIES:
+            category = {'id': self._new_id(), 'name': category_name, 'attributes': []}
+            for group_name, names in groups:
+                group = {'id': self._new_id(), 'name': group_name, 'attributes': []}
+                for name in names:
+                    group['attributes'].append({'id': self._new_id(), 'name': name, 'attributes': []})
+                category['attributes'].append(group)
+            categories.append(category)
+        return categories
+
+    def _build_album(self, library, album_number, tracks_per_album):
+        title = self._title(3)
+        album = {'id': self._new_id(),
+                 'code': 'HM%03d' % (album_number + 1),
+                 'name': title,
+                 'displaytitle': title,
+                 'detail': 'Synthetic album in %s' % library['name'],
+                 'featured': 'false',
+                 'libraryid': library['id']}
+
+        genre = self.random.choice(GENRES)
+        ingested = datetime.datetime(2008, 1, 1) + \
+                    datetime.timedelta(seconds=self.random.randint(0, 5 * 365 * 24 * 60 * 60))
+
+        track_ids = []
+        for track_number in range(tracks_per_album):
+            track = self._build_track(album, track_number, genre, ingested)
+            self.tracks[track['id']] = track
+            track_ids.append(track['id'])
+        self.album_tracks[album['id']] = track_ids
+
+        return album
+
+    def _build_track(self, album, track_number, genre, ingested):
+        title = self._title()
+        length = self.random.randint(30, 300)
+        track = {'id': self._new_id(),
+                 'albumid': album['id'],
+                 'tracknumber': str(track_number + 1),
+                 'name': title,
+                 'displaytitle': title,
+                 'time': '%02d:%02d' % divmod(length, 60),
+                 'lengthseconds': str(length),
+                 'comment': 'A %s piece with %s.' % (genre.lower(), self._title(2).lower()),
+                 'composer': ', '.join(self._sample(NAMES, 2)),
+                 'publisher': self.random.choice(PUBLISHERS),
+                 'genre': genre,
+                 'keywords': ', '.join(self._sample(WORDS, 4)),
+                 'bpm': str(self.random.randint(60, 180)),
+                 'mixout': 'FULL',
+                 'frequency': '44100',
+                 'bitrate': '1411',
+                 'dateingested': ingested.strftime('%Y-%m-%d %H:%M:%S')}
+
+        # one attribute from every group
+        track['_attributes'] = [(category, group, self.random.choice(group['attributes']))
+                                for category, group in self.attribute_groups]
+        return track
+
+    def _build_playlist(self, name, track_ids):
+        return {'id': self._new_id(), 'name': name, 'tracks': self._sample(track_ids, 5)}
+
+    def get_album(self, album_id):
+        for albums in self.albums.values():
+            for album in albums:
+                if album['id'] == album_id:
+                    return album
+
+
+def _element(tag, attributes=None, text=None):
+    element = ET.Element(tag)
+    for name, value in (attributes or {}).items():
+        if not name.startswith('_') and not isinstance(value, (list, dict)):
+            element.set(name, value)
+    if text is not None:
+        element.text = text
+    return element
+
+
+class FakeHarvestMedia(object):
+    """An in-process imitation of the Harvest Media web service that
+    answers from a :class:`FakeCatalog`.  It is a plain callable, so it
+    can be used directly by a :class:`harvestmedia.api.transport.MemoryTransport`
+    or served over real HTTP by a :class:`FakeServer`.
+
+    Any API key is accepted.  Service tokens it hands out are checked on
+    every call and rejected with the usual error code 5 once they expire.
+
+    :param catalog: the catalog to serve, a default :class:`FakeCatalog` if omitted
+    :param latency: seconds to sleep before every response, to imitate \
+    the network
+    :param token_lifetime: seconds a service token stays valid
+    :param prefix: the path the service is mounted at
+
+    """
+
+    def __init__(self, catalog=None, latency=0, token_lifetime=6 * 60 * 60, prefix='/HMP-WS.svc'):
+        self.catalog = catalog or FakeCatalog()
+        self.latency = latency
+        self.token_lifetime = token_lifetime
+        self.prefix = prefix
+
+        self.tokens = {}
+        self.requests = {}
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+        self.routes = {
+            'getservicetoken': self.get_service_token,
+            'getserviceinfo': self.get_service_info,
+            'getlibraries': self.get_libraries,
+            'getalbums': self.get_albums,
+            'getalbumtracks': self.get_album_tracks,
+            'gettracks': self.get_tracks,
+            'getcategories': self.get_categories,
+            'getmember': self.get_member,
+            'authenticatemember': self.authenticate_member,
+            'getmemberplaylists': self.get_member_playlists,
+            'getfeaturedplaylists': self.get_featured_playlists,
+            'getfavourites': self.get_favourites,
+        }
+
+    def __call__(self, method, path, body=None):
+        if self.latency:
+            time.sleep(self.latency)
+
+        if path.startswith(self.prefix):
+            path = path[len(self.prefix):]
+        path = path.split('?', 1)[0]
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+
+        endpoint, args = parts[0], parts[1:]
+        handler = self.routes.get(endpoint)
+        if handler is None:
+            return 404, 'Endpoint not found'
+
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+        if endpoint != 'getservicetoken':
+            if not args or not self._valid_token(args[0]):
+                return 200, self._error('response' + endpoint, '5', 'Invalid Token')
+            args = args[1:]
+
+        try:
+            root = handler(body, *args)
+        except TypeError:
+            return 400, 'Bad request'
+
+        return 200, ET.tostring(root)
+
+    def _valid_token(self, token):
+        with self._lock:
+            expires = self.tokens.get(token)
+        return expires is not None and expires > time.time()
+
+    def _error(self, tag, code, description):
+        root = ET.Element(tag)
+        error = ET.SubElement(root, 'error')
+        ET.SubElement(error, 'code').text = code
+        ET.SubElement(error, 'description').text = description
+        return ET.tostring(root)
+
+    def _track_element(self, track, full_detail=False):
+        element = _element('track', track)
+        if full_detail:
+            categories = ET.SubElement(element, 'categories')
+            by_category = {}
+            for category, group, attribute in track['_attributes']:
+                if category['id'] not in by_category:
+                    category_element = ET.SubElement(categories, 'category',
+                                                     {'id': category['id'], 'name': category['name']})
+                    by_category[category['id']] = ET.SubElement(category_element, 'attributes')
+                group_element = ET.SubElement(by_category[category['id']], 'attribute',
+                                              {'id': group['id'], 'name': group['name']})
+                ET.SubElement(ET.SubElement(group_element, 'attributes'), 'attribute',
+                              {'id': attribute['id'], 'name': attribute['name']})
+        return element
+
+    def _tracks_element(self, track_ids, full_detail=False):
+        tracks = ET.Element('tracks')
+        for track_id in track_ids:
+            track = self.catalog.tracks.get(track_id)
+            if track is not None:
+                tracks.append(self._track_element(track, full_detail))
+        return tracks
+
+    def _attribute_element(self, attribute):
+        element = _element('attribute', attribute)
+        if attribute['attributes']:
+            attributes = ET.SubElement(element, 'attributes')
+            for child in attribute['attributes']:
+                attributes.append(self._attribute_element(child))
+        return element
+
+    def _playlists_element(self, playlists):
+        playlists_element = ET.Element('playlists')
+        for playlist in playlists:
+            element = ET.SubElement(playlists_element, 'playlist',
+                                    {'id': playlist['id'], 'name': playlist['name']})
+            element.append(self._tracks_element(playlist['tracks']))
+        return playlists_element
+
+    def _member_element(self, member):
+        element = ET.Element('memberaccount', {'id': member['id']})
+        for field in ('username', 'firstname', 'lastname', 'email'):
+            ET.SubElement(element, field).text = member[field]
+        return element
+
+    def get_service_token(self, body, api_key):
+        token = '%032x' % self._random.getrandbits(128)
+        with self._lock:
+            self.tokens[token] = time.time() + self.token_lifetime
+
+        # Harvest Media reports expiry in its own local time
+        hm_now = datetime.datetime.now(pytz.timezone('Australia/Sydney'))
+        expiry = hm_now + datetime.timedelta(seconds=self.token_lifetime)
+
+        root = ET.Element('responseservicetoken')
+        ET.SubElement(root, 'token', {'value': token, 'expiry': expiry.strftime('%Y-%m-%dT%H:%M:%S')})
+        return root
+
+    def get_service_info(self, body):
+        root = ET.Element('responseserviceinfo')
+        ET.SubElement(root, 'asseturl', {
+            'albumart': 'http://asset.example.com/albumart/{id}/{width}/{height}',
+            'waveform': 'http://asset.example.com/waveform/{id}/{width}/{height}',
+            'trackstream': 'http://asset.example.com/trackstream/{memberaccountid}/{id}',
+            'trackdownload': 'http://asset.example.com/trackdownload/{memberaccountid}/{id}/{trackformat}',
+            'playlistdownload': 'http://download.example.com/playlistdownload/{memberaccountid}/{id}/{trackformat}',
+            'playlistart': 'http://download.example.com/playlistart/{id}/{width}/{height}',
+        })
+        trackformats = ET.SubElement(root, 'trackformats')
+        for trackformat in TRACK_FORMATS:
+            ET.SubElement(trackformats, 'trackformat', trackformat)
+        return root
+
+    def get_libraries(self, body):
+        root = ET.Element('responselibraries')
+        libraries = ET.SubElement(root, 'libraries')
+        for library in self.catalog.libraries:
+            libraries.append(_element('library', library))
+        return root
+
+    def get_albums(self, body, library_id):
+        root = ET.Element('responsealbums')
+        albums = ET.SubElement(root, 'albums')
+        for album in self.catalog.albums.get(library_id, []):
+            albums.append(_element('album', album))
+        return root
+
+    def get_album_tracks(self, body, album_id):
+        root = ET.Element('responsetracks')
+        root.append(self._tracks_element(self.catalog.album_tracks.get(album_id, [])))
+        return root
+
+    def get_tracks(self, body):
+        request = ET.fromstring(body)
+        track_ids = [track.text for track in request.findall('track')]
+        full_detail = request.get('fulldetail') == 'true'
+
+        root = ET.Element('responsetracks')
+        root.append(self._tracks_element(track_ids, full_detail))
+        return root
+
+    def get_categories(self, body):
+        root = ET.Element('responsecategories')
+        categories = ET.SubElement(root, 'categories')
+        for category in self.catalog.categories:
+            element = _element('category', category)
+            attributes = ET.SubElement(element, 'attributes')
+            for attribute in category['attributes']:
+                attributes.append(self._attribute_element(attribute))
+            categories.append(element)
+        return root
+
+    def get_member(self, body, member_id):
+        member = self.catalog.members.get(member_id)
+        if member is None:
+            return ET.fromstring(self._error('responsemember', '7', 'Member Does Not Exist'))
+
+        root = ET.Element('responsemember')
+        root.append(self._member_element(member))
+        return root
+
+    def authenticate_member(self, body, username, password):
+        for member in self.catalog.members.values():
+            if member['username'] == username and member['password'] == password:
+                root = ET.Element('responsemember')
+                root.append(self._member_element(member))
+                return root
+
+        return ET.fromstring(self._error('responsemember', '6', 'Invalid Login Details'))
+
+    def get_member_playlists(self, body, member_id):
+        root = ET.Element('responseplaylists')
+        root.append(self._playlists_element(self.catalog.playlists.get(member_id, [])))
+        return root
+
+    def get_featured_playlists(self, body):
+        root = ET.Element('responsefeaturedplaylists')
+        root.append(self._playlists_element(self.catalog.featured_playlists))
+        return root
+
+    def get_favourites(self, body, member_id):
+        root = ET.Element('responsefavourites')
+        favourites = ET.SubElement(root, 'favourites')
+        favourites.append(self._tracks_element(self.catalog.favourites.get(member_id, [])))
+        return root
+
+
+class _ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class _FakeRequestHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, so that connection pooling can be measured
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+
+        status, content = self.server.app(self.command, self.path, body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        logger.debug('fake server: ' + format % args)
+
+
+class FakeServer(object):
+    """Serves a :class:`FakeHarvestMedia` over real HTTP on localhost,
+    from a background thread, so that the client can be benchmarked
+    end to end without the live service::
+
+        with FakeServer(FakeHarvestMedia(FakeCatalog(libraries=10))) as server:
+            client = Client('any-key', webservice_url=server.url)
+
+    :param app: the application to serve, a default :class:`FakeHarvestMedia` if omitted
+    :param host: the interface to listen on
+    :param port: the port to listen on, or 0 to pick a free one
+
+    """
+
+    def __init__(self, app=None, host='127.0.0.1', port=0):
+        self.app = app or FakeHarvestMedia()
+        self.host = host
+        self.port = port
+
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """The webservice URL to give to the client"""
+
+        return 'http://%s:%s%s' % (self.host, self.port, self.app.prefix)
+
+    def start(self):
+        self._server = _ThreadedHTTPServer((self.host, self.port), _FakeRequestHandler)
+        self._server.app = self.app
+        self.port = self._server.server_address[1]
+
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+
+# seconds, from a fast cache hit to a slow /gettracks
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# response sizes, in bytes
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class RequestEvent(object):
+    """What a :class:`harvestmedia.api.client.Client` measured about a
+    single request to one endpoint.  Times are in seconds; a value is None
+    when it was not measured, e.g. `ttfb` for transports that only hand
+    back complete responses.
+
+    * `endpoint`: the endpoint, e.g. ``/gettracks``
+    * `method`: ``GET`` or ``POST``
+    * `status`: the HTTP status of the final attempt
+    * `cached`: True if the response came from the response cache
+    * `error`: the name of the exception the request failed with
+    * `wall_time`: the time spent sending the request and reading the \
+      response, including any retries
+    * `ttfb`: the time until the response headers arrived
+    * `bytes`: the size of the response body
+    * `parse_time`: the time spent parsing the XML
+    * `model_time`: the time spent building models from the response, \
+      so far
+    * `models`: the number of models built from the response, so far
+
+    """
+
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.status = None
+        self.cached = False
+        self.error = None
+        self.wall_time = None
+        self.ttfb = None
+        self.bytes = None
+        self.parse_time = None
+        self.model_time = 0.0
+        self.models = 0
+
+
+class RequestHook(object):
+    """The interface of the objects passed to a
+    :class:`harvestmedia.api.client.Client` as `hooks`.  Every method is
+    called on the thread that made the request, so they should be quick.
+
+    """
+
+    def before_request(self, event):
+        """Called before a request is sent, with only `endpoint` and
+        `method` set"""
+
+        pass
+
+    def after_request(self, event):
+        """Called once the response has been read and parsed, or the
+        request failed.  For streamed responses this is after the last
+        element was handed out."""
+
+        pass
+
+    def after_model(self, event, seconds):
+        """Called each time a model, e.g. a Track with its categories, has
+        been built from the XML of the request described by `event`"""
+
+        pass
+
+
+def timed_model(from_xml):
+    """Decorates a model's ``_from_xml(cls, xml_data, _client)`` so that
+    the time spent building it is reported to the client's hooks, against
+    the request of the :func:`charges_models` query building it.  Models
+    built while building another, such as a track's categories, count
+    towards the outermost one."""
+
+    @functools.wraps(from_xml)
+    def wrapper(cls, xml_data, _client):
+        hooks = getattr(_client, 'hooks', None)
+        if not hooks:
+            return from_xml(cls, xml_data, _client)
+
+        local = _client._instrument_local
+        event = getattr(local, 'event', None)
+        if event is None or getattr(local, 'building', False):
+            return from_xml(cls, xml_data, _client)
+
+        local.building = True
+        started = time.time()
+        try:
+            return from_xml(cls, xml_data, _client)
+        finally:
+            local.building = False
+            seconds = time.time() - started
+            event.model_time += seconds
+            event.models += 1
+            for hook in hooks:
+                hook.after_model(event, seconds)
+
+    return wrapper
+
+
+def charges_models(query):
+    """Decorates a query that requests XML and builds models from it, so
+    that the models it builds are charged to its request by
+    :func:`timed_model`.  Once it returns nothing is charged, so models
+    built later on the same thread, such as the collections of a lazy
+    model, are not counted against a request that already finished.
+
+    The client is the query's `_client` argument or, for a model's own
+    methods, ``self._client``.
+
+    """
+
+    argument_names = inspect.getargspec(query).args
+    if '_client' in argument_names:
+        client_position = argument_names.index('_client')
+    else:
+        client_position = None
+
+    @functools.wraps(query)
+    def wrapper(*args, **kwargs):
+        if '_client' in kwargs:
+            _client = kwargs['_client']
+        elif client_position is not None and client_position < len(args):
+            _client = args[client_position]
+        else:
+            _client = getattr(args[0], '_client', None)
+
+        if not getattr(_client, 'hooks', None):
+            return query(*args, **kwargs)
+
+        local = _client._instrument_local
+        depth = getattr(local, 'depth', 0)
+        event = getattr(local, 'event', None)
+        local.depth = depth + 1
+        try:
+            return query(*args, **kwargs)
+        finally:
+            # an enclosing query carries on charging its own request
+            local.depth = depth
+            local.event = event
+
+    return wrapper
+
+
+class Histogram(object):
+    """A fixed-bucket histogram.  Percentiles are estimated by linear
+    interpolation within the bucket they fall in, as Prometheus'
+    ``histogram_quantile`` does, so memory stays constant however many
+    samples are added.
+
+    :param buckets: the sorted upper bounds of the buckets
+
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Returns the estimated `q` percentile, e.g. 95, or None if the
+        histogram is empty"""
+
+        if not self.count:
+            return None
+
+        rank = self.count * q / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    # the overflow bucket has no upper bound
+                    return self.max
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+
+        return self.max
+
+    def cumulative_counts(self):
+        """Returns ``(upper_bound, count)`` pairs, counting every sample
+        at or below the bound, ending with ``('+Inf', count)``"""
+
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class MetricsAggregator(RequestHook):
+    """A hook that collects per-endpoint histograms of the request wall
+    time, time to first byte, response size, XML parse time and model
+    build time, along with request, error and cache hit counts::
+
+        metrics = MetricsAggregator()
+        client = Client(api_key, hooks=[metrics])
+        ...
+        print metrics.percentile('/gettracks', 'wall_time', 95)
+        print metrics.to_prometheus()
+
+    :param time_buckets: the bucket bounds for times, in seconds
+    :param size_buckets: the bucket bounds for response sizes, in bytes
+
+    """
+
+    # event attribute, prometheus name, help text
+    METRICS = (
+        ('wall_time', 'harvestmedia_request_seconds',
+            'Time spent sending Harvest Media requests and reading the responses'),
+        ('ttfb', 'harvestmedia_ttfb_seconds',
+            'Time until the first byte of a Harvest Media response'),
+        ('bytes', 'harvestmedia_response_bytes',
+            'Size of Harvest Media response bodies'),
+        ('parse_time', 'harvestmedia_parse_seconds',
+            'Time spent parsing Harvest Media XML'),
+        ('model_time', 'harvestmedia_model_seconds',
+            'Time spent building each model from Harvest Media XML'),
+    )
+
+    def __init__(self, time_buckets=TIME_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.time_buckets = time_buckets
+        self.size_buckets = size_buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forgets everything collected so far"""
+
+        with self._lock:
+            self.histograms = {}
+            self.requests = {}
+            self.errors = {}
+            self.cache_hits = {}
+
+    def _histogram(self, endpoint, metric):
+        key = (endpoint, metric)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            buckets = self.size_buckets if metric == 'bytes' else self.time_buckets
+            histogram = self.histograms[key] = Histogram(buckets)
+        return histogram
+
+    def after_request(self, event):
+        endpoint = event.endpoint
+        with self._lock:
+            key = (endpoint, event.status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            if event.error is not None:
+                key = (endpoint, event.error)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+            if event.cached:
+                self.cache_hits[endpoint] = self.cache_hits.get(endpoint, 0) + 1
+
+            for metric in ('wall_time', 'ttfb', 'bytes', 'parse_time'):
+                value = getattr(event, metric)
+                if value is not None:
+                    self._histogram(endpoint, metric).add(value)
+
+    def after_model(self, event, seconds):
+        with self._lock:
+            self._histogram(event.endpoint, 'model_time').add(seconds)
+
+    def histogram(self, endpoint, metric):
+        """Returns the :class:`Histogram` of `metric` for `endpoint`, or
+        None if nothing has been recorded
+
+        :param endpoint: the endpoint, e.g. ``/gettracks``
+        :param metric: one of wall_time, ttfb, bytes, parse_time or model_time
+
+        """
+
+        return self.histograms.get((endpoint, metric))
+
+    def percentile(self, endpoint, metric, q):
+        """Returns the estimated `q` percentile of `metric` for
+        `endpoint`, or None if nothing has been recorded"""
+
+        histogram = self.histogram(endpoint, metric)
+        if histogram is None:
+            return None
+        return histogram.percentile(q)
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """Returns a dictionary of ``{endpoint: {metric: stats}}``, where
+        `stats` holds the count, sum, max and the requested percentiles
+        as ``p50`` etc."""
+
+        with self._lock:
+            histograms = self.histograms.items()
+
+        summary = {}
+        for (endpoint, metric), histogram in histograms:
+            stats = {'count': histogram.count, 'sum': histogram.sum, 'max': histogram.max}
+            for q in percentiles:
+                stats['p%s' % q] = histogram.percentile(q)
+            summary.setdefault(endpoint, {})[metric] = stats
+        return summary
+
+    def to_prometheus(self):
+        """Returns everything collected in the Prometheus text
+        exposition format"""
+
+        with self._lock:
+            lines = []
+
+            lines.append('# HELP harvestmedia_requests_total Harvest Media requests by endpoint and status')
+            lines.append('# TYPE harvestmedia_requests_total counter')
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append('harvestmedia_requests_total{endpoint="%s",status="%s"} %s' % \
+                                    (endpoint, status if status is not None else '', count))
+
+            lines.append('# HELP harvestmedia_errors_total Failed Harvest Media requests by endpoint and error')
+            lines.append('# TYPE harvestmedia_errors_total counter')
+            for (endpoint, error), count in sorted(self.errors.items()):
+                lines.append('harvestmedia_errors_total{endpoint="%s",error="%s"} %s' % \
+                                    (endpoint, error, count))
+
+            lines.append('# HELP harvestmedia_cache_hits_total Harvest Media responses served from the cache')
+            lines.append('# TYPE harvestmedia_cache_hits_total counter')
+            for endpoint, count in sorted(self.cache_hits.items()):
+                lines.append('harvestmedia_cache_hits_total{endpoint="%s"} %s' % (endpoint, count))
+
+            for metric, name, help_text in self.METRICS:
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s histogram' % name)
+                for (endpoint, histogram_metric), histogram in sorted(self.histograms.items()):
+                    if histogram_metric != metric:
+                        continue
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append('%s_bucket{endpoint="%s",le="%s"} %s' % \
+                                            (name, endpoint, bound, count))
+                    lines.append('%s_sum{endpoint="%s"} %r' % (name, endpoint, histogram.sum))
+                    lines.append('%s_count{endpoint="%s"} %s' % (name, endpoint, histogram.count))
+
+        return '\n'.join(lines) + '\n'
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from album import Album
+from instrumentation import charges_models, timed_model
 from util import DictObj
 
 
@@ -9,6 +10,7 @@ class LibraryQuery(object):
 
     """
 
+    @charges_models
     def get_libraries(self, _client):
         """Returns all of the libraries on the configured Harvest Media account
 
@@ -27,6 +29,16 @@ class LibraryQuery(object):
 
         return libraries
 
+    def get_libraries_async(self, _client):
+        """Asynchronous version of :meth:`get_libraries`.  Returns a result
+        handle whose ``get()`` returns the list of libraries.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_libraries, _client)
+
 
 class Library(DictObj):
 
@@ -36,6 +48,7 @@ class Library(DictObj):
         self._client = _client
 
     @classmethod
+    @timed_model
     def _from_xml(cls, xml_data, _client):
         """Internally-used classmethod to create an instance of :class:`Library` from
         the XML returned by Harvest Media. Converts all attributes 
@@ -3,6 +3,7 @@ import urllib
 import xml.etree.cElementTree as ET
 
 from .exceptions import MissingParameter
+from .instrumentation import charges_models, timed_model
 from .playlist import Playlist
 from .track import Track
 from .util import DictObj
@@ -14,6 +15,7 @@ class MemberQuery(object):
 
     """
 
+    @charges_models
     def get_by_id(self, member_id, _client):
         """Takes takes a single member id and returns a
         :class:`harvestmedia.api.member.Member` object.
@@ -56,6 +58,7 @@ class MemberQuery(object):
                          'track_id': track_id}
         _client.get_xml(method_uri)
 
+    @charges_models
     def update_member(self, member_id, _client, **kwargs):
         """Updates a member's preferences and profile in the
         Harvest Media database. Values in `kwargs`  need to 
@@ -89,6 +92,44 @@ class MemberQuery(object):
         xml_member = xml_data.find('memberaccount')
         return Member._from_xml(xml_member, _client)
 
+    def get_by_id_async(self, member_id, _client):
+        """Asynchronous version of :meth:`get_by_id`.  Returns a result
+        handle whose ``get()`` returns the member.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_by_id, member_id, _client)
+
+    def add_favourite_async(self, member_id, track_id, _client):
+        """Asynchronous version of :meth:`add_favourite`
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.add_favourite, member_id, track_id, _client)
+
+    def remove_favourite_async(self, member_id, track_id, _client):
+        """Asynchronous version of :meth:`remove_favourite`
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.remove_favourite, member_id, track_id, _client)
+
+    def update_member_async(self, member_id, _client, **kwargs):
+        """Asynchronous version of :meth:`update_member`.  Returns a result
+        handle whose ``get()`` returns the updated member.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.update_member, member_id, _client, **kwargs)
+
 
 class Member(DictObj):
     """ Represents a Harvest Media Member
@@ -103,6 +144,7 @@ class Member(DictObj):
         self._client = _client
 
     @classmethod
+    @timed_model
     def _from_xml(cls, xml_member, _client):
         """Internally-used classmethod to create an instance of :class:`Member` from
         the XML returned by Harvest Media. Converts all child nodes 
@@ -130,6 +172,7 @@ class Member(DictObj):
         return instance
 
     @classmethod
+    @charges_models
     def register(cls, **kwargs):
         """Creates a new member from the params in kwargs.
         
@@ -169,6 +212,7 @@ class Member(DictObj):
         return self.query.update_member(self.id, self._client, **update_vars)
 
     @classmethod
+    @charges_models
     def authenticate(cls, username, password, _client):
         method_uri = '/authenticatemember/{{service_token}}/%(username)s/%(password)s' % \
                         {'username': urllib.quote(username),
@@ -187,6 +231,7 @@ class Member(DictObj):
     def get_playlists(self):
         return Playlist.query.get_member_playlists(self.id, self._client)
 
+    @charges_models
     def get_favourites(self):
         method_uri = '/getfavourites/{{service_token}}/%(member_id)s' % \
                         {'member_id': self.id}
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import threading
+
+from .album import Album
+from .category import Attribute, Category
+from .library import Library
+from .track import Track
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS libraries (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS albums (
+    id TEXT PRIMARY KEY,
+    library_id TEXT,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS albums_library ON albums (library_id);
+
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    album_id TEXT,
+    name TEXT,
+    genre TEXT,
+    bpm INTEGER,
+    lengthseconds INTEGER,
+    dateingested TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album_id);
+CREATE INDEX IF NOT EXISTS tracks_genre ON tracks (genre);
+CREATE INDEX IF NOT EXISTS tracks_bpm ON tracks (bpm);
+CREATE INDEX IF NOT EXISTS tracks_lengthseconds ON tracks (lengthseconds);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id TEXT PRIMARY KEY,
+    name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS attributes (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    category_id TEXT,
+    name TEXT,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS attributes_parent ON attributes (parent_id);
+
+CREATE TABLE IF NOT EXISTS track_attributes (
+    track_id TEXT NOT NULL,
+    attribute_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (track_id, attribute_id)
+);
+CREATE INDEX IF NOT EXISTS track_attributes_attribute ON track_attributes (attribute_id);
+"""
+
+TRACK_COLUMNS = ('id', 'album_id', 'name', 'genre', 'bpm', 'lengthseconds', 'dateingested', 'data')
+CATEGORY_COLUMNS = ('id', 'name')
+ATTRIBUTE_COLUMNS = ('id', 'parent_id', 'category_id', 'name', 'value')
+
+
+# ON CONFLICT ... DO UPDATE arrived in SQLite 3.24
+UPSERT_VERSION = (3, 24, 0)
+
+
+def _upsert_statements(table, columns, rows, native=True):
+    """Returns the ``(sql, rows)`` pairs that store `rows`, updating a
+    row in place when its id is already stored.  Unlike INSERT OR REPLACE
+    this keeps the rowid, which is what listings are ordered by.
+
+    Without `native` upserts the rows are inserted if new and then
+    updated, which gives the same result on older SQLite."""
+
+    values = '(%s) VALUES (%s)' % (', '.join(columns), ', '.join('?' * len(columns)))
+
+    if native:
+        return [('INSERT INTO %s %s ON CONFLICT(id) DO UPDATE SET %s' % (
+                    table, values,
+                    ', '.join('%s = excluded.%s' % (column, column) for column in columns[1:])),
+                 rows)]
+
+    return [('INSERT OR IGNORE INTO %s %s' % (table, values), rows),
+            ('UPDATE %s SET %s WHERE id = ?' % (
+                table, ', '.join('%s = ?' % column for column in columns[1:])),
+             [tuple(row[1:]) + (row[0],) for row in rows])]
+
+
+def _model_data(model):
+    """Returns the public attributes of a DictObj model as JSON"""
+
+    if hasattr(model, '_materialize'):
+        model._materialize()
+    return json.dumps(dict((name, value) for name, value in model.__dict__.items()
+                           if not name.startswith('_') and not isinstance(value, list)))
+
+
+class CatalogMirror(object):
+    """A local SQLite copy of the catalog that can answer the usual
+    listing queries without Harvest Media, and much faster::
+
+        mirror = CatalogMirror('catalog.db', client)
+        mirror.import_crawl(CatalogCrawler(client).crawl())
+        tracks = mirror.find_tracks(genre='Jazz', bpm=(90, 110))
+
+    Tracks keep the attributes Harvest Media sent, and their categories
+    are stored once in the `categories` and `attributes` tables with a
+    link per track, so tracks can be looked up by any attribute id.
+    Models read back from the mirror are bound to `client`, so their URL
+    helpers still work.
+
+    A mirror may be shared between threads; access is serialized.
+
+    :param path: the database file, or ``:memory:``
+    :param client: the :class:`harvestmedia.api.client.Client` to bind \
+    the models read back to
+
+    """
+
+    def __init__(self, path=':memory:', client=None):
+        self.path = path
+        self.client = client
+
+        self._lock = threading.RLock()
+        self._native_upserts = sqlite3.sqlite_version_info >= UPSERT_VERSION
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            # lets other processes read the mirror while it is written to
+            self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _write(self, statements):
+        """Runs ``(sql, rows)`` pairs with executemany in one transaction"""
+
+        with self._lock:
+            with self._connection:
+                for sql, rows in statements:
+                    if rows:
+                        self._connection.executemany(sql, rows)
+
+    def _upsert(self, table, columns, rows):
+        return _upsert_statements(table, columns, rows, self._native_upserts)
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def upsert_libraries(self, libraries):
+        self._write(self._upsert('libraries', ('id', 'name', 'data'),
+                                 [(library.id, library.name, _model_data(library))
+                                  for library in libraries]))
+
+    def upsert_albums(self, albums, library_id=None):
+        """Stores albums, under `library_id` if the albums do not say
+        which library they belong to"""
+
+        self._write(self._upsert('albums', ('id', 'library_id', 'name', 'data'),
+                                 [(album.id, album.libraryid or library_id, album.name, _model_data(album))
+                                  for album in albums]))
+
+    def upsert_categories(self, categories):
+        """Stores the category tree, e.g. from
+        :meth:`harvestmedia.api.category.CategoryQuery.get_categories`"""
+
+        category_rows = []
+        attribute_rows = []
+        for category in categories:
+            category_rows.append((category.id, category.name))
+            self._attribute_rows(category.attributes, category.id, category.id, attribute_rows)
+
+        self._write(self._upsert('categories', CATEGORY_COLUMNS, category_rows) +
+                    self._upsert('attributes', ATTRIBUTE_COLUMNS, attribute_rows))
+
+    def _attribute_rows(self, attributes, parent_id, category_id, rows):
+        for attribute in attributes:
+            rows.append((attribute.id, parent_id, category_id, attribute.name, attribute.value))
+            self._attribute_rows(attribute.attributes, attribute.id, category_id, rows)
+
+    def upsert_tracks(self, tracks, album_id=None):
+        """Stores full detail tracks, e.g. from
+        :meth:`harvestmedia.api.track.TrackQuery.get_tracks`, along with
+        their categories, in a single transaction
+
+        :param album_id: the album for tracks that do not say which \
+        album they are on
+
+        """
+
+        track_rows = []
+        category_rows = []
+        attribute_rows = []
+        link_rows = []
+        for track in tracks:
+            track_dict = track.as_dict()
+            track_dict.pop('_client', None)
+            track_dict.pop('categories', None)
+
+            bpm = track.bpm if isinstance(track.bpm, int) else None
+            length = track.lengthseconds if isinstance(track.lengthseconds, int) else None
+            track_rows.append((track.id, track.albumid or album_id, track.name, track.genre,
+                               bpm, length, track_dict.get('dateingested'), json.dumps(track_dict)))
+
+            track_attributes = []
+            for category in track.categories:
+                category_rows.append((category.id, category.name))
+                self._attribute_rows(category.attributes, category.id, category.id, track_attributes)
+            attribute_rows.extend(track_attributes)
+            link_rows.extend((track.id, row[0], position) for position, row in enumerate(track_attributes))
+
+        self._write(
+            [('DELETE FROM track_attributes WHERE track_id = ?', [(row[0],) for row in track_rows])] +
+            self._upsert('tracks', TRACK_COLUMNS, track_rows) +
+            self._upsert('categories', CATEGORY_COLUMNS, category_rows) +
+            self._upsert('attributes', ATTRIBUTE_COLUMNS, attribute_rows) +
+            [('INSERT OR REPLACE INTO track_attributes (track_id, attribute_id, position) '
+              'VALUES (?, ?, ?)', link_rows)])
+
+    def delete_tracks(self, track_ids):
+        rows = [(track_id,) for track_id in track_ids]
+        self._write([('DELETE FROM track_attributes WHERE track_id = ?', rows),
+                     ('DELETE FROM tracks WHERE id = ?', rows)])
+
+    def import_crawl(self, records, chunk_size=500):
+        """Stores the ``(library, album, track)`` records of a
+        :meth:`harvestmedia.api.crawler.CatalogCrawler.crawl`, committing
+        every `chunk_size` tracks.  Returns the number of tracks stored."""
+
+        libraries = {}
+        albums = {}
+        tracks = []
+        count = 0
+
+        def flush():
+            self.upsert_libraries(libraries.values())
+            for library_id, album in albums.values():
+                self.upsert_albums([album], library_id)
+            self.upsert_tracks(tracks)
+            libraries.clear()
+            albums.clear()
+            del tracks[:]
+
+        for library, album, track in records:
+            libraries[library.id] = library
+            albums[album.id] = (library.id, album)
+            if track.albumid is None:
+                track.albumid = album.id
+            tracks.append(track)
+            count += 1
+            if len(tracks) >= chunk_size:
+                flush()
+
+        flush()
+        return count
+
+    def apply_sync_events(self, events):
+        """Applies the :class:`harvestmedia.api.sync.SyncEvent` list
+        returned by :meth:`harvestmedia.api.sync.CatalogSync.sync`"""
+
+        self.delete_tracks([event.track_id for event in events if event.track is None])
+
+        tracks = []
+        for event in events:
+            if event.track is not None:
+                if event.track.albumid is None:
+                    event.track.albumid = event.album_id
+                tracks.append(event.track)
+        self.upsert_tracks(tracks)
+
+    def _library_from_row(self, data):
+        library = Library(self.client)
+        for name, value in json.loads(data).items():
+            setattr(library, name, value)
+        return library
+
+    def _album_from_row(self, data):
+        album = Album(self.client)
+        for name, value in json.loads(data).items():
+            setattr(album, name, value)
+        return album
+
+    def _tracks_from_rows(self, rows):
+        tracks = []
+        by_id = {}
+        for track_id, data in rows:
+            track = Track(self.client)
+            for name, value in json.loads(data).items():
+                track._set_xml_attribute(name, value)
+            tracks.append(track)
+            by_id[track_id] = track
+
+        if by_id:
+            self._attach_categories(by_id)
+        return tracks
+
+    def _attach_categories(self, tracks_by_id):
+        track_ids = tracks_by_id.keys()
+        rows = []
+        # stay well under SQLite's limit on bound parameters
+        for start in range(0, len(track_ids), 500):
+            chunk = track_ids[start:start + 500]
+            rows.extend(self._query(
+                'SELECT l.track_id, a.id, a.parent_id, a.category_id, a.name, a.value, c.name '
+                'FROM track_attributes l JOIN attributes a ON a.id = l.attribute_id '
+                'LEFT JOIN categories c ON c.id = a.category_id '
+                'WHERE l.track_id IN (%s) ORDER BY l.track_id, l.position' % ','.join('?' * len(chunk)),
+                chunk))
+
+        nodes = {}
+        for track_id, attribute_id, parent_id, category_id, name, value, category_name in rows:
+            track = tracks_by_id[track_id]
+            track_nodes = nodes.setdefault(track_id, {})
+
+            if category_id not in track_nodes:
+                category = Category(self.client)
+                category.id = category_id
+                category.name = category_name
+                track_nodes[category_id] = category
+                track.categories.append(category)
+
+            attribute = Attribute(self.client)
+            attribute.id = attribute_id
+            attribute.name = name
+            attribute.value = value
+            track_nodes[attribute_id] = attribute
+
+            parent = track_nodes.get(parent_id)
+            if parent is not None:
+                parent.attributes.append(attribute)
+
+    def get_libraries(self):
+        return [self._library_from_row(data) for data, in
+                self._query('SELECT data FROM libraries ORDER BY rowid')]
+
+    def get_albums_for_library(self, library_id):
+        return [self._album_from_row(data) for data, in
+                self._query('SELECT data FROM albums WHERE library_id = ? ORDER BY rowid', (library_id,))]
+
+    def get_track(self, track_id):
+        tracks = self._tracks_from_rows(self._query('SELECT id, data FROM tracks WHERE id = ?',
+                                                    (track_id,)))
+        return tracks[0] if tracks else None
+
+    def get_tracks_for_album(self, album_id):
+        return self._tracks_from_rows(self._query(
+                    'SELECT id, data FROM tracks WHERE album_id = ? ORDER BY rowid', (album_id,)))
+
+    def find_tracks(self, attribute_id=None, genre=None, bpm=None, lengthseconds=None, limit=None):
+        """Returns the tracks matching every given condition
+
+        :param attribute_id: an attribute, or attribute group, the track \
+        is tagged with
+        :param genre: the exact genre
+        :param bpm: a ``(low, high)`` tuple, inclusive; either may be None
+        :param lengthseconds: a ``(low, high)`` tuple of the duration in \
+        seconds, inclusive; either may be None
+        :param limit: the most tracks to return
+
+        """
+
+        joins = []
+        conditions = []
+        parameters = []
+
+        if attribute_id is not None:
+            joins.append('JOIN track_attributes l ON l.track_id = t.id')
+            conditions.append('l.attribute_id = ?')
+            parameters.append(attribute_id)
+        if genre is not None:
+            conditions.append('t.genre = ?')
+            parameters.append(genre)
+
+        for column, bounds in (('bpm', bpm), ('lengthseconds', lengthseconds)):
+            if bounds is None:
+                continue
+            low, high = bounds
+            if low is not None:
+                conditions.append('t.%s >= ?' % column)
+                parameters.append(low)
+            if high is not None:
+                conditions.append('t.%s <= ?' % column)
+                parameters.append(high)
+
+        sql = 'SELECT t.id, t.data FROM tracks t %s' % ' '.join(joins)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY t.rowid'
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+
+        return self._tracks_from_rows(self._query(sql, parameters))
+
+    def get_tracks_by_attribute(self, attribute_id):
+        return self.find_tracks(attribute_id=attribute_id)
+
+    def count_tracks(self):
+        return self._query('SELECT COUNT(*) FROM tracks')[0][0]
@@ -2,6 +2,7 @@
 from urllib import quote as url_quote
 
 from .exceptions import MissingParameter
+from .instrumentation import charges_models, timed_model
 from .track import Track
 from .util import DictObj
 
@@ -12,6 +13,7 @@ class PlaylistQuery(object):
 
     """
 
+    @charges_models
     def get_member_playlists(self, member_id, _client):
         """Gets all of the playlists for a particular member.
 
@@ -33,6 +35,7 @@ class PlaylistQuery(object):
 
         return playlists
 
+    @charges_models
     def get_featured_playlists(self, _client):
         """Gets all of the featured playlists
 
@@ -51,6 +54,35 @@ class PlaylistQuery(object):
 
         return playlists
 
+    def iter_member_playlists(self, member_id, _client):
+        """Like :meth:`get_member_playlists`, but parses the response
+        incrementally and yields each playlist as soon as it is read.
+
+        :param member_id: The Harvest Media member identifer
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        method_uri = '/getmemberplaylists/{{service_token}}/%(member_id)s' % \
+                        {'member_id': member_id}
+
+        for playlist_element in _client.iter_xml(method_uri, 'playlists/playlist'):
+            playlist = Playlist._from_xml(playlist_element, _client)
+            playlist.member_id = member_id
+            yield playlist
+
+    def iter_featured_playlists(self, _client):
+        """Like :meth:`get_featured_playlists`, but parses the response
+        incrementally and yields each playlist as soon as it is read.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        method_uri = '/getfeaturedplaylists/{{service_token}}'
+        for playlist_element in _client.iter_xml(method_uri, 'playlists/playlist'):
+            yield Playlist._from_xml(playlist_element, _client)
+
     def add_track(self, member_id, playlist_id, track_id, _client):
         """Adds a track to a member playlist.
 
@@ -97,6 +129,7 @@ class PlaylistQuery(object):
                          'id': playlist_id}
         _client.get_xml(method_uri)
 
+    @charges_models
     def _add_playlist(self, **kwargs):
         """This method is private because the class method on :class:`Playlist`
         should be used instead
@@ -184,6 +217,62 @@ class PlaylistQuery(object):
             asset_url = asset_url.replace('{height}', str(height))
         return asset_url
 
+    def get_member_playlists_async(self, member_id, _client):
+        """Asynchronous version of :meth:`get_member_playlists`.  Returns a result
+        handle whose ``get()`` returns the list of playlists.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_member_playlists, member_id, _client)
+
+    def get_featured_playlists_async(self, _client):
+        """Asynchronous version of :meth:`get_featured_playlists`.  Returns a result
+        handle whose ``get()`` returns the list of playlists.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_featured_playlists, _client)
+
+    def add_track_async(self, member_id, playlist_id, track_id, _client):
+        """Asynchronous version of :meth:`add_track`
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.add_track, member_id, playlist_id, track_id, _client)
+
+    def remove_track_async(self, member_id, playlist_id, track_id, _client):
+        """Asynchronous version of :meth:`remove_track`
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.remove_track, member_id, playlist_id, track_id, _client)
+
+    def remove_playlist_async(self, member_id, playlist_id, _client):
+        """Asynchronous version of :meth:`remove_playlist`
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.remove_playlist, member_id, playlist_id, _client)
+
+    def update_playlist_async(self, member_id, playlist_id, playlist_name, _client):
+        """Asynchronous version of :meth:`update_playlist`
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.update_playlist, member_id, playlist_id, playlist_name, _client)
+
 
 class Playlist(DictObj):
     """ Represents a Harvest Media member playlist asset
@@ -194,12 +283,15 @@ class Playlist(DictObj):
 
     query = PlaylistQuery()
 
+    _lazy_collections = {'tracks': '_build_tracks'}
+
     def __init__(self, _client):
 
         self.tracks = []
         self._client = _client
 
     @classmethod
+    @timed_model
     def _from_xml(cls, xml_data, _client):
         """Internally-used classmethod to create an instance of :class:`Playlist` from
         the XML returned by Harvest Media. Converts all attributes 
@@ -223,18 +315,23 @@ class Playlist(DictObj):
 
         """
 
+        if getattr(_client, 'lazy_models', False):
+            return cls._from_xml_lazy(xml_data, _client)
+
         instance = cls(_client)
         instance.id = xml_data.get('id')
-        for attribute, value in xml_data.items():
-            setattr(instance, attribute, value)
-
-        tracks = xml_data.find('tracks')
-        if tracks:
-            for track in tracks.getchildren():
-                instance.tracks.append(Track._from_xml(track, _client))
-
+        instance._load_fields(xml_data)
+        instance.tracks = instance._build_tracks(xml_data)
         return instance
 
+    def _build_tracks(self, xml_data):
+        tracks = []
+        tracks_element = xml_data.find('tracks')
+        if tracks_element:
+            for track in tracks_element.getchildren():
+                tracks.append(Track._from_xml(track, self._client))
+        return tracks
+
     @classmethod
     def add(cls, **kwargs):
         """Creates and returns a new (empty) playlist for a member 
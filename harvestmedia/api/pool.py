@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import httplib
+import logging
+import socket
+import threading
+import time
+
+import httplib2
+
+
+logger = logging.getLogger('harvestmedia')
+
+
+class ConnectionPool(object):
+    """A pool of :class:`httplib2.Http` instances owned by a
+    :class:`harvestmedia.api.client.Client`.
+
+    Each ``Http`` instance keeps its own keep-alive connections open, so
+    handing the same instance back out on the next request skips the TCP
+    and TLS handshake. ``httplib2.Http`` is not safe to share between
+    threads, so an instance is only ever checked out to one caller at a time.
+
+    :param max_size: the maximum number of idle instances kept around
+    :param idle_timeout: seconds an instance may sit unused before its \
+    connections are closed and it is dropped from the pool
+    :param http_kwargs: passed through to every new ``httplib2.Http``
+
+    """
+
+    def __init__(self, max_size=4, idle_timeout=60, **http_kwargs):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.http_kwargs = http_kwargs
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _close(self, http):
+        connections = getattr(http, 'connections', None)
+        if isinstance(connections, dict):
+            for connection in connections.values():
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            connections.clear()
+
+    def _evict_idle(self, now):
+        # called with the lock held
+        fresh = []
+        for last_used, http in self._idle:
+            if now - last_used > self.idle_timeout:
+                self.evictions += 1
+                self._close(http)
+            else:
+                fresh.append((last_used, http))
+        self._idle = fresh
+
+    def acquire(self):
+        """Checks out an ``httplib2.Http`` instance, reusing an idle one
+        if there is one available"""
+
+        with self._lock:
+            self._evict_idle(time.time())
+            if self._idle:
+                self.hits += 1
+                last_used, http = self._idle.pop()
+                return http
+            self.misses += 1
+
+        return httplib2.Http(**self.http_kwargs)
+
+    def release(self, http):
+        """Returns an instance to the pool once its response has been read"""
+
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((time.time(), http))
+                return
+            self.evictions += 1
+
+        self._close(http)
+
+    def discard(self, http):
+        """Drops an instance that failed mid-request instead of pooling it"""
+
+        self._close(http)
+
+    def clear(self):
+        """Closes and drops every idle instance"""
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for last_used, http in idle:
+            self._close(http)
+
+    @property
+    def size(self):
+        return len(self._idle)
+
+    def stats(self):
+        """Returns the pool counters as a dictionary"""
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'idle': self.size}
+
+    def request(self, url, method='GET', body=None, headers=None):
+        """Performs a request on a pooled ``httplib2.Http`` instance
+        and returns the ``(response, content)`` tuple from httplib2"""
+
+        http = self.acquire()
+        try:
+            response, content = http.request(url, method, body, headers)
+        except Exception:
+            self.discard(http)
+            raise
+
+        self.release(http)
+        return response, content
+
+
+class HTTPConnectionPool(object):
+    """A pool of keep-alive ``httplib`` connections to a single host, in
+    the style of urllib3.  Connections are checked out for one request
+    at a time and returned once the response body has been read.
+
+    :param scheme: ``http`` or ``https``
+    :param host: the host, with an optional ``:port``
+    :param max_size: the maximum number of idle connections kept around
+    :param idle_timeout: seconds an idle connection is kept before it is closed
+    :param timeout: the socket timeout for new connections
+    :param ssl_context: an optional :class:`ssl.SSLContext` for https
+
+    """
+
+    def __init__(self, scheme, host, max_size=4, idle_timeout=60, timeout=None, ssl_context=None):
+        self.scheme = scheme
+        self.host = host
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.host, timeout=self.timeout, context=self.ssl_context)
+        return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+    def acquire(self):
+        """Returns a ``(connection, reused)`` tuple, reusing an idle
+        connection if there is one available"""
+
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                last_used, connection = self._idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    self.hits += 1
+                    return connection, True
+                self.evictions += 1
+                connection.close()
+            self.misses += 1
+
+        return self._new_connection(), False
+
+    def release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((time.time(), connection))
+                return
+            self.evictions += 1
+
+        connection.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for last_used, connection in idle:
+            connection.close()
+
+    @property
+    def size(self):
+        return len(self._idle)
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'idle': self.size}
+
+    def urlopen(self, method, path, body=None, headers=None):
+        """Sends a request on a pooled connection and returns the
+        ``(response, content)`` tuple, with the body already read"""
+
+        connection, reused = self.acquire()
+        while True:
+            try:
+                started = time.time()
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+                response.ttfb = time.time() - started
+                content = response.read()
+            except socket.timeout:
+                connection.close()
+                raise
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                # the server dropped the idle connection, try a fresh one
+                connection, reused = self._new_connection(), False
+                continue
+            except Exception:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.release(connection)
+
+        return response, content
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import threading
+import time
+
+from .exceptions import CircuitOpenError
+
+
+logger = logging.getLogger('harvestmedia')
+
+
+class RetryPolicy(object):
+    """Describes how a :class:`harvestmedia.api.client.Client` retries
+    idempotent GET requests that time out, fail to connect, or return
+    one of `retry_statuses`.  Delays grow exponentially from `backoff`
+    up to `max_backoff`, and with `jitter` each delay is drawn at random
+    from zero up to that ceiling so that many clients do not retry in step.
+
+    :param max_retries: how many times to retry after the first attempt
+    :param backoff: the delay ceiling, in seconds, before the first retry
+    :param max_backoff: the largest delay ceiling, in seconds
+    :param jitter: if True, randomise each delay
+    :param retry_statuses: the HTTP status codes worth retrying
+
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=10, jitter=True,
+                    retry_statuses=(500, 502, 503, 504)):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def get_delay(self, attempt):
+        """Returns the number of seconds to wait before retry number
+        `attempt`, counting from zero"""
+
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def sleep(self, attempt):
+        delay = self.get_delay(attempt)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CircuitBreaker(object):
+    """Stops a :class:`harvestmedia.api.client.Client` from sending
+    requests while Harvest Media looks unhealthy.
+
+    After `failure_threshold` consecutive failures (timeouts, connection
+    errors or 5xx responses) the breaker opens and every request fails
+    immediately with :class:`harvestmedia.api.exceptions.CircuitOpenError`.
+    Once `reset_timeout` seconds have passed, a single trial request is let
+    through: if it succeeds the breaker closes again, otherwise it stays
+    open for another `reset_timeout`.
+
+    :param failure_threshold: consecutive failures before opening
+    :param reset_timeout: seconds to wait before sending a trial request
+
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raises :class:`harvestmedia.api.exceptions.CircuitOpenError` if
+        the request should not be sent"""
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                logger.debug('circuit breaker half-open, sending a trial request')
+                self.state = self.HALF_OPEN
+                return
+
+            raise CircuitOpenError('Harvest Media is unavailable, failing fast for up to %ss' % \
+                                    self.reset_timeout)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.debug('circuit breaker open after %s failures' % self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.time()
@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+import binascii
+import heapq
+import marshal
+import math
+import os
+import re
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+
+from .facets import iter_ordinals
+
+
+MAGIC = 'HMTRACKINDEX2\n'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Returns the lower case words in `text`, e.g. ``[u'pop', u'rock']``
+    for ``Pop / Rock``"""
+
+    if not text:
+        return []
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _set_bit(bits, ordinal):
+    index = ordinal >> 3
+    if index >= len(bits):
+        # grow by at least double, so appending stays cheap
+        bits.extend(bytearray(max(index + 1 - len(bits), len(bits))))
+    bits[index] |= 1 << (ordinal & 7)
+
+
+class _Tier(object):
+    """The tracks a word appears in with the same weight: their ordinals
+    in ascending order and, once the tier is dense, a bitmap of them as a
+    bytearray for probing and an int for ANDing"""
+
+    __slots__ = ('weight', 'ordinals', 'bits', 'bitmap')
+
+    def __init__(self, weight, ordinals=None, bits=None):
+        self.weight = weight
+        self.ordinals = array('I') if ordinals is None else ordinals
+        self.bits = bits
+        self.bitmap = None
+
+    def append(self, ordinal):
+        self.ordinals.append(ordinal)
+        if self.bits is not None:
+            _set_bit(self.bits, ordinal)
+            self.bitmap = None
+
+    def build_bits(self):
+        bits = bytearray((self.ordinals[-1] >> 3) + 1)
+        for ordinal in self.ordinals:
+            bits[ordinal >> 3] |= 1 << (ordinal & 7)
+        self.bits = bits
+        self.bitmap = None
+
+    def get_bitmap(self):
+        bitmap = self.bitmap
+        if bitmap is None:
+            reversed_bits = bytearray(self.bits)
+            reversed_bits.reverse()
+            bitmap = self.bitmap = long(binascii.hexlify(reversed_bits), 16)
+        return bitmap
+
+
+class TrackIndex(object):
+    """An in-memory full text index over the text attributes of tracks::
+
+        index = TrackIndex()
+        index.add_tracks(Track.query.get_tracks(track_ids, client))
+        for track_id, score in index.search('piano compose', limit=10):
+            ...
+
+    Every word of the query must appear in a track, in any of the indexed
+    fields, and the last word also matches longer words it is the start
+    of, so results can follow what a user types.  Tracks are ranked by the
+    rarity of the words they match, weighted by the field each word was
+    found in, and ties go to the track indexed first.
+
+    The index holds track ids, not tracks.  Each word's tracks are split
+    into tiers by the weight the word has in them, each an array of track
+    ordinals.  A search visits combinations of one tier per query word,
+    best scoring first, intersecting the tiers before anything is scored,
+    and stops once no later combination could make the results.  Tiers
+    holding a large share of the tracks are also kept as bitmaps, so
+    common words intersect as big integer ANDs.
+
+    Removed tracks are skipped until :meth:`compact` drops them, which
+    :meth:`save` does before writing a snapshot.
+
+    Adding and removing are serialized; searches may run alongside them.
+
+    :param fields: a dictionary of track attribute to the weight of a \
+    word found in it, defaults to :attr:`FIELDS`
+
+    """
+
+    # attribute: weight of a word found in it
+    FIELDS = {
+        'name': 3.0,
+        'composer': 2.0,
+        'publisher': 1.5,
+        'genre': 1.5,
+        'keywords': 1.0,
+        'comment': 1.0,
+    }
+
+    # prefix matches count for less than the whole word
+    PREFIX_WEIGHT = 0.5
+
+    # the most words a prefix is expanded to
+    MAX_PREFIX_TERMS = 200
+
+    # a tier gets a bitmap once it holds at least this many tracks, and
+    # at least one in this many of all the tracks, so that the bitmap is
+    # no bigger than the ordinals array when it is made
+    DENSE_MIN_TRACKS = 256
+    DENSE_RATIO = 32
+
+    def __init__(self, fields=None):
+        self.fields = dict(fields or self.FIELDS)
+
+        self._ids = []
+        self._ordinals = {}
+        self._postings = {}
+        self._terms = None
+        self._removed = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def __contains__(self, track_id):
+        return track_id in self._ordinals
+
+    def _weights(self, track):
+        weights = {}
+        for field, weight in self.fields.items():
+            for term in tokenize(getattr(track, field)):
+                weights[term] = weights.get(term, 0.0) + weight
+        return weights
+
+    def add(self, track):
+        """Indexes a track, replacing it if it was already indexed"""
+
+        weights = self._weights(track)
+
+        with self._lock:
+            self.remove(track.id)
+
+            ordinal = len(self._ids)
+            self._ids.append(track.id)
+            self._ordinals[track.id] = ordinal
+
+            for term, weight in weights.iteritems():
+                tiers = self._postings.get(term)
+                if tiers is None:
+                    tiers = self._postings[term] = {}
+                    self._terms = None
+                tier = tiers.get(weight)
+                if tier is None:
+                    tier = tiers[weight] = _Tier(weight)
+                tier.append(ordinal)
+                if tier.bits is None and self._is_dense(tier):
+                    tier.build_bits()
+
+    def add_tracks(self, tracks):
+        for track in tracks:
+            self.add(track)
+
+    def remove(self, track_id):
+        """Drops a track from the results.  Does nothing if it was not
+        indexed."""
+
+        with self._lock:
+            ordinal = self._ordinals.pop(track_id, None)
+            if ordinal is not None:
+                self._ids[ordinal] = None
+                self._removed += 1
+
+    def compact(self):
+        """Rebuilds the postings without the tracks that were removed"""
+
+        with self._lock:
+            if not self._removed:
+                return
+
+            renumbered = array('i', [-1]) * len(self._ids)
+            ids = []
+            for ordinal, track_id in enumerate(self._ids):
+                if track_id is not None:
+                    renumbered[ordinal] = len(ids)
+                    ids.append(track_id)
+
+            postings = {}
+            for term, tiers in self._postings.iteritems():
+                kept = {}
+                for weight, tier in tiers.iteritems():
+                    ordinals = array('I', [renumbered[ordinal] for ordinal in tier.ordinals
+                                           if renumbered[ordinal] >= 0])
+                    if ordinals:
+                        kept[weight] = _Tier(weight, ordinals)
+                if kept:
+                    postings[term] = kept
+
+            self._ids = ids
+            self._ordinals = dict((track_id, ordinal) for ordinal, track_id in enumerate(ids))
+            self._postings = postings
+            self._terms = None
+            self._removed = 0
+
+            for tiers in postings.itervalues():
+                for tier in tiers.itervalues():
+                    if self._is_dense(tier):
+                        tier.build_bits()
+
+    def _sorted_terms(self):
+        terms = self._terms
+        if terms is None:
+            with self._lock:
+                terms = self._terms = sorted(self._postings)
+        return terms
+
+    def expand(self, prefix):
+        """Returns the indexed words that start with `prefix`, at most
+        :attr:`MAX_PREFIX_TERMS` of them"""
+
+        terms = self._sorted_terms()
+        expanded = []
+        position = bisect_left(terms, prefix)
+        while position < len(terms) and len(expanded) < self.MAX_PREFIX_TERMS:
+            term = terms[position]
+            if not term.startswith(prefix):
+                break
+            expanded.append(term)
+            position += 1
+        return expanded
+
+    def _scored_tiers(self, token, prefix, live):
+        """Returns the ``(score, tier)`` pairs of a query word, best first"""
+
+        scored = []
+        for term in (self.expand(token) if prefix else [token]):
+            tiers = self._postings.get(term)
+            if not tiers:
+                continue
+            tiers = tiers.values()
+            idf = math.log(1.0 + float(live) / sum(len(tier.ordinals) for tier in tiers))
+            if term != token:
+                idf *= self.PREFIX_WEIGHT
+            scored.extend((tier.weight * idf, tier) for tier in tiers)
+
+        scored.sort(key=lambda (score, tier): -score)
+        return scored
+
+    def _is_dense(self, tier):
+        count = len(tier.ordinals)
+        return count >= self.DENSE_MIN_TRACKS and count * self.DENSE_RATIO >= len(self._ids)
+
+    def _intersect(self, tiers, skip, limit, below=None):
+        """Returns up to `limit` of the lowest ordinals in every tier,
+        leaving out those in `skip`, those from `below` up, and removed
+        tracks"""
+
+        ids = self._ids
+        tiers = sorted(tiers, key=lambda tier: len(tier.ordinals))
+        found = []
+
+        # a tier only gets bits once it is dense when a track is added, so
+        # a bigger tier may still have none
+        if all(tier.bits is not None for tier in tiers):
+            # every tier is dense: AND the bitmaps
+            bitmap = tiers[0].get_bitmap()
+            for tier in tiers[1:]:
+                bitmap &= tier.get_bitmap()
+            if below is not None:
+                bitmap &= (1 << below) - 1
+
+            if limit is None:
+                return [ordinal for ordinal in iter_ordinals(bitmap)
+                        if ordinal not in skip and ids[ordinal] is not None]
+
+            while bitmap and len(found) < limit:
+                lowest = bitmap & -bitmap
+                bitmap ^= lowest
+                ordinal = lowest.bit_length() - 1
+                if ordinal not in skip and ids[ordinal] is not None:
+                    found.append(ordinal)
+            return found
+
+        # walk the smallest tier, probing the others
+        probes = []
+        for tier in tiers[1:]:
+            if tier.bits is not None:
+                probes.append((True, tier.bits, len(tier.bits)))
+            else:
+                probes.append((False, tier.ordinals, len(tier.ordinals)))
+
+        for ordinal in tiers[0].ordinals:
+            if below is not None and ordinal >= below:
+                break
+            if ordinal in skip or ids[ordinal] is None:
+                continue
+            for is_bits, data, count in probes:
+                if is_bits:
+                    index = ordinal >> 3
+                    if index >= count or not data[index] & (1 << (ordinal & 7)):
+                        break
+                else:
+                    position = bisect_left(data, ordinal)
+                    if position >= count or data[position] != ordinal:
+                        break
+            else:
+                found.append(ordinal)
+                if limit is not None and len(found) >= limit:
+                    break
+        return found
+
+    def search(self, query, limit=20, prefix=True):
+        """Returns a list of ``(track_id, score)`` for the best matching
+        tracks, best first
+
+        :param query: the words to look for
+        :param limit: the most results to return, or None for all of them, \
+        which visits every combination of tiers
+        :param prefix: if True, the last word also matches the words it \
+        is the start of
+
+        """
+
+        tokens = tokenize(query)
+        if not tokens or limit == 0:
+            return []
+
+        # repeated words add nothing; the last keeps its prefix matching
+        unique = []
+        for position, token in enumerate(tokens):
+            is_prefix = prefix and position == len(tokens) - 1
+            if (token, is_prefix) not in unique:
+                unique.append((token, is_prefix))
+
+        ids = self._ids
+        live = max(len(self._ordinals), 1)
+
+        scored = []
+        for token, is_prefix in unique:
+            tiers = self._scored_tiers(token, is_prefix, live)
+            if not tiers:
+                return []
+            scored.append(tiers)
+
+        def total(positions):
+            return sum(scored[word][position][0] for word, position in enumerate(positions))
+
+        # visit the combinations of one tier per word, best first.  Every
+        # track in a combination has its score, so once `limit` tracks
+        # have been found no worse combination can displace them.  A
+        # track a prefix matches more than once is kept at its best score,
+        # which is the first combination it is found in.
+        start = (0,) * len(scored)
+        heap = [(-total(start), start)]
+        visited = set([start])
+        results = []
+        found = set()
+
+        rank = lambda (score, ordinal): (-score, ordinal)
+        while heap:
+            negative_score, positions = heapq.heappop(heap)
+            score = -negative_score
+
+            below = None
+            if limit is not None and len(results) >= limit:
+                results.sort(key=rank)
+                del results[limit:]
+                if score < results[-1][0]:
+                    break
+                # a tie only displaces tracks indexed after it
+                below = results[-1][1]
+
+            tiers = [scored[word][position][1] for word, position in enumerate(positions)]
+            for ordinal in self._intersect(tiers, found, limit, below):
+                found.add(ordinal)
+                results.append((score, ordinal))
+
+            for word in range(len(scored)):
+                if positions[word] + 1 < len(scored[word]):
+                    following = positions[:word] + (positions[word] + 1,) + positions[word + 1:]
+                    if following not in visited:
+                        visited.add(following)
+                        heapq.heappush(heap, (-total(following), following))
+
+        results.sort(key=rank)
+        if limit is not None:
+            results = results[:limit]
+        return [(ids[ordinal], score) for score, ordinal in results]
+
+    def save(self, path):
+        """Writes a snapshot of the index to `path`, which :meth:`load`
+        reads back far faster than the tracks can be indexed again"""
+
+        with self._lock:
+            self.compact()
+            snapshot = {
+                'fields': self.fields,
+                'ids': self._ids,
+                'postings': dict((term, [(weight, tier.ordinals.tostring(),
+                                          None if tier.bits is None else str(tier.bits))
+                                         for weight, tier in tiers.iteritems()])
+                                 for term, tiers in self._postings.iteritems()),
+            }
+
+            directory = os.path.dirname(os.path.abspath(path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as snapshot_file:
+                snapshot_file.write(MAGIC)
+                marshal.dump(snapshot, snapshot_file)
+            os.rename(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Returns the index saved to `path` by :meth:`save`"""
+
+        with open(path, 'rb') as snapshot_file:
+            if snapshot_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError('not a track index: %s' % path)
+            snapshot = marshal.load(snapshot_file)
+
+        index = cls(snapshot['fields'])
+        index._ids = snapshot['ids']
+        index._ordinals = dict((track_id, ordinal) for ordinal, track_id in enumerate(index._ids))
+        for term, tiers in snapshot['postings'].iteritems():
+            index._postings[term] = dict(
+                (weight, _Tier(weight, array('I', ordinals), None if bits is None else bytearray(bits)))
+                for weight, ordinals, bits in tiers)
+        return index
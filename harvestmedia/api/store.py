@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def get_store_key(api_key, webservice_url):
+    """Returns the key a client's state is kept under, so that several
+    accounts or environments can share one store"""
+
+    return hashlib.sha1('%s|%s' % (api_key, webservice_url)).hexdigest()
+
+
+class FileStore(object):
+    """Keeps the service token and service info in a JSON file so that
+    every process on a host can share them.  A worker that starts while a
+    valid token is on file needs no network calls at all, and a token
+    refreshed by one worker is picked up by the others.
+
+    Writes are atomic renames, so reads never need a lock.  :meth:`lock`
+    takes an exclusive ``flock`` on a sidecar ``.lock`` file, which the
+    client holds while it refreshes so that only one process at a time
+    asks Harvest Media for a new token.
+
+    :param path: the file to keep the state in
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+
+        self._local_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Holds the exclusive inter-process lock for the duration of a
+        ``with`` block.  Re-entrant within a process."""
+
+        with self._local_lock:
+            if self._lock_depth == 0:
+                self._lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as store_file:
+                return json.load(store_file)
+        except (IOError, ValueError):
+            return {}
+
+    def load(self, key):
+        """Returns the dictionary saved under `key`, or an empty one"""
+
+        return self._read().get(key, {})
+
+    def save(self, key, **values):
+        """Merges `values` into the dictionary saved under `key`"""
+
+        with self.lock():
+            data = self._read()
+            data.setdefault(key, {}).update(values)
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as store_file:
+                json.dump(data, store_file)
+            os.rename(temp_path, self.path)
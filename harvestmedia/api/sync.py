@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import logging
+
+from .album import Album
+from .library import Library
+from .track import DATE_FORMAT, Track
+
+
+logger = logging.getLogger('harvestmedia')
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+
+class SyncEvent(object):
+    """A change found by :meth:`CatalogSync.sync`
+
+    * `kind`: one of ``added``, ``removed`` or ``changed``
+    * `track_id`: the Harvest Media track identifier
+    * `album_id`: the album the track is, or was, on
+    * `track`: the full detail :class:`harvestmedia.api.track.Track` \
+      for added and changed tracks, None for removed ones
+
+    """
+
+    def __init__(self, kind, track_id, album_id, track=None):
+        self.kind = kind
+        self.track_id = track_id
+        self.album_id = album_id
+        self.track = track
+
+    def __repr__(self):
+        return '<SyncEvent %s %s>' % (self.kind, self.track_id)
+
+
+def _fingerprint(track):
+    """Returns a short hash of the attributes in a track listing"""
+
+    track_dict = track.as_dict()
+    items = sorted((name, value) for name, value in track_dict.items()
+                   if name not in ('_client', 'categories'))
+    return hashlib.sha1(repr(items)).hexdigest()[:16]
+
+
+class CatalogSync(object):
+    """Keeps a local copy of the catalog up to date by fetching only what
+    changed since the last run::
+
+        catalog_sync = CatalogSync(client, FileStore('catalog-sync.json'))
+        for event in catalog_sync.sync():
+            if event.kind == 'removed':
+                delete(event.track_id)
+            else:
+                save(event.track)
+
+    The sync keeps a manifest of every album's track ids, with a
+    fingerprint of each track's listing, and a watermark of the latest
+    `dateingested` seen.  Each run lists the albums and their tracks,
+    which Harvest Media offers no way to filter by date, and then fetches
+    full detail only for the tracks that are new, whose listing changed,
+    or that were ingested after the watermark.  The first run reports the
+    whole catalog as added.
+
+    The manifest is only saved once a run succeeds, so a failed run
+    reports the same changes again next time.  Likewise a track that
+    /gettracks does not return keeps its old manifest entry, and is
+    reported by a later run.
+
+    :param client: An initialized instance of :class:`harvestmedia.api.client.Client`
+    :param store: a :class:`harvestmedia.api.store.FileStore` to keep \
+    the manifest and watermark in
+    :param key: the key they are kept under in `store`
+    :param batch_size: the most track ids in one /gettracks request
+    :param max_workers: the most requests in flight at once, defaults to \
+    the client's `max_workers`
+
+    """
+
+    def __init__(self, client, store, key='catalog-sync', batch_size=None, max_workers=None):
+        self.client = client
+        self.store = store
+        self.key = key
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+    def load(self):
+        """Returns the saved ``(manifest, watermark)``, where `manifest`
+        maps album ids to a dictionary of track id to fingerprint"""
+
+        saved = self.store.load(self.key)
+        return saved.get('albums', {}), saved.get('watermark')
+
+    def _list_catalog(self):
+        libraries = Library.query.get_libraries(self.client)
+        library_albums = self.client.map(
+                            lambda library: Album.query.get_albums_for_library(library.id, self.client),
+                            libraries, max_workers=self.max_workers)
+
+        album_ids = [album.id for albums in library_albums for album in albums]
+        return Track.query.get_tracks_for_albums(album_ids, self.client, get_full_detail=False,
+                                                 max_workers=self.max_workers)
+
+    def sync(self, dry_run=False):
+        """Compares the catalog with the manifest and returns a list of
+        :class:`SyncEvent`, removals first
+
+        :param dry_run: if True, the manifest and watermark are left as they were
+
+        """
+
+        manifest, watermark = self.load()
+        watermark_dt = datetime.datetime.strptime(watermark, DATE_FORMAT) if watermark else None
+        latest = watermark_dt
+
+        album_tracks = self._list_catalog()
+
+        events = []
+        to_fetch = {}
+        new_manifest = {}
+        ingested_dates = {}
+
+        for album_id, tracks in album_tracks.items():
+            known = manifest.get(album_id, {})
+            current = new_manifest[album_id] = {}
+
+            for track in tracks:
+                fingerprint = current[track.id] = _fingerprint(track)
+
+                ingested = track.dateingested
+                if isinstance(ingested, datetime.datetime):
+                    ingested_dates[track.id] = ingested
+                    reingested = watermark_dt is not None and ingested > watermark_dt
+                else:
+                    reingested = False
+
+                if track.id not in known:
+                    to_fetch[track.id] = (ADDED, album_id)
+                elif known[track.id] != fingerprint or reingested:
+                    to_fetch[track.id] = (CHANGED, album_id)
+
+            for track_id in known:
+                if track_id not in current:
+                    events.append(SyncEvent(REMOVED, track_id, album_id))
+
+        for album_id, known in manifest.items():
+            if album_id not in new_manifest:
+                for track_id in known:
+                    events.append(SyncEvent(REMOVED, track_id, album_id))
+
+        # a track that moved between albums is a change, not a removal
+        moved = set(track_id for track_id, (kind, album_id) in to_fetch.items() if kind == ADDED) & \
+                set(event.track_id for event in events)
+        if moved:
+            events = [event for event in events if event.track_id not in moved]
+            for track_id in moved:
+                to_fetch[track_id] = (CHANGED, to_fetch[track_id][1])
+
+        fetched = set()
+        if to_fetch:
+            # in catalog order, so events come out in a stable order
+            track_ids = [track.id for tracks in album_tracks.values() for track in tracks
+                         if track.id in to_fetch]
+            for track in Track.query.get_tracks(track_ids, self.client, batch_size=self.batch_size,
+                                                max_workers=self.max_workers):
+                if track.id not in to_fetch or track.id in fetched:
+                    continue
+                fetched.add(track.id)
+                kind, album_id = to_fetch[track.id]
+                events.append(SyncEvent(kind, track.id, album_id, track))
+
+        # tracks Harvest Media did not return keep their old entries, so
+        # the next sync tries them again
+        for track_id, (kind, album_id) in to_fetch.items():
+            if track_id in fetched:
+                continue
+            del new_manifest[album_id][track_id]
+            for known_album_id, known in manifest.items():
+                if track_id in known:
+                    new_manifest.setdefault(known_album_id, {})[track_id] = known[track_id]
+
+        for track_id, ingested in ingested_dates.items():
+            if track_id in to_fetch and track_id not in fetched:
+                continue
+            if latest is None or ingested > latest:
+                latest = ingested
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('catalog sync: %s added, %s changed, %s removed' % \
+                            tuple(len([e for e in events if e.kind == kind])
+                                  for kind in (ADDED, CHANGED, REMOVED)))
+
+        if not dry_run:
+            self.store.save(self.key, albums=new_manifest,
+                            watermark=latest.strftime(DATE_FORMAT) if latest else None)
+
+        return events
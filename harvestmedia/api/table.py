@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# stands in for an empty or invalid number
+MISSING = -1
+
+
+def _to_number(value):
+    if value is None or value == '':
+        return MISSING
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def _to_datetimes(values):
+    try:
+        return numpy.array(values, dtype='datetime64[s]')
+    except ValueError:
+        # fall back to one at a time, so a bad value only loses itself
+        converted = []
+        for value in values:
+            try:
+                converted.append(numpy.datetime64(value, 's'))
+            except ValueError:
+                converted.append(numpy.datetime64('NaT'))
+        return numpy.array(converted, dtype='datetime64[s]')
+
+
+class TrackTable(object):
+    """Holds tracks column by column in NumPy arrays, for filtering,
+    sorting and grouping without a Python loop over the tracks::
+
+        table = Track.query.get_track_table(track_ids, client)
+        upbeat = table.filter(bpm=(120, None), genre=['Pop / Rock', 'Electronic'])
+        upbeat = upbeat.sort_by('lengthseconds', descending=True)
+        table.group_by('genre', 'lengthseconds', how='mean')
+
+    Numeric columns are int64, with :data:`MISSING` (-1) where a track
+    had no number, and `dateingested` is ``datetime64[s]``, with NaT.
+    Text columns are dictionary encoded: the column holds int32 codes
+    into the list of its distinct values in :attr:`values`, and -1 where
+    a track had none.
+
+    TrackTable needs NumPy, which is an optional dependency: install the
+    ``harvestmedia[table]`` extra.
+
+    :param ids: the track ids, in row order
+    :param columns: a dictionary of column name to array
+    :param values: a dictionary of text column name to its distinct values
+
+    """
+
+    NUMERIC_COLUMNS = ('tracknumber', 'bpm', 'lengthseconds', 'bitrate', 'frequency')
+    DATE_COLUMNS = ('dateingested',)
+    TEXT_COLUMNS = ('genre', 'composer', 'publisher', 'albumid')
+
+    def __init__(self, ids, columns, values):
+        if numpy is None:
+            raise ImportError('TrackTable needs numpy, install harvestmedia[table]')
+
+        self.ids = ids
+        self.columns = columns
+        self.values = values
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds a table from dictionaries of track attributes, as strings
+        from the XML or as typed :class:`harvestmedia.api.track.Track`
+        values"""
+
+        if numpy is None:
+            raise ImportError('TrackTable needs numpy, install harvestmedia[table]')
+
+        ids = []
+        numbers = dict((name, []) for name in cls.NUMERIC_COLUMNS)
+        dates = dict((name, []) for name in cls.DATE_COLUMNS)
+        codes = dict((name, []) for name in cls.TEXT_COLUMNS)
+        encodings = dict((name, {}) for name in cls.TEXT_COLUMNS)
+
+        for row in rows:
+            ids.append(row.get('id'))
+            for name in cls.NUMERIC_COLUMNS:
+                numbers[name].append(_to_number(row.get(name)))
+            for name in cls.DATE_COLUMNS:
+                dates[name].append(row.get(name) or None)
+            for name in cls.TEXT_COLUMNS:
+                value = row.get(name)
+                if value is None or value == '':
+                    codes[name].append(-1)
+                else:
+                    encoding = encodings[name]
+                    code = encoding.get(value)
+                    if code is None:
+                        code = encoding[value] = len(encoding)
+                    codes[name].append(code)
+
+        columns = {}
+        for name, column in numbers.items():
+            columns[name] = numpy.array(column, dtype=numpy.int64)
+        for name, column in dates.items():
+            columns[name] = _to_datetimes(column)
+        for name, column in codes.items():
+            columns[name] = numpy.array(column, dtype=numpy.int32)
+
+        values = {}
+        for name, encoding in encodings.items():
+            distinct = [None] * len(encoding)
+            for value, code in encoding.items():
+                distinct[code] = value
+            values[name] = distinct
+
+        return cls(numpy.array(ids, dtype=object), columns, values)
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        """Builds a table from :class:`harvestmedia.api.track.Track` objects"""
+
+        names = ('id',) + cls.NUMERIC_COLUMNS + cls.DATE_COLUMNS + cls.TEXT_COLUMNS
+        return cls.from_rows(dict((name, getattr(track, name)) for name in names)
+                             for track in tracks)
+
+    @classmethod
+    def from_xml(cls, xml_tracks):
+        """Builds a table straight from ``<track>`` elements, without
+        making a :class:`harvestmedia.api.track.Track` for each"""
+
+        return cls.from_rows(xml_track.attrib for xml_track in xml_tracks)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def track_ids(self):
+        return self.ids.tolist()
+
+    def decode(self, name):
+        """Returns the values of a text column, with None where a track
+        had none"""
+
+        distinct = numpy.array(self.values[name] + [None], dtype=object)
+        # code -1 picks the None on the end
+        return distinct[self.columns[name]].tolist()
+
+    def take(self, rows):
+        """Returns a table of the given rows, a boolean mask or an array
+        of row numbers"""
+
+        return TrackTable(self.ids[rows],
+                          dict((name, column[rows]) for name, column in self.columns.items()),
+                          self.values)
+
+    def _codes(self, name, values):
+        distinct = self.values[name]
+        lookup = dict((value, code) for code, value in enumerate(distinct))
+        return [lookup[value] for value in values if value in lookup]
+
+    def where(self, **conditions):
+        """Returns the boolean mask of the rows meeting every condition.
+        A numeric or date column takes a ``(low, high)`` tuple, inclusive,
+        where either may be None.  A text column takes a value or a list
+        of values.  Missing numbers and dates never match a range."""
+
+        mask = numpy.ones(len(self.ids), dtype=bool)
+
+        for name, condition in conditions.items():
+            column = self.columns[name]
+            if name in self.TEXT_COLUMNS:
+                if isinstance(condition, basestring):
+                    condition = [condition]
+                mask &= numpy.in1d(column, self._codes(name, condition))
+                continue
+
+            low, high = condition
+            if name in self.DATE_COLUMNS:
+                mask &= ~numpy.isnat(column)
+                if low is not None:
+                    mask &= column >= numpy.datetime64(low, 's')
+                if high is not None:
+                    mask &= column <= numpy.datetime64(high, 's')
+            else:
+                mask &= column != MISSING
+                if low is not None:
+                    mask &= column >= low
+                if high is not None:
+                    mask &= column <= high
+
+        return mask
+
+    def filter(self, **conditions):
+        """Returns a table of the rows meeting the conditions of :meth:`where`"""
+
+        return self.take(self.where(**conditions))
+
+    def sort_by(self, name, descending=False):
+        """Returns the table sorted on a column.  Ties keep their order,
+        text columns sort by value, and missing values go last."""
+
+        column = self.columns[name]
+        if name in self.TEXT_COLUMNS:
+            # rank the codes by their values; missing ranks after them all
+            order = sorted(range(len(self.values[name])), key=self.values[name].__getitem__)
+            ranks = numpy.empty(len(order) + 1, dtype=numpy.int64)
+            ranks[order] = numpy.arange(len(order))
+            ranks[-1] = len(order)
+            keys = ranks[column]
+            missing = column == -1
+        elif name in self.DATE_COLUMNS:
+            keys = column.astype(numpy.int64)
+            missing = numpy.isnat(column)
+        else:
+            keys = column
+            missing = column == MISSING
+
+        if descending:
+            keys = -keys
+        # the last key passed to lexsort is the primary one
+        rows = numpy.lexsort((keys, missing))
+        return self.take(rows)
+
+    def group_by(self, name, column=None, how='count'):
+        """Returns an ``OrderedDict`` of each value of a text column to an
+        aggregate of its rows, in order of the values.  Values with no
+        rows are left out.
+
+        :param name: the text column to group on
+        :param column: the numeric column to aggregate, not needed to count
+        :param how: one of ``count``, ``sum``, ``mean``, ``min`` or ``max``. \
+        Missing numbers are left out of all but ``count``.
+
+        """
+
+        if how not in ('count', 'sum', 'mean', 'min', 'max'):
+            raise ValueError('unknown aggregate: %s' % how)
+
+        codes = self.columns[name]
+        size = len(self.values[name])
+        present = codes >= 0
+        if how != 'count':
+            data = self.columns[column]
+            present &= data != MISSING
+            data = data[present]
+        codes = codes[present]
+
+        counts = numpy.bincount(codes, minlength=size)
+        if how == 'count':
+            results = counts
+        elif how in ('sum', 'mean'):
+            results = numpy.bincount(codes, weights=data, minlength=size)
+            if how == 'mean':
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    results = results / counts
+        elif how == 'min':
+            results = numpy.full(size, numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+            numpy.minimum.at(results, codes, data)
+        else:
+            results = numpy.full(size, numpy.iinfo(numpy.int64).min, dtype=numpy.int64)
+            numpy.maximum.at(results, codes, data)
+
+        return OrderedDict(sorted((value, result) for value, result, count in
+                                  zip(self.values[name], results.tolist(), counts) if count))
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
+import _strptime  # strptime's own lazy import of this is not thread-safe
+import datetime
 import xml.etree.cElementTree as ET
+from collections import OrderedDict
 
 from .category import Category
 from .exceptions import MissingParameter
-from .util import DictObj
+from .instrumentation import charges_models, timed_model
+from .resilience import RetryPolicy
+from .table import TrackTable
 
 import exceptions
 
@@ -14,6 +19,16 @@ class TrackQuery(object):
 
     """
 
+    # the most track ids sent in one /gettracks request
+    batch_size = 200
+
+    # how many times a /gettracks batch that fails is sent again
+    batch_retries = 2
+
+    # the delays between those retries when the client has no retry_policy
+    batch_retry_policy = RetryPolicy()
+
+    @charges_models
     def get_tracks_for_album(self, album_id, _client, get_full_detail=True):
         """Gets all of the tracks for a particular album.
 
@@ -44,25 +59,129 @@ class TrackQuery(object):
         else:
             return track_list
 
-    def get_tracks(self, track_ids, _client):
+    def get_tracks_for_albums(self, album_ids, _client, get_full_detail=True,
+                                batch_size=None, max_workers=None):
+        """Gets the tracks of several albums at once.  The album track
+        lists are fetched concurrently and, for full detail, the ids from
+        every album are then fetched together by :meth:`get_tracks`, so a
+        whole library takes one request per album plus a few batches
+        rather than two requests per album.
+
+        Returns an ``OrderedDict`` of album id to the list of its tracks,
+        in the order of `album_ids`.
+
+        :param album_ids: A list of Harvest Media album identifers
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+        :param get_full_detail: if True, gets all of the details for every track
+        :param batch_size: the most ids per /gettracks request
+        :param max_workers: the most requests in flight at once, defaults \
+        to the client's `max_workers`
+
+        """
+
+        album_ids = list(OrderedDict.fromkeys(album_ids))
+        album_tracks = _client.map(lambda album_id: self.get_tracks_for_album(album_id, _client, False),
+                                   album_ids, max_workers=max_workers)
+
+        if get_full_detail:
+            track_ids = [track.id for tracks in album_tracks for track in tracks]
+            tracks_by_id = dict((track.id, track) for track in
+                                self.get_tracks(track_ids, _client, batch_size, max_workers))
+            album_tracks = [[tracks_by_id[track.id] for track in tracks if track.id in tracks_by_id]
+                            for tracks in album_tracks]
+
+        return OrderedDict(zip(album_ids, album_tracks))
+
+    def get_tracks(self, track_ids, _client, batch_size=None, max_workers=None):
         """Takes a list of track ids and returns a list of
-        :class:`harvestmedia.api.track.Track` objects.
+        :class:`harvestmedia.api.track.Track` objects, each track once, in
+        the order its id first appears in `track_ids`.
+
+        Long lists are split into batches of `batch_size` ids that are
+        fetched concurrently with :meth:`harvestmedia.api.client.Client.map`.
+        A batch that times out or gets a 5xx response is sent again up to
+        `batch_retries` times, after the delays of the client's
+        `retry_policy` or of `batch_retry_policy`; batches that succeeded
+        are not.
 
         :param track_ids: A list of track identifiers to fetch from Harvest
         :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+        :param batch_size: the most ids per request, defaults to `batch_size`
+        :param max_workers: the most batches in flight at once, defaults \
+        to the client's `max_workers`
 
         """
 
-        method_uri = '/gettracks/{{service_token}}'
-        xml_data = ET.Element('tracks')
-        xml_data.set('fulldetail', 'true')
+        unique_ids, batch_tracks = self._fetch_batches(track_ids, _client, self._post_tracks,
+                                                       batch_size, max_workers)
 
-        for track_id in track_ids:
-            xml_track = ET.Element('track')
-            xml_track.text = track_id
-            xml_data.append(xml_track)
+        # tracks the API repeats, or sends without being asked for, are dropped
+        tracks_by_id = {}
+        for tracks in batch_tracks:
+            for track in tracks:
+                tracks_by_id.setdefault(track.id, track)
 
-        xml_post_body = ET.tostring(xml_data)
+        return [tracks_by_id[track_id] for track_id in unique_ids
+                if track_id in tracks_by_id]
+
+    def get_track_table(self, track_ids, _client, batch_size=None, max_workers=None):
+        """Like :meth:`get_tracks`, but returns a
+        :class:`harvestmedia.api.table.TrackTable` built straight from the
+        XML, without making a :class:`Track` for each track.  Needs NumPy.
+
+        :param track_ids: A list of track identifiers to fetch from Harvest
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+        :param batch_size: the most ids per request, defaults to `batch_size`
+        :param max_workers: the most batches in flight at once, defaults \
+        to the client's `max_workers`
+
+        """
+
+        unique_ids, batch_rows = self._fetch_batches(track_ids, _client, self._post_track_rows,
+                                                     batch_size, max_workers)
+
+        rows_by_id = OrderedDict()
+        for rows in batch_rows:
+            for row in rows:
+                rows_by_id.setdefault(row.get('id'), row)
+
+        return TrackTable.from_rows(rows_by_id[track_id] for track_id in unique_ids
+                                    if track_id in rows_by_id)
+
+    def _fetch_batches(self, track_ids, _client, post, batch_size=None, max_workers=None):
+        """Splits the unique ids in `track_ids` into batches, calls `post`
+        with each concurrently, retrying failed batches, and returns the
+        unique ids along with the results of each batch"""
+
+        batch_size = batch_size or self.batch_size
+        unique_ids = list(OrderedDict.fromkeys(track_ids))
+        batches = [unique_ids[start:start + batch_size]
+                   for start in range(0, len(unique_ids), batch_size)]
+
+        results = _client.map(lambda batch: self._get_tracks_batch(batch, _client, post),
+                              batches, max_workers=max_workers)
+        return unique_ids, results
+
+    def _get_tracks_batch(self, track_ids, _client, post):
+        retry_policy = _client.retry_policy or self.batch_retry_policy
+        attempt = 0
+        while True:
+            try:
+                return post(track_ids, _client)
+            except exceptions.APITimeoutError:
+                if attempt >= self.batch_retries:
+                    raise
+            except exceptions.InvalidAPIResponse, e:
+                # a bad request or a parse error would only fail again
+                if attempt >= self.batch_retries or e.code is None or e.code < 500:
+                    raise
+            retry_policy.sleep(attempt)
+            attempt += 1
+
+    @charges_models
+    def _post_tracks(self, track_ids, _client):
+        method_uri = '/gettracks/{{service_token}}'
+        xml_post_body = self._get_tracks_post_body(track_ids)
 
         xml_data = _client.post_xml(method_uri, xml_post_body)
         xml_tracks = xml_data.find('tracks')
@@ -75,6 +194,68 @@ class TrackQuery(object):
 
         return tracks
 
+    def _post_track_rows(self, track_ids, _client):
+        method_uri = '/gettracks/{{service_token}}'
+        xml_post_body = self._get_tracks_post_body(track_ids)
+
+        xml_data = _client.post_xml(method_uri, xml_post_body)
+        xml_tracks = xml_data.find('tracks')
+        if xml_tracks is None:
+            return []
+        return [dict(xml_track.attrib) for xml_track in xml_tracks]
+
+    def iter_tracks(self, track_ids, _client):
+        """Like :meth:`get_tracks`, but parses the response incrementally and
+        yields each :class:`harvestmedia.api.track.Track` as soon as it is read,
+        so memory use does not grow with the number of tracks.
+
+        :param track_ids: A list of track identifiers to fetch from Harvest
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        method_uri = '/gettracks/{{service_token}}'
+        xml_post_body = self._get_tracks_post_body(track_ids)
+
+        for xml_track in _client.iter_xml(method_uri, 'tracks/track', xml_post_body):
+            yield Track._from_xml(xml_track, _client)
+
+    def iter_tracks_for_album(self, album_id, _client, get_full_detail=True):
+        """Like :meth:`get_tracks_for_album`, but yields the tracks one at a
+        time as they are parsed.
+
+        :param album_id: The Harvest Media album identifer
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+        :param get_full_detail: if True, sends a second request to get all of \
+        the details for every track on the album
+
+        """
+
+        method_uri = '/getalbumtracks/{{service_token}}/' + album_id
+        xml_tracks = _client.iter_xml(method_uri, 'tracks/track')
+
+        if not get_full_detail:
+            for xml_track in xml_tracks:
+                yield Track._from_xml(xml_track, _client)
+            return
+
+        track_ids = [xml_track.get('id') for xml_track in xml_tracks]
+        if track_ids:
+            for track in self.iter_tracks(track_ids, _client):
+                yield track
+
+    def _get_tracks_post_body(self, track_ids):
+        xml_data = ET.Element('tracks')
+        xml_data.set('fulldetail', 'true')
+
+        for track_id in track_ids:
+            xml_track = ET.Element('track')
+            xml_track.text = track_id
+            xml_data.append(xml_track)
+
+        return ET.tostring(xml_data)
+
+    @charges_models
     def get_by_id(self, track_id, _client):
         """Takes takes a single track id and returns a
         :class:`harvestmedia.api.track.Track` object.
@@ -112,22 +293,170 @@ class TrackQuery(object):
 
         return download_url
 
+    def get_tracks_for_album_async(self, album_id, _client, get_full_detail=True):
+        """Asynchronous version of :meth:`get_tracks_for_album`.  Returns a result
+        handle whose ``get()`` returns the list of tracks.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_tracks_for_album, album_id, _client, get_full_detail)
+
+    def get_tracks_for_albums_async(self, album_ids, _client, get_full_detail=True):
+        """Asynchronous version of :meth:`get_tracks_for_albums`.  Returns a
+        result handle whose ``get()`` returns the dictionary of tracks.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_tracks_for_albums, album_ids, _client, get_full_detail)
+
+    def get_tracks_async(self, track_ids, _client):
+        """Asynchronous version of :meth:`get_tracks`.  Returns a result
+        handle whose ``get()`` returns the list of tracks.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
+
+        return _client.submit(self.get_tracks, track_ids, _client)
+
+    def get_by_id_async(self, track_id, _client):
+        """Asynchronous version of :meth:`get_by_id`.  Returns a result
+        handle whose ``get()`` returns the track.
+
+        :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
+
+        """
 
-class Track(DictObj):
+        return _client.submit(self.get_by_id, track_id, _client)
+
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _to_int(value):
+    return int(value)
+
+
+def _from_int(value):
+    return str(value)
+
+
+def _to_datetime(value):
+    return datetime.datetime.strptime(value, DATE_FORMAT)
+
+
+def _from_datetime(value):
+    return value.strftime(DATE_FORMAT)
+
+
+class Track(object):
     """ Represents a Harvest Media track asset
 
+    Tracks are kept in memory by the million, so unlike the other models
+    they use ``__slots__`` rather than an instance dictionary.  The
+    numeric attributes are ints and `dateingested` is a datetime; values
+    that are empty or do not convert are kept as given.  Attributes Harvest
+    Media adds in future go to an overflow dictionary, and, as with the
+    other models, reading an attribute that was never set returns None.
+
+    A track built for a client with `lazy_models` keeps its XML element
+    and converts each attribute, and its categories, the first time they
+    are read.
+
     :param _client: An initialized instance of :class:`harvestmedia.api.client.Client`
 
     """
 
     query = TrackQuery()
 
+    # the attributes Harvest Media sends for a track
+    FIELDS = ('id', 'albumid', 'tracknumber', 'name', 'displaytitle', 'time',
+              'lengthseconds', 'comment', 'composer', 'publisher', 'genre',
+              'keywords', 'tempo', 'instrumentation', 'bpm', 'mixout',
+              'frequency', 'bitrate', 'dateingested')
+
+    # attribute: (from the XML string, back to the XML string)
+    TYPED_FIELDS = {
+        'tracknumber': (_to_int, _from_int),
+        'lengthseconds': (_to_int, _from_int),
+        'bpm': (_to_int, _from_int),
+        'frequency': (_to_int, _from_int),
+        'bitrate': (_to_int, _from_int),
+        'dateingested': (_to_datetime, _from_datetime),
+    }
+
+    # low-cardinality values shared by many tracks
+    INTERNED_FIELDS = frozenset(['albumid', 'composer', 'publisher', 'genre', 'mixout', 'tempo',
+                                 'instrumentation'])
+
+    __slots__ = FIELDS + ('categories', '_client', '_overflow', '_xml_data')
+
     def __init__(self, _client):
 
         self.categories = []
         self._client = _client
+        self._overflow = None
+        self._xml_data = None
+
+    def __getattr__(self, attr):
+        # only called for unset slots and unknown attributes
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        if attr in ('_overflow', '_xml_data'):
+            return None
+
+        if self._overflow and attr in self._overflow:
+            return self._overflow[attr]
+
+        xml_data = self._xml_data
+        if xml_data is not None:
+            if attr == 'categories':
+                self.categories = self._build_categories(xml_data)
+                return self.categories
+
+            value = xml_data.get(attr)
+            if value is not None:
+                self._set_xml_attribute(attr, value)
+                return getattr(self, attr)
+
+        return None
+
+    def __setattr__(self, attr, value):
+        try:
+            object.__setattr__(self, attr, value)
+        except AttributeError:
+            if self._overflow is None:
+                object.__setattr__(self, '_overflow', {})
+            self._overflow[attr] = value
+
+    def __delattr__(self, attr):
+        try:
+            object.__delattr__(self, attr)
+        except AttributeError:
+            if not self._overflow or attr not in self._overflow:
+                raise
+            del self._overflow[attr]
+
+    def _set_xml_attribute(self, attribute, value):
+        """Sets an attribute from its XML string, converting it to its type"""
+
+        converters = self.TYPED_FIELDS.get(attribute)
+        if converters is not None and value:
+            try:
+                value = converters[0](value)
+            except ValueError:
+                pass
+        elif attribute in self.INTERNED_FIELDS and type(value) is str:
+            value = intern(value)
+
+        setattr(self, attribute, value)
 
     @classmethod
+    @timed_model
     def _from_xml(cls, xml_data, _client):
         """Internally-used classmethod to create an instance of :class:`Track` from
         the XML returned by Harvest Media. Converts all attributes 
@@ -147,21 +476,73 @@ class Track(DictObj):
 
         """
 
+        if getattr(_client, 'lazy_models', False):
+            instance = cls.__new__(cls)
+            instance._client = _client
+            instance._overflow = None
+            instance._xml_data = xml_data
+            return instance
+
         instance = cls(_client)
         for attribute, value in xml_data.items():
-            setattr(instance, attribute, value)
-
-        categories = xml_data.find('categories')
-        if categories is not None:
-            for category in categories.getchildren():
-                instance.categories.append(Category._from_xml(category, _client=_client))
+            instance._set_xml_attribute(attribute, value)
 
+        instance.categories = instance._build_categories(xml_data)
         return instance
 
-    def as_dict(self):
-        """Returns the dictionary representation of this Track"""
+    def _build_categories(self, xml_data):
+        categories = []
+        xml_categories = xml_data.find('categories')
+        if xml_categories is not None:
+            for category in xml_categories.getchildren():
+                categories.append(Category._from_xml(category, _client=self._client))
+        return categories
 
-        return dict([(k, v) for k, v in self.__dict__.items()])
+    def _materialize(self):
+        """Converts everything a lazy track has not read yet, and lets
+        go of its XML element"""
+
+        xml_data = self._xml_data
+        if xml_data is None:
+            return
+
+        for attribute, value in xml_data.items():
+            try:
+                object.__getattribute__(self, attribute)
+            except AttributeError:
+                if not self._overflow or attribute not in self._overflow:
+                    self._set_xml_attribute(attribute, value)
+
+        try:
+            object.__getattribute__(self, 'categories')
+        except AttributeError:
+            self.categories = self._build_categories(xml_data)
+
+        self._xml_data = None
+
+    def as_dict(self):
+        """Returns the dictionary representation of this Track.  Typed
+        attributes are given as the strings Harvest Media sent."""
+
+        self._materialize()
+
+        track_dict = {}
+        for attribute in self.__slots__:
+            if attribute in ('_overflow', '_xml_data'):
+                continue
+            try:
+                value = object.__getattribute__(self, attribute)
+            except AttributeError:
+                continue
+
+            converters = self.TYPED_FIELDS.get(attribute)
+            if converters is not None and value is not None and not isinstance(value, basestring):
+                value = converters[1](value)
+            track_dict[attribute] = value
+
+        if self._overflow:
+            track_dict.update(self._overflow)
+        return track_dict
 
     def get_waveform_url(self, width=None, height=None):
         """Generates a URL that can be used to fetch the
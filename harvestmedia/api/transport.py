@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import ssl
+import threading
+from urlparse import urlsplit
+
+from .pool import ConnectionPool, HTTPConnectionPool
+
+
+class Transport(object):
+    """The interface a :class:`harvestmedia.api.client.Client` uses to
+    send requests.  Implementations must be safe to call from several
+    threads at once.
+
+    """
+
+    def request(self, url, method='GET', body=None, headers=None):
+        """Sends a request and returns a ``(response, content)`` tuple,
+        where ``response.status`` is the HTTP status code and `content`
+        is the response body as a string.  Socket timeouts must be raised
+        as :class:`socket.timeout`.
+
+        """
+
+        raise NotImplementedError
+
+    def close(self):
+        """Closes any connections held by the transport"""
+
+        pass
+
+
+class Httplib2Transport(Transport):
+    """Sends requests with ``httplib2``, reusing keep-alive connections
+    through a :class:`harvestmedia.api.pool.ConnectionPool`.  This is the
+    default transport.
+
+    :param max_size: the maximum number of idle ``httplib2.Http`` instances
+    :param idle_timeout: seconds an idle instance is kept before it is closed
+    :param http_kwargs: passed through to every new ``httplib2.Http``
+
+    """
+
+    def __init__(self, max_size=4, idle_timeout=60, **http_kwargs):
+        self.pool = ConnectionPool(max_size=max_size, idle_timeout=idle_timeout, **http_kwargs)
+
+    def request(self, url, method='GET', body=None, headers=None):
+        return self.pool.request(url, method, body, headers)
+
+    def close(self):
+        self.pool.clear()
+
+
+class PooledTransport(Transport):
+    """Sends requests over plain ``httplib`` connections held in one
+    :class:`harvestmedia.api.pool.HTTPConnectionPool` per host, much like
+    urllib3's ``PoolManager``.  It avoids the per-request overhead of
+    ``httplib2``, which only matters at high request rates.
+
+    :param max_size: the maximum number of idle connections per host
+    :param idle_timeout: seconds an idle connection is kept before it is closed
+    :param timeout: the socket timeout, in seconds
+    :param disable_ssl_certificate_validation: skip certificate checks \
+    for https, as the default transport does
+
+    """
+
+    def __init__(self, max_size=4, idle_timeout=60, timeout=None,
+                    disable_ssl_certificate_validation=False):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        if disable_ssl_certificate_validation:
+            self.ssl_context = ssl._create_unverified_context()
+        else:
+            self.ssl_context = ssl.create_default_context()
+
+        self.pools = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, scheme, host):
+        key = (scheme, host)
+        with self._lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = self.pools[key] = HTTPConnectionPool(scheme, host,
+                                                            max_size=self.max_size,
+                                                            idle_timeout=self.idle_timeout,
+                                                            timeout=self.timeout,
+                                                            ssl_context=self.ssl_context)
+        return pool
+
+    def request(self, url, method='GET', body=None, headers=None):
+        scheme, host, path, query, fragment = urlsplit(url)
+        if query:
+            path += '?' + query
+
+        return self.get_pool(scheme, host).urlopen(method, path, body, headers)
+
+    def close(self):
+        with self._lock:
+            pools = self.pools.values()
+
+        for pool in pools:
+            pool.clear()
+
+
+class MemoryResponse(object):
+
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+    def get(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class MemoryTransport(Transport):
+    """Hands requests straight to an in-process application instead of
+    the network, e.g. a :class:`harvestmedia.api.fakeserver.FakeHarvestMedia`.
+    Useful for tests and for profiling the client without any I/O.
+
+    :param app: a callable taking ``(method, path, body)`` and returning \
+    a ``(status, content)`` tuple, where `path` is the URL path and query
+
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def request(self, url, method='GET', body=None, headers=None):
+        scheme, host, path, query, fragment = urlsplit(url)
+        if query:
+            path += '?' + query
+
+        with self._lock:
+            self.requests += 1
+
+        status, content = self.app(method, path, body)
+        return MemoryResponse(status), content
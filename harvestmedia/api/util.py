@@ -1,11 +1,127 @@
 # -*- coding: utf-8 -*-
+import sys
+import threading
 
 
 class DictObj(object):
 
     """
     a dict-like object that provides dot-notation access to its values
+
+    A model built by :meth:`_from_xml_lazy` holds on to its XML element
+    instead.  Its attributes are copied from the element the first time
+    one is missed, and each collection named in `_lazy_collections` is
+    built by its method the first time it is read.
     """
 
+    # {attribute: name of the method building it from the XML element}
+    _lazy_collections = {}
+
     def __getattr__(self, attr):
+        xml_data = self.__dict__.get('_xml_data')
+        if xml_data is not None and not attr.startswith('__'):
+            builder = self._lazy_collections.get(attr)
+            if builder is not None:
+                value = self.__dict__[attr] = getattr(self, builder)(xml_data)
+                return value
+
+            if not self.__dict__.get('_fields_loaded'):
+                self.__dict__['_fields_loaded'] = True
+                for name, value in self._get_fields(xml_data):
+                    self.__dict__.setdefault(name, value)
+
         return self.__dict__.get(attr)
+
+    @classmethod
+    def _from_xml_lazy(cls, xml_data, _client):
+        """Returns an instance that builds itself from `xml_data` as it
+        is used, rather than up front"""
+
+        instance = cls.__new__(cls)
+        instance._client = _client
+        instance._xml_data = xml_data
+        return instance
+
+    def _get_fields(self, xml_data):
+        """Returns the ``(name, value)`` attribute pairs of the model's
+        XML element"""
+
+        return xml_data.items()
+
+    def _load_fields(self, xml_data):
+        for name, value in self._get_fields(xml_data):
+            setattr(self, name, value)
+
+    def _materialize(self):
+        """Builds everything a lazy instance has not built yet, and lets
+        go of its XML element"""
+
+        xml_data = self.__dict__.get('_xml_data')
+        if xml_data is None:
+            return
+
+        for attr in self._lazy_collections:
+            getattr(self, attr)
+        if not self.__dict__.get('_fields_loaded'):
+            for name, value in self._get_fields(xml_data):
+                self.__dict__.setdefault(name, value)
+
+        del self.__dict__['_xml_data']
+        self.__dict__.pop('_fields_loaded', None)
+
+
+def get_endpoint(method_uri):
+    """Returns the endpoint part of a method URI, e.g. ``/getalbums``
+    for ``/getalbums/{{service_token}}/abc123``"""
+
+    return '/' + method_uri.lstrip('/').split('/', 1)[0]
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+
+    """
+    runs at most one call per key at a time; callers that arrive while
+    a call for their key is in flight wait for it and share its result
+    (or its exception) instead of making their own
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.exc_info is not None:
+                raise flight.exc_info[0], flight.exc_info[1], flight.exc_info[2]
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+        except Exception:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
@@ -10,5 +10,6 @@ setup(
       url='https://github.com/ralfonso/harvestmedia',
       description='An interface for the Harvest Media API (http://www.harvestmedia.net/)',
       install_requires=['httplib2', 'cElementTree', 'pytz', 'iso8601', ],
+      extras_require={'table': ['numpy']},
       keywords='Harvest HarvestMedia API Media Music',
 )
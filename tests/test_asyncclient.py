@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import mock
+from nose.tools import raises
+
+import harvestmedia.api.exceptions
+from harvestmedia.api.asyncclient import AsyncClient
+from harvestmedia.api.album import Album
+from harvestmedia.api.track import Track
+
+from utils import build_http_mock, init_client
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_get_tracks_async(HttpMock):
+    client = init_client(client_class=AsyncClient, max_workers=2)
+
+    return_values = [
+        (200, """<responsetracks>
+                    <tracks>
+                        <track name="Guerilla Pop" albumid="1c5f47572d9152f3" id="17376d36f309f18d" />
+                        <track name="Hat And Feather" albumid="1c5f47572d9152f3" id="635f90a4db673855" />
+                    </tracks>
+                </responsetracks>"""),
+    ]
+
+    http = build_http_mock(HttpMock, responses=return_values)
+
+    result = Track.query.get_tracks_async(['17376d36f309f18d', '635f90a4db673855'], client)
+    tracks = result.get(timeout=5)
+    client.close()
+
+    assert [t.id for t in tracks] == ['17376d36f309f18d', '635f90a4db673855']
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_concurrent_album_queries(HttpMock):
+    client = init_client(client_class=AsyncClient, max_workers=4)
+    content = """<responsealbums>
+                    <albums>
+                        <album name="Sample Album" id="809a809a8b8ab81" />
+                    </albums>
+                </responsealbums>"""
+    http = build_http_mock(HttpMock, content=content)
+
+    results = [Album.query.get_albums_for_library_async(str(i), client) for i in range(10)]
+    albums = [result.get(timeout=5) for result in results]
+    client.close()
+
+    assert len(albums) == 10
+    assert all(a[0].id == '809a809a8b8ab81' for a in albums)
+
+
+@raises(harvestmedia.api.exceptions.InvalidAPIResponse)
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_get_xml_async_error(HttpMock):
+    client = init_client(client_class=AsyncClient)
+    http = build_http_mock(HttpMock, response_status=500, content='')
+
+    try:
+        client.get_xml_async('/getlibraries/{{service_token}}').get(timeout=5)
+    finally:
+        client.close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import mock
+import time
+
+from harvestmedia.api.cache import FileCache, MemoryCache, SharedCache
+from harvestmedia.api.library import Library
+
+from utils import build_http_mock, init_client, with_tempdir
+
+
+LIBRARIES_XML = """<ResponseLibraries>
+                    <libraries>
+                        <library id="abc123" name="VIDEOHELPER" detail="Library description" />
+                    </libraries>
+                </ResponseLibraries>"""
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_get_xml_cached(HttpMock):
+    client = init_client(cache=MemoryCache())
+    http = build_http_mock(HttpMock, responses=[(200, LIBRARIES_XML)])
+
+    first = Library.query.get_libraries(client)
+    second = Library.query.get_libraries(client)
+
+    assert http.request.call_count == 1
+    assert first[0].id == second[0].id == 'abc123'
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_cache_key_survives_token_rotation(HttpMock):
+    client = init_client(cache=MemoryCache())
+    http = build_http_mock(HttpMock, responses=[(200, LIBRARIES_XML)])
+
+    Library.query.get_libraries(client)
+    client.config.service_token.token = 'rotated'
+    Library.query.get_libraries(client)
+
+    assert http.request.call_count == 1
+    assert client._cache_key('/getlibraries/{{service_token}}') in client.cache._entries
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_cache_key_scoped_to_api_key(HttpMock):
+    cache = MemoryCache()
+    client = init_client(cache=cache)
+    other = init_client(api_key='other-key', cache=cache)
+    http = build_http_mock(HttpMock, content=LIBRARIES_XML)
+
+    Library.query.get_libraries(client)
+    Library.query.get_libraries(other)
+    Library.query.get_libraries(client)
+
+    assert http.request.call_count == 2
+    assert len(cache) == 2
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_uncached_endpoint(HttpMock):
+    client = init_client(cache=MemoryCache(), cache_ttls={'/getlibraries': None})
+    http = build_http_mock(HttpMock, content=LIBRARIES_XML)
+
+    Library.query.get_libraries(client)
+    Library.query.get_libraries(client)
+
+    assert http.request.call_count == 2
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_invalidate_cache(HttpMock):
+    client = init_client(cache=MemoryCache())
+    http = build_http_mock(HttpMock, content=LIBRARIES_XML)
+
+    Library.query.get_libraries(client)
+    client.invalidate_cache('/getlibraries/{{service_token}}')
+    Library.query.get_libraries(client)
+
+    assert http.request.call_count == 2
+
+
+def test_memory_cache_lru():
+    cache = MemoryCache(max_entries=2)
+    cache.set('a', '1', 60)
+    cache.set('b', '2', 60)
+    cache.get('a')
+    cache.set('c', '3', 60)
+
+    assert cache.get('a') == '1'
+    assert cache.get('b') is None
+    assert cache.get('c') == '3'
+
+
+def test_memory_cache_ttl():
+    cache = MemoryCache()
+    cache.set('a', '1', 60)
+
+    with mock.patch('harvestmedia.api.cache.time.time', return_value=time.time() + 120):
+        assert cache.get('a') is None
+
+
+@with_tempdir
+def test_file_cache(directory):
+    cache = FileCache(directory, max_entries=1)
+    cache.set('/getlibraries/{{service_token}}', LIBRARIES_XML, 60)
+    assert cache.get('/getlibraries/{{service_token}}') == LIBRARIES_XML
+
+    cache.set('/getcategories/{{service_token}}', '<categories />', 60)
+    assert len([k for k in ('/getlibraries/{{service_token}}', '/getcategories/{{service_token}}')
+                if cache.get(k) is not None]) == 1
+
+    cache.clear()
+    assert cache.get('/getcategories/{{service_token}}') is None
+
+
+def test_shared_cache():
+    store = {}
+    backend = mock.Mock()
+    backend.get.side_effect = store.get
+    backend.set.side_effect = lambda key, value, ttl: store.__setitem__(key, value)
+    backend.delete.side_effect = lambda key: store.pop(key, None)
+
+    cache = SharedCache(backend)
+    cache.set('/getlibraries/{{service_token}}', LIBRARIES_XML, 60)
+    assert cache.get('/getlibraries/{{service_token}}') == LIBRARIES_XML
+
+    cache.clear()
+    assert cache.get('/getlibraries/{{service_token}}') is None
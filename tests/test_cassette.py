@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import os
+from nose.tools import raises
+
+import harvestmedia.api.exceptions
+from harvestmedia.api.cassette import RecordingTransport, ReplayTransport, redact_path
+from harvestmedia.api.fakeserver import FakeCatalog, FakeHarvestMedia
+from harvestmedia.api.member import Member
+from harvestmedia.api.playlist import Playlist
+from harvestmedia.api.track import Track
+from harvestmedia.api.transport import MemoryTransport
+
+from utils import init_fake_client, with_tempdir
+
+
+def record(path, catalog, api_key='secret-api-key'):
+    transport = RecordingTransport(path, MemoryTransport(FakeHarvestMedia(catalog)))
+    client = init_fake_client(api_key=api_key, transport=transport)
+    return client, transport
+
+
+def test_redact_path():
+    assert redact_path('/HMP-WS.svc/getalbums/abc123/def456') == '/getalbums/{{service_token}}/def456'
+    assert redact_path('/HMP-WS.svc/getlibraries/abc123') == '/getlibraries/{{service_token}}'
+    assert redact_path('/HMP-WS.svc/authenticatemember/abc123/jane/s3cret') == \
+            '/authenticatemember/{{service_token}}/{{username}}/{{password}}'
+    assert redact_path('/HMP-WS.svc/sendmemberpassword/abc123/jane') == \
+            '/sendmemberpassword/{{service_token}}/{{username}}'
+
+
+@with_tempdir
+def test_record_and_replay(tempdir):
+    path = os.path.join(tempdir, 'catalog.cassette')
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=3)
+    member_id = sorted(catalog.members.keys())[0]
+    track_ids = sorted(catalog.tracks.keys())
+
+    client, transport = record(path, catalog)
+    recorded_tracks = Track.query.get_tracks(track_ids, client)
+    recorded_playlists = Playlist.query.get_member_playlists(member_id, client)
+    recorded_member = Member.query.get_by_id(member_id, client)
+    client.close()
+
+    # the service info, tracks, playlists and member, but not the token
+    assert transport.records == 4
+    content = open(path, 'rb').read()
+    assert 'secret-api-key' not in content
+    assert client.config.service_token.token not in content
+
+    replay = ReplayTransport(path)
+    client = init_fake_client(api_key='another-key', transport=replay)
+
+    tracks = Track.query.get_tracks(track_ids, client)
+    assert [track.id for track in tracks] == [track.id for track in recorded_tracks]
+    assert tracks[0].categories[0].name == recorded_tracks[0].categories[0].name
+
+    playlists = Playlist.query.get_member_playlists(member_id, client)
+    assert [playlist.id for playlist in playlists] == [playlist.id for playlist in recorded_playlists]
+
+    member = Member.query.get_by_id(member_id, client)
+    assert member.username == recorded_member.username
+    assert client.config.trackformats
+
+    client.close()
+
+
+@with_tempdir
+def test_replay_in_recorded_order(tempdir):
+    path = os.path.join(tempdir, 'catalog.cassette')
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=1, members=1)
+    member_id = catalog.members.keys()[0]
+
+    client, transport = record(path, catalog)
+    Playlist.query.get_member_playlists(member_id, client)
+    catalog.playlists[member_id].pop()
+    Playlist.query.get_member_playlists(member_id, client)
+    client.close()
+
+    client = init_fake_client(api_key='another-key', transport=ReplayTransport(path))
+    counts = [len(Playlist.query.get_member_playlists(member_id, client)) for i in range(3)]
+    assert counts == [2, 1, 1]
+
+
+@with_tempdir
+def test_member_credentials_not_recorded(tempdir):
+    path = os.path.join(tempdir, 'member.cassette')
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, members=1)
+    member = catalog.members.values()[0]
+    member['password'] = 'not-on-disk'
+
+    client, transport = record(path, catalog)
+    Member.authenticate(member['username'], member['password'], client)
+    client.close()
+
+    content = open(path, 'rb').read()
+    assert 'not-on-disk' not in content
+    assert '/authenticatemember/{{service_token}}/{{username}}/{{password}}' in content
+
+    client = init_fake_client(api_key='another-key', transport=ReplayTransport(path))
+    authenticated = Member.authenticate(member['username'], member['password'], client)
+    assert authenticated.id == member['id']
+
+
+@raises(harvestmedia.api.exceptions.CassetteMiss)
+@with_tempdir
+def test_replay_miss(tempdir):
+    path = os.path.join(tempdir, 'empty.cassette')
+    client, transport = record(path, FakeCatalog(libraries=1, albums_per_library=1))
+    client.close()
+
+    client = init_fake_client(api_key='another-key', transport=ReplayTransport(path))
+    Member.query.get_by_id('abc123', client)
@@ -6,12 +6,14 @@ from nose.tools import raises
 import os
 import StringIO
 import textwrap
+import time
 import xml.etree.cElementTree as ET
 
 import harvestmedia.api.exceptions
 from harvestmedia.api.category import Category
+from harvestmedia.api.track import Track
 
-from utils import build_http_mock, get_random_md5, init_client
+from utils import build_http_mock, get_random_md5, init_client, init_fake_client
 
 
 @mock.patch('harvestmedia.api.client.httplib2.Http')
@@ -27,3 +29,103 @@ def test_get_categories(HttpMock):
     client_categories = len(categories)
     assert categories_in_xml == client_categories, 'Category counts do not match %s != %s' % \
                                                     (categories_in_xml, client_categories)
+
+
+def test_lazy_category():
+    client = init_client()
+    client.lazy_models = True
+    client.category_registry = None
+    category_xml = ET.fromstring("""<category name="Instrumentation" id="1a2b3c4d5e6f7a8b">
+                                      <attributes>
+                                        <attribute name="Energy" id="da2362b0e30b131f">
+                                          <attributes><attribute name="1 - Calm" id="6185334915adc56b" /></attributes>
+                                        </attribute>
+                                      </attributes>
+                                    </category>""")
+
+    category = Category._from_xml(category_xml, client)
+    assert category.name == 'Instrumentation'
+    assert 'attributes' not in category.__dict__
+
+    attribute = category.attributes[0].attributes[0]
+    assert attribute.name == 'Calm'
+    assert attribute.value == '1'
+
+
+def test_categories_interned():
+    client = init_client(intern_categories=True)
+    track_template = """<track id="%s" name="Track">
+                          <categories>
+                            <category name="Instrumentation" id="1a2b3c4d5e6f7a8b">
+                              <attributes>
+                                <attribute name="Keyboards" id="da2362b0e30b131f">
+                                  <attributes><attribute name="%s" id="%s" /></attributes>
+                                </attribute>
+                              </attributes>
+                            </category>
+                          </categories>
+                        </track>"""
+
+    first = Track._from_xml(ET.fromstring(track_template % ('1', 'Piano', '6185334915adc56b')), client)
+    second = Track._from_xml(ET.fromstring(track_template % ('2', 'Piano', '6185334915adc56b')), client)
+    third = Track._from_xml(ET.fromstring(track_template % ('3', '2 - Organ', '98098098a0c8')), client)
+
+    assert first.categories[0] is second.categories[0]
+    assert first.categories[0] is not third.categories[0]
+    assert (client.category_registry.hits, client.category_registry.misses) == (3, 6)
+
+    organ = third.categories[0].attributes[0].attributes[0]
+    assert (organ.value, organ.name) == ('2', 'Organ')
+    assert [a.name for a in first.categories[0].attributes[0].attributes] == ['Piano']
+
+
+def test_categories_not_interned():
+    client = init_client()
+    track_xml = ET.fromstring("""<track id="1"><categories>
+                                   <category name="Instrumentation" id="1a2b3c4d5e6f7a8b" />
+                                 </categories></track>""")
+
+    first = Track._from_xml(track_xml, client)
+    second = Track._from_xml(track_xml, client)
+    assert first.categories[0] is not second.categories[0]
+
+
+def test_category_tree():
+    client = init_fake_client()
+    tree = Category.query.get_category_tree(client)
+
+    instrumentation = tree.find_by_path('Instrumentation')
+    keyboards = tree.find_by_path(['Instrumentation', 'Keyboards'])
+    piano = tree.find_by_path('instrumentation > keyboards > piano')
+    calm = tree.find_by_path('Tuning > Energy > Calm')
+
+    assert tree.get(piano.id) is piano
+    assert tree.get_parent(piano.id) is keyboards
+    assert tree.get_parent(instrumentation.id) is None
+    assert tree.get_path(piano.id) == 'Instrumentation > Keyboards > Piano'
+    assert tree.find_by_name('piano') == [piano]
+
+    assert tree.get_ancestor_ids(piano.id) == frozenset([instrumentation.id, keyboards.id])
+    assert piano.id in tree.get_descendant_ids(instrumentation.id)
+    assert tree.is_under(piano.id, instrumentation.id)
+    assert not tree.is_under(calm.id, instrumentation.id)
+    assert not tree.is_under(instrumentation.id, piano.id)
+
+    # 2 categories, 6 groups and 18 attributes
+    assert len(tree) == 26
+
+
+def test_category_tree_cached():
+    client = init_fake_client(category_tree_ttl=60)
+    requests = client.transport.app.requests
+
+    tree = Category.query.get_category_tree(client)
+    assert Category.query.get_category_tree(client) is tree
+    assert requests['getcategories'] == 1
+
+    with mock.patch('harvestmedia.api.category.time.time', return_value=time.time() + 120):
+        assert Category.query.get_category_tree(client) is not tree
+    assert requests['getcategories'] == 2
+
+    Category.query.get_category_tree(client, refresh=True)
+    assert requests['getcategories'] == 3
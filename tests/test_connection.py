@@ -7,12 +7,15 @@ from nose.tools import raises
 import pytz
 import StringIO
 import textwrap
+import threading
+import time
 import xml.etree.cElementTree as ET
 
 import harvestmedia.api.exceptions
 from harvestmedia.api.library import Library
+from harvestmedia.api.member import Member
 
-from utils import build_http_mock, get_random_md5, init_client
+from utils import build_http_mock, build_request_rv, get_random_md5, init_client
 
 
 @mock.patch('harvestmedia.api.client.httplib2.Http')
@@ -119,6 +122,9 @@ def test_invalid_remote_token(HttpMock):
                 </memberaccount>"""),
     ]
 
+    # the rejected token is replaced once and the request retried
+    return_values += return_values
+
     http = build_http_mock(HttpMock, responses=return_values)
     client = harvestmedia.api.client.Client(api_key=api_key)
     libraries = Library.get_libraries(client)
@@ -210,3 +216,241 @@ def test_expired_token_refetch(HttpMock):
 
     # token should match the SECOND token
     assert client.config.service_token.token == test_second_token
+
+
+def test_map_preserves_order():
+    client = init_client()
+    results = client.map(lambda i: i * 2, range(20), max_workers=4)
+    assert results == [i * 2 for i in range(20)]
+
+
+@raises(ValueError)
+def test_map_raises():
+    client = init_client()
+
+    def fail_on_three(i):
+        if i == 3:
+            raise ValueError(i)
+        return i
+
+    client.map(fail_on_three, range(5), max_workers=2)
+
+
+def test_submit():
+    client = init_client()
+    result = client.submit(sum, [1, 2, 3])
+    assert result.get(timeout=5) == 6
+    client.close()
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_concurrent_token_refresh(HttpMock):
+    expiry = datetime.datetime.now() + datetime.timedelta(hours=22)
+    test_second_token = get_random_md5()
+
+    client = init_client()
+    client.config.service_token.expiry = (datetime.datetime.now() - datetime.timedelta(hours=12)).isoformat()
+
+    token_content = """<?xml version="1.0" encoding="utf-8"?>
+                        <responseservicetoken>
+                            <token value="%s" expiry="%s"/>
+                        </responseservicetoken>""" % \
+                        (test_second_token, expiry.strftime("%Y-%m-%dT%H:%M:%S"))
+    libraries_content = """<ResponseLibraries><libraries /></ResponseLibraries>"""
+
+    http = HttpMock()
+    urls = []
+
+    def request(url, *args):
+        urls.append(url)
+        if '/getservicetoken/' in url:
+            return build_request_rv(200, token_content)
+        return build_request_rv(200, libraries_content)
+
+    http.request.side_effect = request
+
+    client.map(lambda i: client.get_xml('/getlibraries/{{service_token}}'), range(16), max_workers=8)
+
+    assert len([url for url in urls if '/getservicetoken/' in url]) == 1
+    assert client.config.service_token.token == test_second_token
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_invalid_token_refreshed(HttpMock):
+    expiry = datetime.datetime.now() + datetime.timedelta(hours=22)
+    test_second_token = get_random_md5()
+
+    client = init_client()
+
+    return_values = [
+         (200, """<ResponseLibraries>
+                    <error>
+                        <code>5</code>
+                        <description>Invalid Token</description>
+                    </error>
+                </ResponseLibraries>"""),
+         (200, """<?xml version="1.0" encoding="utf-8"?>
+                    <responseservicetoken>
+                        <token value="%s" expiry="%s"/>
+                    </responseservicetoken>""" % \
+                    (test_second_token, expiry.strftime("%Y-%m-%dT%H:%M:%S"))),
+         (200, """<ResponseLibraries>
+                    <libraries>
+                        <library id="abc123" name="VIDEOHELPER" detail="Library description" />
+                    </libraries>
+                </ResponseLibraries>"""),
+    ]
+
+    http = build_http_mock(HttpMock, responses=return_values)
+    libraries = Library.query.get_libraries(client)
+
+    assert libraries[0].id == 'abc123'
+    assert client.config.service_token.token == test_second_token
+    assert test_second_token in http.request.call_args[0][0]
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_early_token_refresh(HttpMock):
+    expiry = datetime.datetime.now() + datetime.timedelta(hours=22)
+    test_second_token = get_random_md5()
+
+    client = init_client()
+    client.token_refresh_margin = 24 * 60 * 60
+    first_token = client.config.service_token.token
+
+    http = HttpMock()
+    urls = []
+
+    def request(url, *args):
+        urls.append(url)
+        if '/getservicetoken/' in url:
+            return build_request_rv(200, """<?xml version="1.0" encoding="utf-8"?>
+                    <responseservicetoken>
+                        <token value="%s" expiry="%s"/>
+                    </responseservicetoken>""" % \
+                    (test_second_token, expiry.strftime("%Y-%m-%dT%H:%M:%S")))
+        return build_request_rv(200, """<ResponseLibraries><libraries /></ResponseLibraries>""")
+
+    http.request.side_effect = request
+
+    client.get_xml('/getlibraries/{{service_token}}')
+
+    # the request went out with the current token while the refresh ran
+    assert [url for url in urls if '/getlibraries/' in url and first_token in url]
+    client._token_refresh_result.get(timeout=5)
+    assert client.config.service_token.token == test_second_token
+    assert len([url for url in urls if '/getservicetoken/' in url]) == 1
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_lazy_client(HttpMock):
+    expiry = datetime.datetime.now() + datetime.timedelta(hours=22)
+    test_token = get_random_md5()
+
+    http = HttpMock()
+    urls = []
+
+    def request(url, *args):
+        urls.append(url)
+        if '/getservicetoken/' in url:
+            return build_request_rv(200, """<?xml version="1.0" encoding="utf-8"?>
+                    <responseservicetoken>
+                        <token value="%s" expiry="%s"/>
+                    </responseservicetoken>""" % \
+                    (test_token, expiry.strftime("%Y-%m-%dT%H:%M:%S")))
+        if '/getserviceinfo/' in url:
+            return build_request_rv(200, """<?xml version="1.0" encoding="utf-8"?>
+                    <responseserviceinfo>
+                        <asseturl
+                            albumart="http://asset.harvestmedia.net/albumart/8185d768cd8fcaa7/{id}/{width}/{height}"
+                            waveform="http://asset.harvestmedia.net/waveform/8185d768cd8fcaa7/{id}/{width}/{height}" />
+                        <trackformats>
+                          <trackformat identifier="8185d768cd8fcaa7" extension="mp3" bitrate="320" samplerate="48" samplesize="16" />
+                        </trackformats>
+                    </responseserviceinfo>""")
+        return build_request_rv(200, """<ResponseLibraries><libraries /></ResponseLibraries>""")
+
+    http.request.side_effect = request
+
+    client = harvestmedia.api.client.Client(api_key=get_random_md5(), lazy=True)
+    assert urls == []
+
+    Library.query.get_libraries(client)
+    assert len(urls) == 2
+    assert test_token in urls[1]
+
+    assert client.config.get_format_identifier('mp3') == '8185d768cd8fcaa7'
+    assert client.config.waveform_url.startswith('http://asset.harvestmedia.net/waveform/')
+    assert len(urls) == 3
+    assert '/getserviceinfo/' in urls[2]
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_coalesced_requests(HttpMock):
+    client = init_client()
+
+    http = HttpMock()
+    release = threading.Event()
+
+    def request(url, *args):
+        release.wait(5)
+        return build_request_rv(200, """<ResponseLibraries>
+                    <libraries>
+                        <library id="abc123" name="VIDEOHELPER" detail="Library description" />
+                    </libraries>
+                </ResponseLibraries>""")
+
+    http.request.side_effect = request
+
+    results = [client.submit(Library.query.get_libraries, client) for i in range(5)]
+
+    # hold the first request open until every other caller has joined it
+    for i in range(500):
+        if client.coalesced_requests == 4:
+            break
+        time.sleep(0.01)
+    release.set()
+
+    libraries = [result.get(timeout=5) for result in results]
+    client.close()
+
+    assert http.request.call_count == 1
+    assert client.coalesced_requests == 4
+    assert all(l[0].id == 'abc123' for l in libraries)
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_writes_are_not_coalesced(HttpMock):
+    client = init_client()
+
+    http = HttpMock()
+    release = threading.Event()
+    arrived = []
+
+    def request(url, *args):
+        arrived.append(url)
+        release.wait(5)
+        return build_request_rv(200, """<responsecode>
+                    <code>OK</code>
+                </responsecode>""")
+
+    http.request.side_effect = request
+
+    member_id = get_random_md5()
+    track_id = get_random_md5()
+    results = [client.submit(Member.query.add_favourite, member_id, track_id, client)
+               for i in range(3)]
+
+    # every write must reach the server, not join the first one
+    for i in range(500):
+        if len(arrived) == 3:
+            break
+        time.sleep(0.01)
+    release.set()
+
+    for result in results:
+        result.get(timeout=5)
+    client.close()
+
+    assert http.request.call_count == 3
+    assert client.coalesced_requests == 0
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import os
+from nose.tools import raises
+
+import harvestmedia.api.exceptions
+from harvestmedia.api.crawler import CatalogCrawler
+from harvestmedia.api.fakeserver import FakeCatalog, FakeHarvestMedia
+from harvestmedia.api.store import FileStore
+
+from utils import init_fake_client, with_tempdir
+
+
+def test_crawl():
+    catalog = FakeCatalog(libraries=3, albums_per_library=4, tracks_per_album=5)
+    app = FakeHarvestMedia(catalog)
+    progress = []
+
+    crawler = CatalogCrawler(init_fake_client(app=app), batch_size=50,
+                             progress_callback=lambda p: progress.append(p.albums_done))
+    records = list(crawler.crawl())
+
+    assert sorted(track.id for library, album, track in records) == sorted(catalog.tracks.keys())
+    for library, album, track in records:
+        assert track.albumid == album.id
+        assert album.id in [a['id'] for a in catalog.albums[library.id]]
+        assert track.categories
+
+    assert crawler.progress.libraries == 3
+    assert crawler.progress.albums_done == 12
+    assert crawler.progress.tracks == 60
+    assert progress == range(1, 13)
+
+    # 60 tracks fit in far fewer /gettracks calls than one per album
+    assert app.requests['getalbumtracks'] == 12
+    assert app.requests['gettracks'] < 12
+
+
+def test_crawl_summary_only():
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=3)
+    app = FakeHarvestMedia(catalog)
+
+    crawler = CatalogCrawler(init_fake_client(app=app), get_full_detail=False)
+    assert len(list(crawler.crawl())) == 6
+    assert 'gettracks' not in app.requests
+
+
+@with_tempdir
+def test_crawl_resumes_from_checkpoint(tempdir):
+    catalog = FakeCatalog(libraries=2, albums_per_library=3, tracks_per_album=2)
+    checkpoint = FileStore(os.path.join(tempdir, 'crawl.json'))
+
+    crawler = CatalogCrawler(init_fake_client(catalog), checkpoint=checkpoint, checkpoint_interval=1)
+    records = crawler.crawl()
+    first = [next(records) for i in range(5)]
+    records.close()
+
+    # two albums were finished before the crawl stopped
+    assert len(checkpoint.load('catalog-crawl')['completed_albums']) == 2
+
+    crawler = CatalogCrawler(init_fake_client(catalog), checkpoint=checkpoint)
+    rest = list(crawler.crawl())
+
+    assert crawler.progress.albums_skipped == 2
+    seen = set(track.id for library, album, track in first[:4] + rest)
+    assert seen == set(catalog.tracks.keys())
+    assert len(rest) == 8
+
+
+@raises(harvestmedia.api.exceptions.InvalidAPIResponse)
+def test_crawl_error():
+    app = FakeHarvestMedia(FakeCatalog(libraries=2, albums_per_library=2))
+
+    def failing_app(method, path, body):
+        if '/getalbumtracks/' in path:
+            return 500, ''
+        return app(method, path, body)
+
+    crawler = CatalogCrawler(init_fake_client(app=failing_app))
+    list(crawler.crawl())
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import mock
+
+import harvestmedia.api.facets
+from harvestmedia.api.category import Attribute, Category
+from harvestmedia.api.facets import FacetIndex, iter_ordinals, popcount
+from harvestmedia.api.fakeserver import FakeCatalog
+from harvestmedia.api.track import Track
+
+from utils import init_fake_client
+
+
+def make_track(track_id, *attribute_ids):
+    category = Category(None)
+    category.id = 'mood'
+    for attribute_id in attribute_ids:
+        attribute = Attribute(None)
+        attribute.id = attribute_id
+        category.attributes.append(attribute)
+
+    track = Track(None)
+    track.id = track_id
+    track.categories = [category]
+    return track
+
+
+def build_index():
+    facets = FacetIndex()
+    facets.add_tracks([
+        make_track('1', 'piano', 'uplifting'),
+        make_track('2', 'piano', 'uplifting', 'vocals'),
+        make_track('3', 'piano', 'dark'),
+        make_track('4', 'guitar', 'uplifting'),
+    ])
+    return facets
+
+
+def test_bitmap_helpers():
+    assert list(iter_ordinals(0)) == []
+    assert list(iter_ordinals((1 << 70) | (1 << 9) | 1)) == [0, 9, 70]
+    assert popcount((1 << 70) | 5) == 3
+
+
+def test_select():
+    facets = build_index()
+
+    selected = facets.select(all_of=['piano', 'uplifting'], none_of=['vocals'])
+    assert facets.track_ids(selected) == ['1']
+
+    assert facets.track_ids(facets.select(any_of=['dark', 'guitar'])) == ['3', '4']
+    assert facets.track_ids(facets.select(all_of=['uplifting'], any_of=['guitar', 'vocals'])) == ['2', '4']
+    assert facets.select(all_of=['piano', 'missing']) == 0
+    assert facets.count(facets.select(all_of=['mood'])) == 4
+
+    piano = facets.bitmap('piano')
+    assert facets.track_ids(facets.negate(piano)) == ['4']
+    assert facets.track_ids(facets.select(all_of=['uplifting'], within=piano), limit=1) == ['1']
+
+
+def test_facet_counts():
+    facets = build_index()
+
+    counts = facets.facet_counts(facets.bitmap('uplifting'))
+    assert counts == {'mood': 3, 'piano': 2, 'uplifting': 3, 'vocals': 1, 'guitar': 1}
+    assert facets.facet_counts(node_ids=['dark', 'missing']) == {'dark': 1}
+
+
+def test_incremental_updates():
+    facets = build_index()
+    assert facets.count(facets.bitmap('piano')) == 3
+
+    facets.add(make_track('5', 'piano', 'uplifting'))
+    facets.add(make_track('1', 'guitar'))
+    assert len(facets) == 5
+    assert facets.track_ids(facets.select(all_of=['piano', 'uplifting'])) == ['2', '5']
+    assert facets.track_ids(facets.bitmap('guitar')) == ['4', '1']
+
+    facets.remove('2')
+    facets.remove('missing')
+    assert facets.track_ids(facets.bitmap('piano')) == ['3', '5']
+    assert facets.facet_counts(node_ids=['vocals']) == {}
+
+    facets.compact()
+    assert facets.live == 0b1111
+    assert facets.track_ids(facets.bitmap('piano')) == ['3', '5']
+    assert facets.track_ids(facets.bitmap('guitar')) == ['4', '1']
+
+
+def test_replacing_tracks_flushes_once():
+    facets = build_index()
+    assert facets.count(facets.bitmap('piano')) == 3
+
+    to_bitmap = harvestmedia.api.facets._to_bitmap
+    with mock.patch('harvestmedia.api.facets._to_bitmap', wraps=to_bitmap) as built:
+        facets.add_tracks([make_track('1', 'guitar'), make_track('3', 'guitar'),
+                           make_track('2', 'piano')])
+        facets.remove('4')
+        assert not built.called
+
+        assert facets.track_ids(facets.bitmap('piano')) == ['2']
+        assert facets.track_ids(facets.bitmap('guitar')) == ['1', '3']
+        calls = built.call_count
+        facets.select(all_of=['guitar'], none_of=['piano'])
+        assert built.call_count == calls
+
+
+def test_tracks_from_api_with_tree():
+    catalog = FakeCatalog(libraries=1, albums_per_library=3, tracks_per_album=5)
+    client = init_fake_client(catalog)
+    tree = Category.query.get_category_tree(client)
+
+    facets = FacetIndex(tree)
+    facets.add_tracks(Track.query.get_tracks(catalog.tracks.keys(), client))
+
+    category, group, attribute = catalog.tracks.values()[0]['_attributes'][0]
+    path = ' > '.join([category['name'], group['name'], attribute['name']])
+    expected = set(track['id'] for track in catalog.tracks.values()
+                   if attribute in [leaf for c, g, leaf in track['_attributes']])
+
+    assert set(facets.track_ids(facets.bitmap(path))) == expected
+    assert set(facets.track_ids(facets.bitmap(attribute['id']))) == expected
+    assert facets.count(facets.bitmap(category['name'])) == 15
+    assert facets.count(facets.select(none_of=[path])) == 15 - len(expected)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import xml.etree.cElementTree as ET
+
+import harvestmedia.api.exceptions
+from harvestmedia.api.cache import MemoryCache
+from harvestmedia.api.fakeserver import FakeCatalog, FakeHarvestMedia, FakeServer
+from harvestmedia.api.instrumentation import Histogram, MetricsAggregator, RequestHook
+from harvestmedia.api.library import Library
+from harvestmedia.api.member import Member
+from harvestmedia.api.track import Track
+from harvestmedia.api.transport import PooledTransport
+
+from utils import init_fake_client
+
+
+def test_histogram_percentile():
+    histogram = Histogram((1, 2, 3, 4))
+    for value in (0.5, 1.5, 2.5, 3.5):
+        histogram.add(value)
+
+    assert histogram.count == 4
+    assert histogram.sum == 8.0
+    assert histogram.percentile(50) == 2
+    assert histogram.percentile(100) == 4
+    assert histogram.cumulative_counts() == [(1, 1), (2, 2), (3, 3), (4, 4), ('+Inf', 4)]
+
+
+def test_metrics_per_endpoint():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=4)
+    metrics = MetricsAggregator()
+    client = init_fake_client(catalog, hooks=[metrics])
+
+    tracks = Track.query.get_tracks(sorted(catalog.tracks.keys()), client)
+    assert len(tracks) == 4
+
+    assert metrics.requests[('/gettracks', 200)] == 1
+    assert metrics.histogram('/gettracks', 'wall_time').count == 1
+    assert metrics.histogram('/gettracks', 'parse_time').count == 1
+    assert metrics.histogram('/gettracks', 'bytes').sum > 0
+
+    # one sample per track, the categories count towards their track
+    assert metrics.histogram('/gettracks', 'model_time').count == 4
+
+    # the memory transport cannot tell when the first byte arrived
+    assert metrics.histogram('/gettracks', 'ttfb') is None
+
+    summary = metrics.summary()
+    assert summary['/gettracks']['wall_time']['count'] == 1
+    assert summary['/gettracks']['wall_time']['p95'] is not None
+
+
+def test_metrics_streamed():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=3)
+    metrics = MetricsAggregator()
+    client = init_fake_client(catalog, hooks=[metrics])
+
+    album_id = catalog.albums[catalog.libraries[0]['id']][0]['id']
+    tracks = list(Track.query.iter_tracks_for_album(album_id, client, get_full_detail=False))
+    assert len(tracks) == 3
+
+    assert metrics.histogram('/getalbumtracks', 'parse_time').count == 1
+    assert metrics.histogram('/getalbumtracks', 'model_time').count == 3
+
+
+def test_metrics_cache_hits():
+    metrics = MetricsAggregator()
+    client = init_fake_client(FakeCatalog(libraries=2), hooks=[metrics], cache=MemoryCache())
+
+    Library.query.get_libraries(client)
+    Library.query.get_libraries(client)
+
+    assert metrics.cache_hits['/getlibraries'] == 1
+    assert metrics.histogram('/getlibraries', 'wall_time').count == 1
+    assert metrics.histogram('/getlibraries', 'parse_time').count == 2
+
+
+def test_metrics_errors():
+    metrics = MetricsAggregator()
+    client = init_fake_client(FakeCatalog(libraries=1), hooks=[metrics])
+
+    try:
+        Member.query.get_by_id('abc123', client)
+    except harvestmedia.api.exceptions.MemberDoesNotExist:
+        pass
+
+    assert metrics.errors[('/getmember', 'MemberDoesNotExist')] == 1
+
+
+def test_models_built_after_request_not_charged():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=2)
+    metrics = MetricsAggregator()
+    client = init_fake_client(catalog, hooks=[metrics], lazy_models=True)
+
+    tracks = Track.query.get_tracks(sorted(catalog.tracks.keys()), client)
+    assert metrics.histogram('/gettracks', 'model_time').count == 2
+
+    # the request finished, so neither lazily built categories nor a
+    # model built by hand count towards it
+    assert tracks[0].categories
+    Track._from_xml(ET.fromstring('<track id="abc123" name="Track" />'), client)
+    assert metrics.histogram('/gettracks', 'model_time').count == 2
+
+
+def test_coalesced_models_charged_to_shared_request():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=1)
+    app = FakeHarvestMedia(catalog)
+    release = threading.Event()
+
+    def blocking_app(method, path, body):
+        if path.startswith('/HMP-WS.svc/getlibraries/'):
+            release.wait(5)
+        return app(method, path, body)
+
+    metrics = MetricsAggregator()
+    client = init_fake_client(app=blocking_app, hooks=[metrics], coalesce_requests=True)
+    track_id = catalog.tracks.keys()[0]
+
+    def fetch():
+        # leaves this thread's last request as /gettracks
+        Track.query.get_by_id(track_id, client)
+        return Library.query.get_libraries(client)
+
+    results = [client.submit(fetch) for i in range(5)]
+    for i in range(500):
+        if client.coalesced_requests == 4:
+            break
+        time.sleep(0.01)
+    release.set()
+    assert all(len(result.get(timeout=5)) == 1 for result in results)
+    client.close()
+
+    assert metrics.requests[('/getlibraries', 200)] == 1
+    assert metrics.histogram('/getlibraries', 'model_time').count == 5
+    assert metrics.histogram('/gettracks', 'model_time').count == 5
+
+
+def test_hooks_called_in_order():
+    calls = []
+
+    class RecordingHook(RequestHook):
+        def before_request(self, event):
+            calls.append(('before', event.endpoint))
+
+        def after_request(self, event):
+            calls.append(('after', event.endpoint))
+
+    client = init_fake_client(FakeCatalog(libraries=1), hooks=[RecordingHook()])
+    calls[:] = []
+    Library.query.get_libraries(client)
+
+    assert calls == [('before', '/getlibraries'), ('after', '/getlibraries')]
+
+
+def test_prometheus_export():
+    metrics = MetricsAggregator()
+    client = init_fake_client(FakeCatalog(libraries=1), hooks=[metrics])
+    Library.query.get_libraries(client)
+
+    text = metrics.to_prometheus()
+    assert '# TYPE harvestmedia_request_seconds histogram' in text
+    assert 'harvestmedia_requests_total{endpoint="/getlibraries",status="200"} 1' in text
+    assert 'harvestmedia_request_seconds_bucket{endpoint="/getlibraries",le="+Inf"} 1' in text
+    assert 'harvestmedia_request_seconds_count{endpoint="/getlibraries"} 1' in text
+
+
+def test_ttfb_over_http():
+    with FakeServer() as server:
+        metrics = MetricsAggregator()
+        client = init_fake_client(webservice_url=server.url, transport=PooledTransport(),
+                                  hooks=[metrics])
+        Library.query.get_libraries(client)
+        client.close()
+
+    assert metrics.histogram('/getlibraries', 'ttfb').count == 1
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import datetime
+import mock
+import os
+
+from harvestmedia.api.category import Category
+from harvestmedia.api.crawler import CatalogCrawler
+from harvestmedia.api.fakeserver import FakeCatalog, FakeHarvestMedia
+from harvestmedia.api.mirror import CatalogMirror
+from harvestmedia.api.store import FileStore
+from harvestmedia.api.sync import CatalogSync
+from harvestmedia.api.track import Track
+
+from utils import init_fake_client, with_tempdir
+
+
+def build_client(catalog):
+    app = FakeHarvestMedia(catalog)
+    return init_fake_client(app=app), app
+
+
+def build_mirror(catalog, path=':memory:'):
+    client, app = build_client(catalog)
+    mirror = CatalogMirror(path, client)
+    mirror.import_crawl(CatalogCrawler(client).crawl())
+    return mirror, client, app
+
+
+def test_import_crawl():
+    catalog = FakeCatalog(libraries=2, albums_per_library=3, tracks_per_album=4)
+    mirror, client, app = build_mirror(catalog)
+
+    assert mirror.count_tracks() == 24
+    assert sorted(library.id for library in mirror.get_libraries()) == \
+            sorted(library['id'] for library in catalog.libraries)
+
+    library_id = catalog.libraries[0]['id']
+    albums = mirror.get_albums_for_library(library_id)
+    assert sorted(album.id for album in albums) == \
+            sorted(album['id'] for album in catalog.albums[library_id])
+    assert albums[0].name
+
+
+def test_tracks_round_trip():
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=3)
+    client, app = build_client(catalog)
+    album_id = catalog.albums[catalog.libraries[0]['id']][0]['id']
+
+    tracks = Track.query.get_tracks(catalog.album_tracks[album_id], client)
+    mirror = CatalogMirror(client=client)
+    mirror.upsert_tracks(tracks)
+
+    mirrored = mirror.get_tracks_for_album(album_id)
+    assert [track.id for track in mirrored] == catalog.album_tracks[album_id]
+
+    for track, copy in zip(tracks, mirrored):
+        assert copy.bpm == track.bpm
+        assert isinstance(copy.dateingested, datetime.datetime)
+        assert copy.dateingested == track.dateingested
+        assert copy.name == track.name
+        assert copy._client is client
+
+        assert [category.id for category in copy.categories] == \
+                [category.id for category in track.categories]
+        leaves = lambda t: [(attribute.id, [leaf.id for leaf in attribute.attributes])
+                            for category in t.categories for attribute in category.attributes]
+        assert leaves(copy) == leaves(track)
+
+
+def test_find_tracks():
+    catalog = FakeCatalog(libraries=2, albums_per_library=2, tracks_per_album=5)
+    mirror, client, app = build_mirror(catalog)
+    tracks = catalog.tracks.values()
+
+    found = mirror.find_tracks(bpm=(90, 120))
+    assert sorted(track.id for track in found) == \
+            sorted(track['id'] for track in tracks if 90 <= int(track['bpm']) <= 120)
+
+    found = mirror.find_tracks(lengthseconds=(None, 100))
+    assert sorted(track.id for track in found) == \
+            sorted(track['id'] for track in tracks if int(track['lengthseconds']) <= 100)
+
+    genre = tracks[0]['genre']
+    found = mirror.find_tracks(genre=genre, bpm=(100, None))
+    assert sorted(track.id for track in found) == \
+            sorted(track['id'] for track in tracks
+                   if track['genre'] == genre and int(track['bpm']) >= 100)
+
+    assert len(mirror.find_tracks(limit=3)) == 3
+
+
+def test_get_tracks_by_attribute():
+    catalog = FakeCatalog(libraries=1, albums_per_library=3, tracks_per_album=4)
+    mirror, client, app = build_mirror(catalog)
+
+    category, group, attribute = catalog.tracks.values()[0]['_attributes'][0]
+    expected = sorted(track['id'] for track in catalog.tracks.values()
+                      if attribute in [leaf for c, g, leaf in track['_attributes']])
+    assert sorted(track.id for track in mirror.get_tracks_by_attribute(attribute['id'])) == expected
+
+    # every track has an attribute from every group
+    assert len(mirror.get_tracks_by_attribute(group['id'])) == 12
+
+
+def test_offline_reads():
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=3)
+    mirror, client, app = build_mirror(catalog)
+    requests = sum(app.requests.values())
+
+    track_id = catalog.tracks.keys()[0]
+    assert mirror.get_track(track_id).id == track_id
+    assert mirror.get_track('missing') is None
+    assert sum(app.requests.values()) == requests
+
+
+def test_upsert_replaces():
+    check_upsert_replaces(CatalogMirror)
+
+
+@mock.patch('harvestmedia.api.mirror.sqlite3.sqlite_version_info', (3, 22, 0))
+def test_upsert_replaces_before_sqlite_upserts():
+    def build(client):
+        mirror = CatalogMirror(client=client)
+        assert not mirror._native_upserts
+        return mirror
+
+    check_upsert_replaces(build)
+
+
+def check_upsert_replaces(build):
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=4)
+    client, app = build_client(catalog)
+    album_id = catalog.albums[catalog.libraries[0]['id']][0]['id']
+    mirror = build(client=client)
+
+    tracks = Track.query.get_tracks(catalog.album_tracks[album_id], client)
+    mirror.upsert_tracks(tracks)
+    tracks[0].bpm = 999
+    tracks[0].categories = []
+    mirror.upsert_tracks(tracks[:1])
+
+    assert mirror.count_tracks() == 4
+    copy = mirror.get_track(tracks[0].id)
+    assert copy.bpm == 999
+    assert copy.categories == []
+
+    # updating a track keeps its place in the album
+    assert [track.id for track in mirror.get_tracks_for_album(album_id)] == \
+            [track.id for track in tracks]
+
+    mirror.delete_tracks([tracks[0].id])
+    assert mirror.get_tracks_for_album(album_id)[0].id == tracks[1].id
+
+
+def test_upsert_categories():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=1)
+    client, app = build_client(catalog)
+    mirror = CatalogMirror(client=client)
+    mirror.upsert_categories(Category.query.get_categories(client))
+
+    (count,), = mirror._query('SELECT COUNT(*) FROM attributes')
+    assert count == len(Category.query.get_category_tree(client)) - len(catalog.categories)
+
+
+@with_tempdir
+def test_apply_sync_events(tempdir):
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=3)
+    client, app = build_client(catalog)
+    path = os.path.join(tempdir, 'catalog.db')
+    mirror = CatalogMirror(path, client)
+    catalog_sync = CatalogSync(client, FileStore(os.path.join(tempdir, 'sync.json')))
+
+    mirror.apply_sync_events(catalog_sync.sync())
+    assert mirror.count_tracks() == 6
+
+    album_id = catalog.albums[catalog.libraries[0]['id']][0]['id']
+    removed = catalog.album_tracks[album_id].pop()
+    changed = catalog.album_tracks[album_id][0]
+    catalog.tracks[changed]['name'] = 'Renamed'
+
+    mirror.apply_sync_events(catalog_sync.sync())
+    mirror.close()
+
+    # the file keeps the mirror between runs
+    mirror = CatalogMirror(path, client)
+    assert mirror.count_tracks() == 5
+    assert mirror.get_track(removed) is None
+    assert mirror.get_track(changed).name == 'Renamed'
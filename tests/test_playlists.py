@@ -383,3 +383,44 @@ def test_get_playlist_art_url(HttpMock):
 
     expected_url = playlist_art_url.replace('{id}', playlist_id).replace('{width}', str(width)).replace('{height}', str(height))
     assert cover_art_url == expected_url
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_iter_featured_playlists(HttpMock):
+    client = init_client()
+
+    content = """<?xml version="1.0" encoding="utf-8"?>
+                     <responsefeaturedplaylists>
+                        <playlists>
+                            <playlist id="1" name="first">
+                                 <tracks>
+                                    <track name="Pencilneck Strut" id="902dea1d377473df" />
+                                </tracks>
+                            </playlist>
+                            <playlist id="2" name="second" />
+                        </playlists>
+                    </responsefeaturedplaylists>"""
+
+    http = build_http_mock(HttpMock, content=content)
+    playlists = list(Playlist.query.iter_featured_playlists(client))
+
+    assert [p.id for p in playlists] == ['1', '2']
+    assert playlists[0].tracks[0].id == '902dea1d377473df'
+
+
+def test_lazy_playlist():
+    client = init_client()
+    client.lazy_models = True
+    playlist_xml = ET.fromstring("""<playlist id="908098a8a0ba8b065" name="sample playlist">
+                                      <tracks>
+                                        <track id="17376d36f309f18d" name="Guerilla Pop" lengthseconds="170"/>
+                                        <track id="19376d36f309f18d" name="Epic Track" lengthseconds="90"/>
+                                      </tracks>
+                                    </playlist>""")
+
+    playlist = Playlist._from_xml(playlist_xml, client)
+    assert 'tracks' not in playlist.__dict__
+    assert playlist.name == 'sample playlist'
+    assert 'tracks' not in playlist.__dict__
+
+    assert [track.lengthseconds for track in playlist.tracks] == [170, 90]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import mock
+import time
+
+from harvestmedia.api.pool import ConnectionPool
+
+from utils import build_http_mock, init_client
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_connection_reused(HttpMock):
+    client = init_client()
+
+    return_values = [
+         (200, """<ResponseLibraries><libraries /></ResponseLibraries>"""),
+         (200, """<ResponseLibraries><libraries /></ResponseLibraries>"""),
+    ]
+
+    http = build_http_mock(HttpMock, responses=return_values)
+    HttpMock.reset_mock()
+    misses, hits = client.pool.misses, client.pool.hits
+
+    client.get_xml('/getlibraries/{{service_token}}')
+    client.get_xml('/getlibraries/{{service_token}}')
+
+    assert HttpMock.call_count == 1
+    assert client.pool.misses == misses + 1
+    assert client.pool.hits == hits + 1
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_pool_max_size(HttpMock):
+    pool = ConnectionPool(max_size=1)
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    pool.release(second)
+
+    assert pool.size == 1
+    assert pool.misses == 2
+    assert pool.evictions == 1
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_pool_idle_eviction(HttpMock):
+    pool = ConnectionPool(idle_timeout=10)
+    http = pool.acquire()
+    pool.release(http)
+
+    with mock.patch('harvestmedia.api.pool.time.time', return_value=time.time() + 60):
+        pool.acquire()
+
+    assert pool.hits == 0
+    assert pool.misses == 2
+    assert pool.evictions == 1
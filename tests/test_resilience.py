@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import mock
+from nose.tools import raises
+import httplib2
+import socket
+import time
+
+import harvestmedia.api.exceptions
+from harvestmedia.api.library import Library
+from harvestmedia.api.member import Member
+from harvestmedia.api.resilience import CircuitBreaker, RetryPolicy
+
+from utils import build_http_mock, build_request_rv, init_client
+
+
+LIBRARIES_XML = """<ResponseLibraries>
+                    <libraries>
+                        <library id="abc123" name="VIDEOHELPER" detail="Library description" />
+                    </libraries>
+                </ResponseLibraries>"""
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_retry_transient_get(HttpMock):
+    client = init_client(retry_policy=RetryPolicy(backoff=0))
+    http = build_http_mock(HttpMock, responses=[(503, ''), (502, ''), (200, LIBRARIES_XML)])
+
+    libraries = Library.query.get_libraries(client)
+
+    assert libraries[0].id == 'abc123'
+    assert http.request.call_count == 3
+
+
+@raises(harvestmedia.api.exceptions.InvalidAPIResponse)
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_retries_exhausted(HttpMock):
+    client = init_client(retry_policy=RetryPolicy(max_retries=1, backoff=0))
+    http = build_http_mock(HttpMock, response_status=503, content='')
+    Library.query.get_libraries(client)
+
+
+@raises(harvestmedia.api.exceptions.InvalidAPIResponse)
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_post_not_retried(HttpMock):
+    client = init_client(retry_policy=RetryPolicy(backoff=0))
+    http = build_http_mock(HttpMock, responses=[(503, ''), (200, '<responsetracks />')])
+    client.post_xml('/gettracks/{{service_token}}', '<tracks><track>17376d36f309f18d</track></tracks>')
+
+
+@raises(harvestmedia.api.exceptions.APITimeoutError)
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_timeout(HttpMock):
+    client = init_client(timeout=1)
+    http = HttpMock()
+    http.request.side_effect = socket.timeout()
+    Library.query.get_libraries(client)
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_timeout_retried(HttpMock):
+    client = init_client(timeout=1, retry_policy=RetryPolicy(backoff=0))
+    http = HttpMock()
+    responses = [socket.timeout(), (200, LIBRARIES_XML)]
+
+    def side_effect(*args):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        mock_response = mock.Mock()
+        mock_response.status = response[0]
+        return mock_response, response[1]
+
+    http.request.side_effect = side_effect
+
+    assert Library.query.get_libraries(client)[0].id == 'abc123'
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_circuit_breaker_opens(HttpMock):
+    client = init_client(circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    http = build_http_mock(HttpMock, response_status=500, content='')
+
+    for i in range(2):
+        try:
+            Library.query.get_libraries(client)
+        except harvestmedia.api.exceptions.InvalidAPIResponse:
+            pass
+
+    try:
+        Library.query.get_libraries(client)
+    except harvestmedia.api.exceptions.CircuitOpenError:
+        pass
+    else:
+        assert False, 'circuit breaker did not open'
+
+    assert http.request.call_count == 2
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_circuit_breaker_recovers(HttpMock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    client = init_client(circuit_breaker=breaker)
+    http = build_http_mock(HttpMock, responses=[(500, ''), (200, LIBRARIES_XML)])
+
+    try:
+        Library.query.get_libraries(client)
+    except harvestmedia.api.exceptions.InvalidAPIResponse:
+        pass
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with mock.patch('harvestmedia.api.resilience.time.time', return_value=time.time() + 60):
+        libraries = Library.query.get_libraries(client)
+
+    assert libraries[0].id == 'abc123'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_backoff_delay():
+    policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+    assert [policy.get_delay(attempt) for attempt in range(5)] == [1, 2, 4, 5, 5]
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_circuit_breaker_counts_transport_errors(HttpMock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    client = init_client(circuit_breaker=breaker)
+    http = HttpMock()
+    http.request.side_effect = httplib2.ServerNotFoundError('unable to find the server')
+
+    for i in range(2):
+        try:
+            Library.query.get_libraries(client)
+        except harvestmedia.api.exceptions.InvalidAPIResponse:
+            pass
+        else:
+            assert False, 'expected InvalidAPIResponse'
+        assert breaker.state == 'open'
+        # the failed half-open trial opens the breaker again
+        time.sleep(0.02)
+
+    http.request.side_effect = None
+    http.request.return_value = build_request_rv(200, LIBRARIES_XML)
+    assert Library.query.get_libraries(client)[0].id == 'abc123'
+    assert breaker.state == 'closed'
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_circuit_breaker_counts_unexpected_errors(HttpMock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    client = init_client(circuit_breaker=breaker)
+    http = HttpMock()
+    http.request.side_effect = RuntimeError('broken transport')
+
+    try:
+        Library.query.get_libraries(client)
+    except RuntimeError:
+        pass
+    assert breaker.state == 'open'
+
+
+@raises(harvestmedia.api.exceptions.InvalidAPIResponse)
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_write_get_not_retried(HttpMock):
+    client = init_client(retry_policy=RetryPolicy(backoff=0))
+    http = build_http_mock(HttpMock, responses=[(503, ''), (200, '<responsecode />')])
+    try:
+        Member.query.add_favourite('member123', 'track123', client)
+    finally:
+        assert http.request.call_count == 1
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_write_get_timeout_not_retried(HttpMock):
+    client = init_client(timeout=1, retry_policy=RetryPolicy(backoff=0))
+    http = HttpMock()
+    http.request.side_effect = socket.timeout()
+
+    try:
+        client.get_xml('/addplaylist/{{service_token}}/member123/Road%20Trip/')
+    except harvestmedia.api.exceptions.APITimeoutError:
+        pass
+    assert http.request.call_count == 1
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import mock
+import os
+from nose.tools import raises
+
+from harvestmedia.api.fakeserver import FakeCatalog
+from harvestmedia.api.search import TrackIndex, tokenize
+from harvestmedia.api.track import Track
+
+from utils import init_fake_client, with_tempdir
+
+
+def make_track(track_id, name, composer='', genre='', comment=''):
+    track = Track(None)
+    track.id = track_id
+    track.name = name
+    track.composer = composer
+    track.genre = genre
+    track.comment = comment
+    return track
+
+
+def build_index():
+    index = TrackIndex()
+    index.add_tracks([
+        make_track('1', 'Piano Dreams', composer='Ann Smith', genre='Classical'),
+        make_track('2', 'Rock Anthem', composer='Bob Jones', genre='Pop / Rock',
+                   comment='Driving guitars with a piano break'),
+        make_track('3', 'Pianola', composer='Ann Smith', genre='Jazz'),
+        make_track('4', u'Café Nights', composer='Zoë Adams', genre='Jazz'),
+    ])
+    return index
+
+
+def ids(results):
+    return [track_id for track_id, score in results]
+
+
+def test_tokenize():
+    assert tokenize('Pop / Rock') == [u'pop', u'rock']
+    assert tokenize(u'Café Nights') == [u'café', u'nights']
+    assert tokenize('Caf\xc3\xa9') == [u'café']
+    assert tokenize(None) == []
+
+
+def test_search_ranks_by_field():
+    index = build_index()
+
+    # the name counts for more than the comment
+    assert ids(index.search('piano', prefix=False)) == ['1', '2']
+    assert ids(index.search('piano')) == ['1', '3', '2']
+
+
+def test_search_requires_every_word():
+    index = build_index()
+
+    assert ids(index.search('ann jazz')) == ['3']
+    assert ids(index.search('smith rock')) == []
+    assert ids(index.search('nothing')) == []
+    assert index.search('') == []
+
+
+def test_search_prefix_and_unicode():
+    index = build_index()
+
+    assert ids(index.search('pian')) == ['3', '1', '2']
+    assert ids(index.search('pian', prefix=False)) == []
+    assert ids(index.search(u'zoë')) == ['4']
+    assert ids(index.search('caf')) == ['4']
+    assert index.expand('pi') == [u'piano', u'pianola']
+
+
+def test_search_limit():
+    index = build_index()
+
+    assert len(index.search('a', limit=2)) == 2
+    assert len(index.search('ann', limit=None)) == 2
+
+
+def test_add_replaces_and_remove():
+    index = build_index()
+
+    index.add(make_track('1', 'Organ Dreams'))
+    assert len(index) == 4
+    assert ids(index.search('piano')) == ['3', '2']
+    assert ids(index.search('organ')) == ['1']
+
+    index.remove('3')
+    index.remove('missing')
+    assert '3' not in index
+    assert ids(index.search('pian')) == ['2']
+
+    index.compact()
+    assert ids(index.search('pian')) == ['2']
+    assert ids(index.search('organ')) == ['1']
+    assert index.expand('pianola') == []
+
+
+def build_large_index(count):
+    genres = ['Pop / Rock', 'Jazz', 'Classical', 'Electronic', 'Hip Hop']
+    composers = ['Ann Smith', 'Bob Jones', 'Carl Pop']
+
+    index = TrackIndex()
+    for number in xrange(count):
+        # every name word is in one track in a thousand, each genre and
+        # composer in a large share of them
+        name = 'w%d w%d piano' % (number % 1000, number * 7 % 1001) if number % 10 == 0 \
+            else 'w%d w%d' % (number % 1000, number * 7 % 1001)
+        index.add(make_track(str(number), name, composer=composers[number % 3],
+                             genre=genres[number % 5], comment='HM Publishing'))
+    return index
+
+
+def test_search_large_index():
+    index = build_large_index(5000)
+
+    for query in ['pop', 'pop piano', 'jazz w1', 'hm publishing p', 'smith w', 'piano w1']:
+        results = index.search(query)
+        assert len(results) == 20, query
+        # stopping early finds the same tracks as ranking all of them
+        assert results == index.search(query, limit=None)[:20], query
+
+    index.remove('0')
+    assert '0' not in ids(index.search('smith piano', limit=None))
+
+
+def test_search_stops_early():
+    index = build_large_index(5000)
+
+    with mock.patch.object(index, '_intersect', wraps=index._intersect) as intersect:
+        index.search('w1', limit=None)
+        every_combination = intersect.call_count
+
+        intersect.reset_mock()
+        index.search('w1', limit=5)
+        assert 0 < intersect.call_count < every_combination
+
+
+def test_search_dense_and_sparse_tiers():
+    index = TrackIndex()
+    index.DENSE_MIN_TRACKS = 8
+    index.DENSE_RATIO = 2
+
+    # 'alpha' is dense when it is indexed; 'beta' ends up with more tracks
+    # but never has a bitmap, as it grows after the filler
+    for number in range(8):
+        index.add(make_track('a%d' % number, 'alpha beta' if number < 3 else 'alpha'))
+    for number in range(40):
+        index.add(make_track('f%d' % number, 'filler'))
+    for number in range(10):
+        index.add(make_track('b%d' % number, 'beta'))
+
+    assert ids(index.search('alpha beta')) == ['a0', 'a1', 'a2']
+    assert ids(index.search('alpha beta', limit=None)) == ['a0', 'a1', 'a2']
+
+
+@with_tempdir
+def test_snapshot(tempdir):
+    index = build_index()
+    index.remove('2')
+    path = os.path.join(tempdir, 'tracks.idx')
+    index.save(path)
+
+    loaded = TrackIndex.load(path)
+    assert len(loaded) == 3
+    assert loaded.search('piano') == index.search('piano')
+    assert loaded.search(u'café') == index.search(u'café')
+
+    loaded.add(make_track('5', 'Piano Reprise'))
+    assert ids(loaded.search('piano', prefix=False)) == ['1', '5']
+
+
+@with_tempdir
+def test_snapshot_large_index(tempdir):
+    index = build_large_index(20000)
+    path = os.path.join(tempdir, 'tracks.idx')
+    index.save(path)
+
+    loaded = TrackIndex.load(path)
+    for query in ['pop piano', 'jazz w1']:
+        assert loaded.search(query) == index.search(query)
+
+
+@with_tempdir
+@raises(ValueError)
+def test_load_not_an_index(tempdir):
+    path = os.path.join(tempdir, 'tracks.idx')
+    with open(path, 'wb') as index_file:
+        index_file.write('something else')
+    TrackIndex.load(path)
+
+
+def test_index_fetched_tracks():
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=5)
+    client = init_fake_client(catalog)
+
+    index = TrackIndex()
+    index.add_tracks(Track.query.get_tracks(catalog.tracks.keys(), client))
+
+    track = catalog.tracks.values()[0]
+    assert track['id'] in ids(index.search(track['name'], limit=None))
+    composer = track['composer'].split(', ')[0]
+    assert all(composer in catalog.tracks[track_id]['composer']
+               for track_id in ids(index.search(composer, prefix=False, limit=None)))
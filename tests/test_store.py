@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import datetime
+import mock
+import os
+
+from harvestmedia.api.store import FileStore, get_store_key
+
+from utils import build_http_mock, get_random_md5, init_client, init_fake_client, with_tempdir
+
+
+@with_tempdir
+def test_file_store_save_and_load(directory):
+    store = FileStore(os.path.join(directory, 'harvestmedia.json'))
+    store.save('key', token='abc', expiry='2030-01-01T00:00:00')
+    store.save('key', service_info={'trackformats': []})
+
+    stored = store.load('key')
+    assert stored['token'] == 'abc'
+    assert stored['service_info'] == {'trackformats': []}
+    assert store.load('missing') == {}
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+@with_tempdir
+def test_second_client_uses_store(HttpMock, directory):
+    store = FileStore(os.path.join(directory, 'harvestmedia.json'))
+    first = init_client(store=store)
+
+    http = build_http_mock(HttpMock, responses=[])
+    HttpMock.reset_mock()
+
+    second = init_client(store=store)
+
+    assert not http.request.called
+    assert second.config.service_token.token == first.config.service_token.token
+    assert second.config.waveform_url == first.config.waveform_url
+    assert second.config.get_format_identifier('mp3') == first.config.get_format_identifier('mp3')
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+@with_tempdir
+def test_refresh_adopts_stored_token(HttpMock, directory):
+    store = FileStore(os.path.join(directory, 'harvestmedia.json'))
+    client = init_client(store=store)
+    other = init_client(store=store)
+
+    # another process refreshed the token and saved it
+    new_token = get_random_md5()
+    expiry = datetime.datetime.now() + datetime.timedelta(hours=22)
+    store.save(client._store_key, token=new_token, expiry=expiry.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    client.config.service_token.expiry = (datetime.datetime.now() - datetime.timedelta(hours=12)).isoformat()
+
+    http = build_http_mock(HttpMock, content="""<ResponseLibraries><libraries /></ResponseLibraries>""")
+    client.get_xml('/getlibraries/{{service_token}}')
+
+    assert http.request.call_count == 1
+    assert new_token in http.request.call_args[0][0]
+    assert client.config.service_token.token == new_token
+
+
+@with_tempdir
+def test_lazy_service_info_takes_token_lock_first(directory):
+    store = FileStore(os.path.join(directory, 'harvestmedia.json'))
+    client = init_fake_client(store=store, lazy=True)
+
+    # a token refresh holds the token lock while it takes the store lock,
+    # so loading the service info must never take them the other way round
+    lock = store.lock
+    held = []
+
+    def checked_lock():
+        held.append(client._token_lock._is_owned())
+        return lock()
+
+    with mock.patch.object(store, 'lock', checked_lock):
+        assert client.config.waveform_url
+
+    assert held
+    assert all(held)
+
+
+def test_store_key():
+    assert get_store_key('a', 'http://one') != get_store_key('a', 'http://two')
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import os
+
+from harvestmedia.api.fakeserver import FakeCatalog, FakeHarvestMedia
+from harvestmedia.api.store import FileStore
+from harvestmedia.api.sync import CatalogSync
+
+from utils import init_fake_client, with_tempdir
+
+
+def build_sync(catalog, tempdir):
+    app = FakeHarvestMedia(catalog)
+    store = FileStore(os.path.join(tempdir, 'sync.json'))
+    return CatalogSync(init_fake_client(app=app), store), app
+
+
+def summarize(events):
+    return sorted((event.kind, event.track_id) for event in events)
+
+
+@with_tempdir
+def test_first_sync_adds_everything(tempdir):
+    catalog = FakeCatalog(libraries=2, albums_per_library=2, tracks_per_album=3)
+    catalog_sync, app = build_sync(catalog, tempdir)
+
+    events = catalog_sync.sync()
+    assert summarize(events) == sorted(('added', track_id) for track_id in catalog.tracks)
+    assert all(event.track.categories for event in events)
+
+    manifest, watermark = catalog_sync.load()
+    assert len(manifest) == 4
+    assert watermark == max(track['dateingested'] for track in catalog.tracks.values())
+
+
+@with_tempdir
+def test_unchanged_sync_fetches_nothing(tempdir):
+    catalog = FakeCatalog(libraries=1, albums_per_library=3, tracks_per_album=4)
+    catalog_sync, app = build_sync(catalog, tempdir)
+    catalog_sync.sync()
+    fetched = app.requests['gettracks']
+
+    assert catalog_sync.sync() == []
+    assert app.requests['gettracks'] == fetched
+
+
+@with_tempdir
+def test_sync_delta(tempdir):
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=4)
+    catalog_sync, app = build_sync(catalog, tempdir)
+    catalog_sync.sync()
+
+    first_album, second_album = sorted(catalog.album_tracks.keys())
+    removed_id = catalog.album_tracks[first_album].pop()
+    changed_id = catalog.album_tracks[first_album][0]
+    catalog.tracks[changed_id]['name'] = 'Renamed'
+    reingested_id = catalog.album_tracks[second_album][0]
+    catalog.tracks[reingested_id]['dateingested'] = '2030-01-01 00:00:00'
+
+    added = dict(catalog.tracks[changed_id], id='00000000000000aa')
+    catalog.tracks[added['id']] = added
+    catalog.album_tracks[second_album].append(added['id'])
+
+    events = catalog_sync.sync()
+    assert summarize(events) == sorted([('removed', removed_id), ('changed', changed_id),
+                                        ('changed', reingested_id), ('added', added['id'])])
+
+    changed = [event for event in events if event.track_id == changed_id][0]
+    assert changed.track.name == 'Renamed'
+    assert changed.album_id == first_album
+    assert catalog_sync.load()[1] == '2030-01-01 00:00:00'
+
+
+@with_tempdir
+def test_sync_moved_track_and_removed_album(tempdir):
+    catalog = FakeCatalog(libraries=1, albums_per_library=3, tracks_per_album=2)
+    catalog_sync, app = build_sync(catalog, tempdir)
+    catalog_sync.sync()
+
+    library_id = catalog.libraries[0]['id']
+    first, second, third = catalog.albums[library_id]
+    moved_id = catalog.album_tracks[first['id']].pop()
+    catalog.album_tracks[second['id']].append(moved_id)
+    catalog.albums[library_id].remove(third)
+
+    events = catalog_sync.sync()
+    assert summarize(events) == sorted([('changed', moved_id)] +
+                                       [('removed', track_id) for track_id in catalog.album_tracks[third['id']]])
+    assert [event.album_id for event in events if event.kind == 'changed'] == [second['id']]
+
+
+@with_tempdir
+def test_sync_tracks_not_returned_are_retried(tempdir):
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=3)
+    app = FakeHarvestMedia(catalog)
+    hidden = set()
+
+    def hiding_app(method, path, body):
+        if '/gettracks/' in path:
+            for track_id in hidden:
+                body = body.replace('<track>%s</track>' % track_id, '')
+        return app(method, path, body)
+
+    catalog_sync = CatalogSync(init_fake_client(app=hiding_app),
+                               FileStore(os.path.join(tempdir, 'sync.json')))
+
+    album_id, = catalog.album_tracks.keys()
+    changed_id, added_id, missing_id = catalog.album_tracks[album_id]
+    hidden.add(missing_id)
+    assert summarize(catalog_sync.sync()) == sorted([('added', changed_id), ('added', added_id)])
+    manifest, watermark = catalog_sync.load()
+    assert sorted(manifest[album_id]) == sorted([changed_id, added_id])
+
+    catalog.tracks[changed_id]['name'] = 'Renamed'
+    catalog.tracks[changed_id]['dateingested'] = '2030-01-01 00:00:00'
+    hidden.add(changed_id)
+    assert catalog_sync.sync() == []
+    assert catalog_sync.load() == (manifest, watermark)
+
+    hidden.clear()
+    assert summarize(catalog_sync.sync()) == [('added', missing_id), ('changed', changed_id)]
+    assert catalog_sync.load()[1] == '2030-01-01 00:00:00'
+
+
+@with_tempdir
+def test_dry_run(tempdir):
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=2)
+    catalog_sync, app = build_sync(catalog, tempdir)
+
+    assert len(catalog_sync.sync(dry_run=True)) == 2
+    assert len(catalog_sync.sync()) == 2
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import datetime
+from nose.plugins.skip import SkipTest
+
+try:
+    import numpy
+except ImportError:
+    raise SkipTest('numpy is not installed')
+
+from harvestmedia.api.fakeserver import FakeCatalog
+from harvestmedia.api.table import MISSING, TrackTable
+from harvestmedia.api.track import Track
+
+from utils import init_fake_client
+
+
+ROWS = [
+    {'id': '1', 'bpm': '120', 'lengthseconds': '170', 'genre': 'Pop / Rock', 'composer': 'Ann',
+     'dateingested': '2008-05-15 06:08:18'},
+    {'id': '2', 'bpm': '', 'lengthseconds': '90', 'genre': 'Jazz', 'composer': 'Bob',
+     'dateingested': '2010-01-01 00:00:00'},
+    {'id': '3', 'bpm': '95', 'lengthseconds': '240', 'genre': 'Jazz', 'composer': 'Ann',
+     'dateingested': ''},
+    {'id': '4', 'bpm': '140', 'lengthseconds': '200', 'genre': 'Pop / Rock',
+     'dateingested': '2009-06-01 12:00:00'},
+]
+
+
+def test_from_rows():
+    table = TrackTable.from_rows(ROWS)
+
+    assert len(table) == 4
+    assert table['bpm'].tolist() == [120, MISSING, 95, 140]
+    assert table['bpm'].dtype == numpy.int64
+    assert table.values['genre'] == ['Pop / Rock', 'Jazz']
+    assert table['genre'].tolist() == [0, 1, 1, 0]
+    assert table.decode('composer') == ['Ann', 'Bob', 'Ann', None]
+    assert numpy.isnat(table['dateingested'][2])
+    assert table['frequency'].tolist() == [MISSING] * 4
+
+
+def test_filter():
+    table = TrackTable.from_rows(ROWS)
+
+    assert table.filter(bpm=(100, None)).track_ids() == ['1', '4']
+    assert table.filter(bpm=(None, 130), genre='Pop / Rock').track_ids() == ['1']
+    assert table.filter(genre=['Jazz', 'Unknown']).track_ids() == ['2', '3']
+    assert table.filter(composer='Nobody').track_ids() == []
+    assert table.filter(dateingested=(datetime.datetime(2009, 1, 1), None)).track_ids() == ['2', '4']
+
+    mask = table.where(lengthseconds=(100, 220)) & (table['bpm'] > 125)
+    assert table.take(mask).track_ids() == ['4']
+
+
+def test_sort_by():
+    table = TrackTable.from_rows(ROWS)
+
+    assert table.sort_by('bpm').track_ids() == ['3', '1', '4', '2']
+    assert table.sort_by('bpm', descending=True).track_ids() == ['4', '1', '3', '2']
+    assert table.sort_by('genre').track_ids() == ['2', '3', '1', '4']
+    assert table.sort_by('composer', descending=True).track_ids() == ['2', '1', '3', '4']
+    assert table.sort_by('dateingested').track_ids() == ['1', '4', '2', '3']
+
+
+def test_group_by():
+    table = TrackTable.from_rows(ROWS)
+
+    assert table.group_by('genre').items() == [('Jazz', 2), ('Pop / Rock', 2)]
+    assert table.group_by('genre', 'lengthseconds', how='sum').items() == \
+            [('Jazz', 330.0), ('Pop / Rock', 370.0)]
+    assert table.group_by('genre', 'bpm', how='mean').items() == [('Jazz', 95.0), ('Pop / Rock', 130.0)]
+    assert table.group_by('composer', 'bpm', how='max').items() == [('Ann', 120)]
+    assert table.filter(genre='Jazz').group_by('genre').items() == [('Jazz', 2)]
+
+
+def test_from_tracks_matches_xml():
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=5)
+    client = init_fake_client(catalog)
+    track_ids = catalog.tracks.keys()
+
+    from_tracks = TrackTable.from_tracks(Track.query.get_tracks(track_ids, client))
+    from_xml = Track.query.get_track_table(track_ids + track_ids[:2], client, batch_size=3)
+
+    assert from_xml.track_ids() == track_ids
+    assert from_tracks.track_ids() == track_ids
+    for name in TrackTable.NUMERIC_COLUMNS + TrackTable.DATE_COLUMNS:
+        assert from_xml[name].tolist() == from_tracks[name].tolist()
+    for name in TrackTable.TEXT_COLUMNS:
+        assert from_xml.decode(name) == from_tracks.decode(name)
+
+    assert from_xml['bpm'].tolist() == [int(catalog.tracks[track_id]['bpm']) for track_id in track_ids]
@@ -8,9 +8,10 @@ import textwrap
 import xml.etree.cElementTree as ET
 
 import harvestmedia.api.exceptions
+from harvestmedia.api.fakeserver import FakeCatalog, FakeHarvestMedia
 from harvestmedia.api.track import Track
 
-from utils import build_http_mock, get_random_md5, init_client
+from utils import build_http_mock, get_random_md5, init_client, init_fake_client
 
 
 def test_track_dict():
@@ -27,6 +28,40 @@ def test_track_dict():
     assert track_dict['id'] == track_id
 
 
+def test_track_typed_fields():
+    client = init_client()
+    track_xml = ET.fromstring("""<track tracknumber="3" time="02:50" lengthseconds="170" name="Guerilla Pop"
+                                       id="17376d36f309f18d" bpm="" frequency="44100" bitrate="1411"
+                                       dateingested="2008-05-15 06:08:18" newattribute="new value"/>""")
+
+    track = Track._from_xml(track_xml, client)
+    assert track.tracknumber == 3
+    assert track.lengthseconds == 170
+    assert track.frequency == 44100
+    assert track.bitrate == 1411
+    assert track.bpm == ''
+    assert track.dateingested == datetime.datetime(2008, 5, 15, 6, 8, 18)
+    assert track.newattribute == 'new value'
+    assert track.composer is None
+    assert track.undefined is None
+    assert not hasattr(track, '__dict__')
+
+    track_dict = track.as_dict()
+    assert track_dict['tracknumber'] == '3'
+    assert track_dict['dateingested'] == '2008-05-15 06:08:18'
+    assert track_dict['newattribute'] == 'new value'
+    assert 'composer' not in track_dict
+
+
+def test_track_untyped_value():
+    client = init_client()
+    track_xml = ET.fromstring("""<track id="17376d36f309f18d" bpm="120-125"/>""")
+
+    track = Track._from_xml(track_xml, client)
+    assert track.bpm == '120-125'
+    assert track.as_dict()['bpm'] == '120-125'
+
+
 @mock.patch('harvestmedia.api.client.httplib2.Http')
 def test_tracks_get_by_id(HttpMock):
     client = init_client()
@@ -191,3 +226,212 @@ def test_get_download_url_missing_format(HttpMock):
     track = Track._from_xml(track_xml, client)
 
     download_url = track.get_download_url(track_format, member_id)
+
+
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_iter_tracks(HttpMock):
+    client = init_client()
+
+    content = """<responsetracks>
+                    <tracks>
+                        <track name="Guerilla Pop" albumid="1c5f47572d9152f3" id="17376d36f309f18d">
+                            <categories>
+                              <category name="Instrumentation" id="7907138b683424f4">
+                                <attributes>
+                                  <attribute name="Guitars" id="abf2d935cb4182b7" />
+                                </attributes>
+                              </category>
+                            </categories>
+                        </track>
+                        <track name="Hat And Feather" albumid="1c5f47572d9152f3" id="635f90a4db673855" />
+                    </tracks>
+                </responsetracks>"""
+
+    http = build_http_mock(HttpMock, content=content)
+
+    tracks = Track.query.iter_tracks(['17376d36f309f18d', '635f90a4db673855'], client)
+    first = next(tracks)
+    assert first.id == '17376d36f309f18d'
+    assert first.categories[0].attributes[0].name == 'Guitars'
+
+    assert [t.id for t in tracks] == ['635f90a4db673855']
+
+
+@raises(harvestmedia.api.exceptions.InvalidToken)
+@mock.patch('harvestmedia.api.client.httplib2.Http')
+def test_iter_tracks_error(HttpMock):
+    client = init_client()
+    content = """<responsetracks>
+                    <error>
+                        <code>5</code>
+                        <description>Invalid Token</description>
+                    </error>
+                </responsetracks>"""
+
+    http = build_http_mock(HttpMock, content=content)
+    list(Track.query.iter_tracks(['17376d36f309f18d'], client))
+
+
+def test_lazy_track():
+    client = init_client()
+    client.lazy_models = True
+    track_xml = ET.fromstring("""<track id="17376d36f309f18d" name="Guerilla Pop" bpm="100"
+                                        dateingested="2008-05-15 06:08:18" newattribute="new value">
+                                   <categories>
+                                     <category name="Instrumentation" id="1a2b3c4d5e6f7a8b">
+                                       <attributes><attribute name="Piano" id="da2362b0e30b131f" /></attributes>
+                                     </category>
+                                   </categories>
+                                 </track>""")
+
+    track = Track._from_xml(track_xml, client)
+    assert track._xml_data is track_xml
+
+    assert track.name == 'Guerilla Pop'
+    assert track.bpm == 100
+    assert track.newattribute == 'new value'
+    assert track.composer is None
+    assert track.categories[0].name == 'Instrumentation'
+    assert track.categories[0].attributes[0].name == 'Piano'
+
+    track_dict = track.as_dict()
+    assert track._xml_data is None
+    assert track_dict['dateingested'] == '2008-05-15 06:08:18'
+    assert track_dict['bpm'] == '100'
+
+
+def test_lazy_track_set_attribute():
+    client = init_client()
+    client.lazy_models = True
+    track = Track._from_xml(ET.fromstring('<track id="17376d36f309f18d" name="Guerilla Pop"/>'), client)
+
+    track.name = 'Renamed'
+    assert track.as_dict()['name'] == 'Renamed'
+
+
+def test_get_tracks_batched():
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=10)
+    app = FakeHarvestMedia(catalog)
+    client = init_fake_client(app=app)
+
+    track_ids = list(reversed(sorted(catalog.tracks.keys())))
+    track_ids += track_ids[:5]
+
+    tracks = Track.query.get_tracks(track_ids, client, batch_size=3, max_workers=4)
+
+    assert [track.id for track in tracks] == track_ids[:20]
+    assert app.requests['gettracks'] == 7
+
+
+def test_get_tracks_drops_repeated_and_unrequested():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=6)
+    app = FakeHarvestMedia(catalog)
+    all_ids = sorted(catalog.tracks.keys())
+    track_ids, unrequested_id = all_ids[:-1], all_ids[-1]
+
+    def noisy_app(method, path, body):
+        # each batch comes back with its first track twice, and a track
+        # nobody asked for
+        if '/gettracks/' in path:
+            request = ET.fromstring(body)
+            ET.SubElement(request, 'track').text = request.find('track').text
+            ET.SubElement(request, 'track').text = unrequested_id
+            body = ET.tostring(request)
+        return app(method, path, body)
+
+    client = init_fake_client(app=noisy_app)
+    tracks = Track.query.get_tracks(track_ids, client, batch_size=2)
+
+    assert [track.id for track in tracks] == track_ids
+
+
+@mock.patch('harvestmedia.api.track.TrackQuery.batch_retry_policy')
+def test_get_tracks_failed_batch_retried(retry_policy):
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=6)
+    app = FakeHarvestMedia(catalog)
+    track_ids = sorted(catalog.tracks.keys())
+    failures = []
+
+    def flaky_app(method, path, body):
+        # the batch holding the last track fails the first time it is sent
+        if '/gettracks/' in path and track_ids[-1] in body and not failures:
+            failures.append(body)
+            return 503, ''
+        return app(method, path, body)
+
+    client = init_fake_client(app=flaky_app)
+    tracks = Track.query.get_tracks(track_ids, client, batch_size=2)
+
+    assert [track.id for track in tracks] == track_ids
+    assert len(failures) == 1
+    # three batches, and the failed one again
+    assert app.requests['gettracks'] == 3
+    # after the default backoff, as the client has no retry policy
+    retry_policy.sleep.assert_called_once_with(0)
+
+
+@mock.patch('harvestmedia.api.track.TrackQuery.batch_retry_policy')
+@raises(harvestmedia.api.exceptions.InvalidAPIResponse)
+def test_get_tracks_batch_retries_exhausted(retry_policy):
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=4)
+    app = FakeHarvestMedia(catalog)
+
+    def failing_app(method, path, body):
+        if '/gettracks/' in path:
+            return 503, ''
+        return app(method, path, body)
+
+    client = init_fake_client(app=failing_app)
+    Track.query.get_tracks(sorted(catalog.tracks.keys()), client, batch_size=2)
+
+
+def test_get_tracks_client_error_not_retried():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=2)
+    app = FakeHarvestMedia(catalog)
+    requests = []
+
+    def rejecting_app(method, path, body):
+        if '/gettracks/' in path:
+            requests.append(body)
+            return 400, ''
+        return app(method, path, body)
+
+    client = init_fake_client(app=rejecting_app)
+    try:
+        Track.query.get_tracks(sorted(catalog.tracks.keys()), client)
+    except harvestmedia.api.exceptions.InvalidAPIResponse, e:
+        assert e.code == 400
+    else:
+        assert False, 'expected InvalidAPIResponse'
+
+    assert len(requests) == 1
+
+
+def test_get_tracks_for_albums():
+    catalog = FakeCatalog(libraries=1, albums_per_library=6, tracks_per_album=5)
+    app = FakeHarvestMedia(catalog)
+    client = init_fake_client(app=app)
+
+    album_ids = [album['id'] for album in catalog.albums[catalog.libraries[0]['id']]]
+    album_tracks = Track.query.get_tracks_for_albums(album_ids, client, batch_size=100)
+
+    assert album_tracks.keys() == album_ids
+    for album_id, tracks in album_tracks.items():
+        assert [track.id for track in tracks] == catalog.album_tracks[album_id]
+        assert tracks[0].categories
+
+    # one track list per album, then all 30 tracks in a single batch
+    assert app.requests['getalbumtracks'] == 6
+    assert app.requests['gettracks'] == 1
+
+
+def test_get_tracks_for_albums_summary():
+    catalog = FakeCatalog(libraries=1, albums_per_library=2, tracks_per_album=3)
+    app = FakeHarvestMedia(catalog)
+    client = init_fake_client(app=app)
+
+    album_ids = [album['id'] for album in catalog.albums[catalog.libraries[0]['id']]]
+    album_tracks = Track.query.get_tracks_for_albums(album_ids, client, get_full_detail=False)
+
+    assert [len(tracks) for tracks in album_tracks.values()] == [3, 3]
+    assert 'gettracks' not in app.requests
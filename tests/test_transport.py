@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from nose.tools import raises
+
+import harvestmedia.api.exceptions
+from harvestmedia.api.fakeserver import FakeCatalog, FakeHarvestMedia, FakeServer
+from harvestmedia.api.library import Library
+from harvestmedia.api.member import Member
+from harvestmedia.api.track import Track
+from harvestmedia.api.transport import Httplib2Transport, MemoryTransport, PooledTransport
+
+from utils import init_fake_client
+
+
+def test_memory_transport():
+    catalog = FakeCatalog(libraries=2, albums_per_library=2, tracks_per_album=3)
+    transport = MemoryTransport(FakeHarvestMedia(catalog))
+    client = init_fake_client(transport=transport)
+
+    libraries = Library.query.get_libraries(client)
+    assert [library.id for library in libraries] == [library['id'] for library in catalog.libraries]
+
+    albums = libraries[0].get_albums()
+    assert len(albums) == 2
+
+    tracks = albums[0].get_tracks()
+    assert [track.id for track in tracks] == catalog.album_tracks[albums[0].id]
+
+    # service token, service info, libraries, albums, album tracks, full detail
+    assert transport.requests == 6
+
+
+def test_memory_transport_full_detail():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=2)
+    client = init_fake_client(catalog)
+
+    track_ids = sorted(catalog.tracks.keys())
+    tracks = Track.query.get_tracks(track_ids, client)
+    assert sorted(track.id for track in tracks) == track_ids
+    assert len(tracks[0].categories) == 2
+
+
+@raises(harvestmedia.api.exceptions.InvalidLoginDetails)
+def test_fake_member_login_failure():
+    client = init_fake_client()
+    Member.authenticate('nobody', 'wrong', client)
+
+
+def test_fake_invalid_token():
+    app = FakeHarvestMedia()
+    status, content = app('GET', '/HMP-WS.svc/getlibraries/not-a-token', None)
+    assert status == 200
+    assert '<code>5</code>' in content
+
+
+def test_pooled_transport():
+    with FakeServer(FakeHarvestMedia(FakeCatalog(libraries=3))) as server:
+        transport = PooledTransport(max_size=2)
+        client = init_fake_client(webservice_url=server.url, transport=transport)
+
+        for i in range(3):
+            libraries = Library.query.get_libraries(client)
+            assert len(libraries) == 3
+
+        pool = transport.pools.values()[0]
+        assert pool.misses == 1
+        assert pool.hits == 4
+
+        client.close()
+
+
+def test_httplib2_transport():
+    with FakeServer() as server:
+        client = init_fake_client(webservice_url=server.url, transport=Httplib2Transport(max_size=2))
+
+        libraries = Library.query.get_libraries(client)
+        assert len(libraries) == 2
+        assert server.app.requests['getlibraries'] == 1
+
+        client.close()
+
+
+def test_lazy_models_streamed():
+    catalog = FakeCatalog(libraries=1, albums_per_library=1, tracks_per_album=3)
+    client = init_fake_client(catalog, lazy_models=True)
+
+    track_ids = sorted(catalog.tracks.keys())
+    tracks = list(Track.query.iter_tracks(track_ids, client))
+
+    # the elements were detached, not cleared, so the tracks still read them
+    assert [track.name for track in tracks] == [catalog.tracks[track_id]['name'] for track_id in track_ids]
+    assert len(tracks[0].categories) == 2
@@ -1,9 +1,17 @@
 import datetime
+import functools
 import hashlib
 import mock
 import random
+import shutil
+import tempfile
 
 from harvestmedia.api.client import Client
+from harvestmedia.api.fakeserver import FakeHarvestMedia
+from harvestmedia.api.transport import MemoryTransport
+
+
+FAKE_WEBSERVICE_URL = 'https://fake.example.com/HMP-WS.svc'
 
 
 def get_random_md5():
@@ -50,7 +58,7 @@ def build_http_mock(http_mock, response_status=200, response=None, content=None,
 
 
 @mock.patch('harvestmedia.api.client.httplib2.Http')
-def init_client(HttpMock):
+def init_client(HttpMock, client_class=Client, **client_kwargs):
     expiry = datetime.datetime.now()
     expiry += datetime.timedelta(hours=22)  # offset for HM timezone
     test_token = get_random_md5()
@@ -79,6 +87,42 @@ def init_client(HttpMock):
     ]
 
     http = build_http_mock(HttpMock, responses=return_values)
-    api_key = '1234567'
-    client = Client(api_key=api_key, debug_level='DEBUG')
+    api_key = client_kwargs.pop('api_key', '1234567')
+    client = client_class(api_key=api_key, debug_level='DEBUG', **client_kwargs)
+
+    # drop the pooled Http mock so the next request picks up
+    # whichever mock the calling test has patched in
+    client.pool.clear()
     return client
+
+
+def init_fake_client(catalog=None, app=None, **client_kwargs):
+    """Create a client whose requests are answered in-process by `app`,
+    by default a FakeHarvestMedia serving `catalog`
+
+    """
+
+    if app is None:
+        app = FakeHarvestMedia(catalog)
+
+    client_kwargs.setdefault('api_key', 'any-key')
+    client_kwargs.setdefault('webservice_url', FAKE_WEBSERVICE_URL)
+    client_kwargs.setdefault('transport', MemoryTransport(app))
+    return Client(**client_kwargs)
+
+
+def with_tempdir(test):
+    """Run a test with a fresh temporary directory, passed as its last
+    argument, that is removed afterwards
+
+    """
+
+    @functools.wraps(test)
+    def wrapper(*args):
+        directory = tempfile.mkdtemp()
+        try:
+            return test(*(args + (directory,)))
+        finally:
+            shutil.rmtree(directory)
+
+    return wrapper